@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio-based pipeline orchestrator for the XML measurement data pipeline.
+Overlaps file reads with CPU-bound validation and extraction, which pays
+off on storage with a high per-open latency such as network mounts.
+
+File contents are read concurrently in threads, validation and extraction
+run in an executor, and all results are persisted by a single task. The
+per-file stages, persistence, provenance, and run bookkeeping are those
+of Pipeline.
+
+License: MIT
+"""
+
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from pipeline import Pipeline
+from provenance import get_provenance_logger
+from worker import init_worker, process_bytes, validate_and_extract
+
+
+def _read_file(xml_path):
+    """Read the complete content of a file."""
+    with open(xml_path, "rb") as f:
+        return f.read()
+
+
+class AsyncPipeline(Pipeline):
+    """
+    Pipeline variant that processes files with asyncio.
+
+    Accepts all Pipeline arguments. With workers=1, validation and
+    extraction run in a single background thread, because compiled lxml
+    schemas must not be used by several threads at once; with workers=N
+    they run in a process pool as in Pipeline. read_concurrency bounds the
+    number of files being read or processed at the same time.
+    """
+
+    def __init__(self, *args, read_concurrency=64, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.read_concurrency = max(1, int(read_concurrency))
+
+    def run(self, file_list=None):
+        """
+        Process all XML files, see Pipeline.run.
+
+        Must not be called from a running event loop; use run_async() there.
+        """
+        return asyncio.run(self.run_async(file_list))
+
+    async def run_async(self, file_list=None):
+        """
+        Coroutine form of run().
+
+        Returns:
+            Same dict as Pipeline.run.
+        """
+        xml_files = self._resolve_files(file_list)
+        counts = None
+
+        try:
+            counts = self._start_run()
+            return await self._run_files(xml_files, counts)
+        finally:
+            self._abort_run(counts)
+
+    async def _run_files(self, xml_files, counts):
+        """Process the files of a started run and finish it."""
+        work_items = iter(self._work_items(xml_files, counts))
+
+        # Metadata is persisted on this one thread; provenance records are
+        # written by the shared logger on whichever thread triggers a flush
+        persist_executor = ThreadPoolExecutor(max_workers=1)
+
+        if self.workers > 1:
+            cpu_executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=init_worker,
+                initargs=self._worker_initargs()
+            )
+        else:
+            cpu_executor = ThreadPoolExecutor(max_workers=1)
+
+        results = asyncio.Queue(maxsize=self.queue_size)
+        slots = asyncio.Semaphore(self.read_concurrency)
+        tasks = set()
+        errors = []
+
+        def task_done(task):
+            tasks.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                errors.append(task.exception())
+
+        def persister_done(task):
+            if not task.cancelled() and task.exception() is not None:
+                errors.append(task.exception())
+
+                # Nothing drains the result queue anymore; release the
+                # tasks blocked on it and their slots
+                for pending in list(tasks):
+                    pending.cancel()
+
+        persister = asyncio.create_task(self._persist_results(results, counts, persist_executor))
+        persister.add_done_callback(persister_done)
+        end = None
+
+        try:
+            while not errors:
+                # Enumeration and ingest index checks may block, keep them off the loop
+                item = await asyncio.to_thread(next, work_items, None)
+                if item is None:
+                    break
+
+                await slots.acquire()
+                if errors:
+                    slots.release()
+                    break
+
+                task = asyncio.create_task(self._process(item, cpu_executor, results, slots))
+                tasks.add(task)
+                task.add_done_callback(task_done)
+
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+            # The end marker may never fit into the queue if the persister failed
+            end = asyncio.create_task(results.put(None))
+            await asyncio.wait({persister, end}, return_when=asyncio.FIRST_EXCEPTION)
+
+        finally:
+            for task in (persister, end):
+                if task is not None and not task.done():
+                    task.cancel()
+
+            cpu_executor.shutdown(wait=True)
+            persist_executor.shutdown(wait=True)
+
+        if errors:
+            raise errors[0]
+
+        return self._finish_run(counts)
+
+    async def _process(self, item, cpu_executor, results, slots):
+        """Read, validate, and extract one file, then queue it for persistence."""
+        loop = asyncio.get_running_loop()
+        filename, fingerprint = item
+        xml_path = os.path.join(self.xml_dir, filename)
+
+        try:
+            try:
+                xml_bytes = await asyncio.to_thread(_read_file, xml_path)
+            except OSError:
+                # Let validation report the unreadable file as usual
+                xml_bytes = None
+
+            if self.workers > 1:
+                outcome = await loop.run_in_executor(cpu_executor, process_bytes, xml_path, xml_bytes)
+                get_provenance_logger().log_records(outcome.pop("provenance"))
+            else:
+                outcome = await loop.run_in_executor(
+                    cpu_executor, validate_and_extract,
+                    self.validator, self.extractor, xml_path, xml_bytes, self._file_memory()
+                )
+
+            outcome["fingerprint"] = fingerprint
+            await results.put((filename, outcome))
+
+        finally:
+            slots.release()
+
+    async def _persist_results(self, results, counts, executor):
+        """
+        Single persistence task.
+
+        Drains all results that are ready and persists them with one hop to
+        the persistence thread, until the end marker None arrives.
+        """
+        loop = asyncio.get_running_loop()
+        finished = False
+
+        while not finished:
+            batch = [await results.get()]
+            while not results.empty():
+                batch.append(results.get_nowait())
+
+            if batch[-1] is None:
+                batch.pop()
+                finished = True
+
+            if batch:
+                settled = await loop.run_in_executor(executor, self._persist_all, batch)
+                for entry in settled:
+                    self._settle(counts, entry)
+
+    def _persist_all(self, batch):
+        """Persist a list of (filename, outcome) pairs in order."""
+        return [self._persist(filename, outcome) for filename, outcome in batch]
+
+
+if __name__ == "__main__":
+    pipeline = AsyncPipeline()
+    result = pipeline.run()
+    print(f"\nResult: {result['successful']}/{result['total']} successfully processed")
+    print(f"Peak Memory: {result['peak_memory_mb']:.2f}MB")
@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark matrix runner for the XML measurement data pipeline.
+
+Runs the pipeline over every combination of the configured dimensions:
+- batch sizes (number of files per run)
+- worker counts
+- document sizes (sensor readings per file)
+- database settings (performance profile and insert batch size)
+- storage backends (SQLite, DB-API over the sqlite3 driver, segment log)
+- warm or cold page cache
+
+Each measured run becomes one JSON record; the result file also holds
+environment metadata (CPU, Python, lxml, SQLite, git commit), so results
+of different releases and machines can be compared later. A flat CSV
+with the same records can be written alongside.
+
+Usage:
+    python benchmark.py --batch-sizes 100 1000 --workers 1 4 \\
+        --doc-sizes small large --db-profiles default balanced \\
+        --storages sqlite segment_log --cache warm cold --runs 5
+
+License: MIT
+"""
+
+import argparse
+import csv
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import time
+from datetime import datetime
+from itertools import product
+
+import psutil
+from lxml import etree
+
+from db_init import PERFORMANCE_PROFILES
+from experiment_runner import prepare_batch, reset_database
+from memory import MEMORY_MODES
+from pipeline import Pipeline
+from profiler import StageProfiler
+from provenance import close_provenance
+from storage import DBAPIBackend, SegmentLogBackend
+from xml_generator import generate_dataset
+
+
+RESULT_FORMAT = "pipeline-benchmark"
+RESULT_FORMAT_VERSION = 1
+
+DB_PATH = "../db/benchmark.db"
+POOL_DIR = "../xml_bench/"
+WORKDIR = "../xml_experiment/"
+RESULTS_FILE = "../results/benchmark.json"
+LOG_DIR = "../db/benchmark_log/"
+
+# Storage backends, see storage.py; the DB-API backend uses the sqlite3
+# driver on DB_PATH, so it runs without a database server
+STORAGES = ("sqlite", "dbapi", "segment_log")
+
+# Sensor readings per document; None keeps the generator's 2 to 5
+DOC_SIZES = {
+    "small": None,
+    "medium": 500,
+    "large": 20000
+}
+
+CSV_FIELDS = [
+    "doc_size",
+    "batch_size",
+    "workers",
+    "db_profile",
+    "insert_batch_size",
+    "storage",
+    "cache",
+    "run_id",
+    "runtime_ms",
+    "throughput_files_s",
+    "throughput_mb_s",
+    "successful",
+    "failed",
+    "memory_peak_mb",
+    "cache_dropped",
+    "git_commit",
+    "python_version",
+    "lxml_version"
+]
+
+
+def _git(*args):
+    """Run a git command in the repository of this file, or return None."""
+    try:
+        result = subprocess.run(
+            ["git", *args],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            timeout=10
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def _cpu_model():
+    """CPU model name from /proc/cpuinfo, or the platform's processor string."""
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+
+    return platform.processor() or None
+
+
+def environment_metadata():
+    """
+    Describe the machine and software versions a benchmark runs on.
+
+    Returns:
+        Dict with timestamp, host, platform, CPU, memory, Python, lxml,
+        libxml2, SQLite, and git information.
+    """
+    status = _git("status", "--porcelain")
+
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "hostname": platform.node(),
+        "platform": platform.platform(),
+        "cpu_model": _cpu_model(),
+        "cpu_count": os.cpu_count(),
+        "memory_total_mb": psutil.virtual_memory().total / (1024 * 1024),
+        "python_version": platform.python_version(),
+        "python_implementation": platform.python_implementation(),
+        "lxml_version": ".".join(str(v) for v in etree.LXML_VERSION),
+        "libxml2_version": ".".join(str(v) for v in etree.LIBXML_VERSION),
+        "sqlite_version": sqlite3.sqlite_version,
+        "git_commit": _git("rev-parse", "HEAD"),
+        "git_describe": _git("describe", "--tags", "--always"),
+        "git_dirty": bool(status) if status is not None else None
+    }
+
+
+def prepare_pool(doc_size, pool_size):
+    """
+    Return a directory with at least pool_size files of the given size.
+
+    Pools are generated once under POOL_DIR and reused by later runs.
+    """
+    if doc_size not in DOC_SIZES:
+        raise ValueError(f"Unknown document size: {doc_size}")
+
+    pool = os.path.join(POOL_DIR, doc_size)
+    existing = 0
+    if os.path.isdir(pool):
+        existing = sum(1 for name in os.listdir(pool) if name.endswith(".xml"))
+
+    if existing < pool_size:
+        generate_dataset(pool_size, output_dir=pool, num_sensors=DOC_SIZES[doc_size])
+
+    return pool
+
+
+def drop_file_cache(paths):
+    """
+    Evict files from the page cache with posix_fadvise(DONTNEED).
+
+    Dirty pages cannot be evicted, so every file is synced first.
+
+    Returns:
+        True if the platform supports evicting files, else False.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return False
+
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+    return True
+
+
+def make_storage(name):
+    """Create the storage backend of a configuration; None for the default SQLite storage."""
+    if name == "sqlite":
+        return None
+    if name == "dbapi":
+        return DBAPIBackend(sqlite3, (DB_PATH,), {"check_same_thread": False})
+    if name == "segment_log":
+        return SegmentLogBackend(LOG_DIR)
+
+    raise ValueError(f"Unknown storage backend: {name}")
+
+
+def reset_storage(storage, db_profile):
+    """Reset the database, and the segment log of a log backend."""
+    # Pending provenance goes to the old storage, whose connections and
+    # files are released before they are removed
+    close_provenance()
+    if storage is not None:
+        storage.close()
+
+    if isinstance(storage, SegmentLogBackend):
+        shutil.rmtree(LOG_DIR, ignore_errors=True)
+        os.makedirs(LOG_DIR)
+
+    reset_database(DB_PATH, db_profile)
+
+
+def run_configuration(config, runs, memory_mode="psutil", profile_stages=False, pool_size=200):
+    """
+    Measure one point of the benchmark matrix.
+
+    A warm-up run precedes the measured runs. With a cold cache, the batch
+    files are evicted from the page cache before every measured run.
+
+    Args:
+        config: Dict with doc_size, batch_size, workers, db_profile,
+                insert_batch_size, storage (default 'sqlite'), and cache
+                ('warm' or 'cold').
+        runs: Number of measured runs.
+        memory_mode: Memory accounting mode, see memory.MEMORY_MODES.
+        profile_stages: Add per-stage latency percentiles to each record.
+        pool_size: Number of distinct files per document size.
+
+    Returns:
+        List of result records, one per measured run.
+    """
+    pool = prepare_pool(config["doc_size"], pool_size)
+    file_list = prepare_batch(config["batch_size"], source=pool, workdir=WORKDIR)
+    paths = [os.path.join(WORKDIR, filename) for filename in file_list]
+    input_mb = sum(os.path.getsize(path) for path in paths) / (1024 * 1024)
+
+    db_profile = None if config["db_profile"] == "default" else config["db_profile"]
+    profiler = StageProfiler() if profile_stages else None
+    storage = make_storage(config.get("storage", "sqlite"))
+
+    pipeline = Pipeline(
+        xml_dir=WORKDIR,
+        db_path=DB_PATH,
+        workers=config["workers"],
+        insert_batch_size=config["insert_batch_size"] or None,
+        db_profile=db_profile,
+        storage=storage,
+        memory_mode=memory_mode,
+        profiler=profiler
+    )
+
+    reset_storage(storage, db_profile)
+    pipeline.run(file_list)  # warm-up
+
+    records = []
+
+    for run_id in range(1, runs + 1):
+        reset_storage(storage, db_profile)
+
+        cache_dropped = False
+        if config["cache"] == "cold":
+            cache_dropped = drop_file_cache(paths)
+
+        if profiler is not None:
+            profiler.reset()
+
+        start = time.perf_counter()
+        result = pipeline.run(file_list)
+        runtime = time.perf_counter() - start
+
+        record = dict(config)
+        record.update({
+            "run_id": run_id,
+            "runtime_ms": runtime * 1000,
+            "throughput_files_s": result["successful"] / runtime if runtime > 0 else 0,
+            "throughput_mb_s": input_mb / runtime if runtime > 0 else 0,
+            "successful": result["successful"],
+            "failed": result["failed"],
+            "memory_peak_mb": result["peak_memory_mb"],
+            "input_mb": input_mb,
+            "cache_dropped": cache_dropped
+        })
+
+        if profiler is not None:
+            record["stage_latency_ms"] = result["stage_latency_ms"]
+        if "memory" in result:
+            record["memory"] = result["memory"]
+
+        records.append(record)
+
+        print(
+            f"    Run {run_id}/{runs}: {runtime * 1000:.2f}ms "
+            f"({record['throughput_files_s']:.2f} files/s)"
+        )
+
+    if storage is not None:
+        storage.close()
+
+    return records
+
+
+def run_matrix(batch_sizes, workers, doc_sizes, db_profiles, insert_batch_sizes, caches,
+               runs=5, memory_mode="psutil", profile_stages=False, pool_size=200, storages=("sqlite",)):
+    """
+    Run every combination of the given dimensions.
+
+    Returns:
+        Dict in the result format: 'format', 'format_version',
+        'environment', 'matrix', and 'records'.
+    """
+    matrix = {
+        "batch_sizes": list(batch_sizes),
+        "workers": list(workers),
+        "doc_sizes": list(doc_sizes),
+        "db_profiles": list(db_profiles),
+        "insert_batch_sizes": list(insert_batch_sizes),
+        "storages": list(storages),
+        "caches": list(caches),
+        "runs": runs,
+        "memory_mode": memory_mode,
+        "pool_size": pool_size
+    }
+
+    combinations = list(product(
+        doc_sizes, db_profiles, insert_batch_sizes, storages, workers, batch_sizes, caches
+    ))
+    records = []
+
+    for index, combination in enumerate(combinations, start=1):
+        config = dict(zip(
+            ("doc_size", "db_profile", "insert_batch_size", "storage", "workers", "batch_size", "cache"),
+            combination
+        ))
+
+        print(
+            f"[{index}/{len(combinations)}] doc_size={config['doc_size']} "
+            f"db_profile={config['db_profile']} insert_batch_size={config['insert_batch_size']} "
+            f"storage={config['storage']} "
+            f"workers={config['workers']} batch_size={config['batch_size']} cache={config['cache']}"
+        )
+
+        records.extend(run_configuration(config, runs, memory_mode, profile_stages, pool_size))
+
+    return {
+        "format": RESULT_FORMAT,
+        "format_version": RESULT_FORMAT_VERSION,
+        "environment": environment_metadata(),
+        "matrix": matrix,
+        "records": records
+    }
+
+
+def save_json(results, path):
+    """Write benchmark results as JSON."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+
+def save_csv(results, path):
+    """Write benchmark records as a flat CSV with one row per run."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    environment = results["environment"]
+
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+
+        for record in results["records"]:
+            row = dict(record)
+            row["git_commit"] = environment["git_commit"]
+            row["python_version"] = environment["python_version"]
+            row["lxml_version"] = environment["lxml_version"]
+            writer.writerow(row)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a benchmark matrix of the XML pipeline.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[100, 200, 500, 1000],
+                        help="files per run")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1],
+                        help="worker process counts")
+    parser.add_argument("--doc-sizes", nargs="+", default=["small"], choices=sorted(DOC_SIZES),
+                        help="document sizes (sensor readings per file)")
+    parser.add_argument("--db-profiles", nargs="+", default=["default"],
+                        choices=sorted(PERFORMANCE_PROFILES), help="SQLite performance profiles")
+    parser.add_argument("--insert-batch-sizes", type=int, nargs="+", default=[0],
+                        help="metadata insert batch sizes; 0 commits every file")
+    parser.add_argument("--storages", nargs="+", default=["sqlite"], choices=STORAGES,
+                        help="storage backends of metadata and provenance")
+    parser.add_argument("--cache", nargs="+", default=["warm"], choices=["warm", "cold"],
+                        help="page cache state before each measured run")
+    parser.add_argument("--runs", type=int, default=5, help="measured runs per configuration")
+    parser.add_argument("--memory-mode", default="psutil", choices=MEMORY_MODES,
+                        help="memory accounting mode")
+    parser.add_argument("--profile-stages", action="store_true",
+                        help="record per-stage latency percentiles")
+    parser.add_argument("--pool-size", type=int, default=200,
+                        help="distinct generated files per document size")
+    parser.add_argument("--output", default=RESULTS_FILE, help="JSON result file")
+    parser.add_argument("--csv", help="optional flat CSV result file")
+    args = parser.parse_args(argv)
+
+    results = run_matrix(
+        batch_sizes=args.batch_sizes,
+        workers=args.workers,
+        doc_sizes=args.doc_sizes,
+        db_profiles=args.db_profiles,
+        insert_batch_sizes=args.insert_batch_sizes,
+        caches=args.cache,
+        storages=args.storages,
+        runs=args.runs,
+        memory_mode=args.memory_mode,
+        profile_stages=args.profile_stages,
+        pool_size=args.pool_size
+    )
+
+    save_json(results, args.output)
+    print(f"\nResults saved to: {args.output}")
+
+    if args.csv:
+        save_csv(results, args.csv)
+        print(f"CSV saved to: {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
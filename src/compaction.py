@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Provenance compaction for the XML measurement data pipeline.
+
+Rolls provenance records older than a cutoff into per-run summaries and
+deletes them, so that long-running deployments keep a bounded amount of
+detailed provenance. Detailed and compact records (see provenance.py)
+are both rolled up through provenance_view.
+
+provenance_summaries holds one row per run, day, step, status, XSD
+schema, schema version, and pipeline version (run_id 0 for records
+written outside of a Pipeline run) with the number of records and the
+sum, sum of squares, and maximum of every stage timing, so that means
+and standard deviations stay available. Compacting the same run and day
+again adds to the existing summaries.
+
+Usage:
+    python compaction.py --older-than-days 30 [--vacuum]
+
+License: MIT
+"""
+
+import argparse
+from datetime import datetime, timedelta
+
+from db_init import PERFORMANCE_PROFILES, connect
+
+
+DB_PATH = "../db/pipeline.db"
+OLDER_THAN_DAYS = 30
+
+# Summary column prefix and source column of every rolled up timing
+TIMINGS = (
+    ("processing_time", "processing_time_ms"),
+    ("validation_time", "validation_time_ms"),
+    ("extraction_time", "extraction_time_ms"),
+    ("persistence_time", "persistence_time_ms")
+)
+
+_GROUP_COLUMNS = ("run_id", "day", "step", "status", "xsd_schema", "schema_version", "pipeline_version")
+
+
+def _summarize_sql():
+    """Build the upsert rolling provenance_view records into provenance_summaries."""
+    columns = list(_GROUP_COLUMNS) + ["record_count", "timed_count"]
+    values = [
+        "coalesce(run_id, 0)",
+        "date(timestamp)",
+        "step",
+        "status",
+        "coalesce(xsd_schema, '')",
+        "coalesce(schema_version, '')",
+        "coalesce(pipeline_version, '')",
+        "count(*)",
+        "count(processing_time_ms)"
+    ]
+    updates = [
+        "record_count = record_count + excluded.record_count",
+        "timed_count = timed_count + excluded.timed_count"
+    ]
+
+    def add(column, value, update):
+        columns.append(column)
+        values.append(value)
+        updates.append(f"{column} = {update}")
+
+    def add_sum(column, value):
+        add(column, value, f"coalesce({column}, 0) + coalesce(excluded.{column}, 0)")
+
+    def add_max(column, value):
+        add(column, value, f"max(coalesce({column}, excluded.{column}), coalesce(excluded.{column}, {column}))")
+
+    for prefix, source in TIMINGS:
+        add_sum(f"{prefix}_sum", f"sum({source})")
+        add_sum(f"{prefix}_sq_sum", f"sum({source} * {source})")
+        add_max(f"{prefix}_max", f"max({source})")
+
+    add_max("memory_peak_max", "max(memory_peak_mb)")
+    add("first_timestamp", "min(timestamp)", "min(first_timestamp, excluded.first_timestamp)")
+    add("last_timestamp", "max(timestamp)", "max(last_timestamp, excluded.last_timestamp)")
+
+    return f"""
+        INSERT INTO provenance_summaries ({", ".join(columns)})
+        SELECT {", ".join(values)}
+        FROM provenance_view
+        WHERE timestamp < ?
+        GROUP BY 1, 2, 3, 4, 5, 6, 7
+        ON CONFLICT ({", ".join(_GROUP_COLUMNS)}) DO UPDATE SET
+            {", ".join(updates)}
+    """
+
+
+SUMMARIZE_SQL = _summarize_sql()
+
+
+def compact_provenance(db_path=DB_PATH, older_than_days=OLDER_THAN_DAYS, vacuum=False, profile=None):
+    """
+    Roll provenance records older than a cutoff into per-run summaries.
+
+    Summarizing and deleting happen in one transaction.
+
+    Args:
+        db_path: Path of the SQLite database.
+        older_than_days: Records older than this many days are compacted.
+        vacuum: Run VACUUM afterwards to return the freed pages to the
+                file system.
+        profile: Performance profile, see db_init.resolve_profile.
+
+    Returns:
+        Dict with the cutoff, the number of summary rows written
+        ('summaries'), and the numbers of deleted detailed records
+        ('records') and compact file records ('files').
+    """
+    # Whole seconds compare alike as ISO text and as epoch milliseconds
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).replace(microsecond=0)
+    cutoff_iso = cutoff.isoformat()
+    cutoff_ms = int(cutoff.timestamp() * 1000)
+
+    conn = connect(db_path, profile)
+
+    try:
+        with conn:
+            summaries = conn.execute(SUMMARIZE_SQL, (cutoff_iso,)).rowcount
+
+            conn.execute(
+                "DELETE FROM validation_errors WHERE provenance_id IN "
+                "(SELECT id FROM provenance WHERE timestamp < ?)",
+                (cutoff_iso,)
+            )
+            records = conn.execute(
+                "DELETE FROM provenance WHERE timestamp < ?", (cutoff_iso,)
+            ).rowcount
+
+            conn.execute(
+                "DELETE FROM provenance_file_errors WHERE file_id IN "
+                "(SELECT id FROM provenance_files WHERE timestamp < ?)",
+                (cutoff_ms,)
+            )
+            files = conn.execute(
+                "DELETE FROM provenance_files WHERE timestamp < ?", (cutoff_ms,)
+            ).rowcount
+
+        if vacuum:
+            conn.execute("VACUUM")
+
+    finally:
+        conn.close()
+
+    return {
+        "cutoff": cutoff_iso,
+        "summaries": summaries,
+        "records": records,
+        "files": files
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Roll old provenance records into per-run summaries.")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite database path")
+    parser.add_argument("--older-than-days", type=float, default=OLDER_THAN_DAYS,
+                        help="compact records older than this many days (default 30)")
+    parser.add_argument("--vacuum", action="store_true", help="shrink the database file afterwards")
+    parser.add_argument("--profile", choices=sorted(PERFORMANCE_PROFILES), help="performance profile")
+    args = parser.parse_args()
+
+    result = compact_provenance(args.db, args.older_than_days, args.vacuum, args.profile)
+    print(
+        f"Compacted provenance before {result['cutoff']}: "
+        f"{result['records']} records and {result['files']} file records "
+        f"into {result['summaries']} summary rows"
+    )
@@ -1,19 +1,446 @@
 # -*- coding: utf-8 -*-
 """
 Database initialization for the XML measurement data pipeline.
-Creates metadata and provenance tables for FAIR-aligned provenance logging.
+Creates metadata and provenance tables for FAIR-aligned provenance logging,
+tables for the measurement values of the data section, the details of
+schema validation errors, the ingest index used for incremental
+re-ingestion, the tables of compact and compacted provenance, and the
+runs table that provenance and metadata rows refer to.
+
+Also provides SQLite performance profiles (journal mode, synchronous
+level, page cache, and memory-mapped I/O) and a migration path that
+brings existing databases up to the current schema version.
 
 License: MIT
 """
 
+import argparse
 import sqlite3
 
 
-def init_db():
-    """Initialize SQLite database and create metadata and provenance tables if they do not exist."""
-    conn = sqlite3.connect("../db/pipeline.db")
+# Version of the database layout, stored in PRAGMA user_version
+DB_SCHEMA_VERSION = 3
+
+# SQLite settings per performance profile. journal_mode is persistent in
+# the database file; the other settings apply per connection (see connect).
+PERFORMANCE_PROFILES = {
+    # SQLite defaults: rollback journal, synchronous=FULL
+    "default": {},
+    # WAL with a full fsync per commit
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL"
+    },
+    # WAL with fsync only at checkpoints; safe against application crashes
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65536,          # 64 MiB page cache
+        "mmap_size": 268435456         # 256 MiB memory-mapped I/O
+    },
+    # No fsync at all; for benchmark and scratch databases only
+    "throughput": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -262144,         # 256 MiB page cache
+        "mmap_size": 1073741824,       # 1 GiB memory-mapped I/O
+        "temp_store": "MEMORY"
+    }
+}
+
+_PRAGMA_VALUES = {
+    "journal_mode": {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"},
+    "synchronous": {"OFF", "NORMAL", "FULL", "EXTRA"},
+    "temp_store": {"DEFAULT", "FILE", "MEMORY"}
+}
+
+
+INGEST_INDEX_DDL = """
+CREATE TABLE IF NOT EXISTS ingest_index (
+    xml_path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    schema_version TEXT,
+    pipeline_version TEXT,
+    measurement_id TEXT,
+    processed_at TEXT NOT NULL
+);
+"""
+
+
+# One row per captured schema validation error of a provenance record;
+# domain and type are the numeric lxml error codes (etree.ErrorDomains,
+# etree.ErrorTypes), message is only stored in full error mode
+VALIDATION_ERRORS_DDL = """
+CREATE TABLE IF NOT EXISTS validation_errors (
+    provenance_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    line INTEGER,
+    column INTEGER,
+    domain INTEGER,
+    type INTEGER,
+    message TEXT,
+    PRIMARY KEY (provenance_id, position),
+    FOREIGN KEY (provenance_id) REFERENCES provenance(id)
+) WITHOUT ROWID;
+"""
+
+
+# Steps logged per file, in processing order, with their success message.
+# In compact provenance, step i sets bit 2*i when it ran and bit 2*i+1 when
+# it failed.
+PROVENANCE_STEPS = (
+    ("validation", "XML validated successfully"),
+    ("metadata_extraction", "metadata extracted"),
+    ("db_insert", "metadata stored"),
+    ("pipeline", "processing completed")
+)
+
+# Compact provenance: one row per file, repeated strings in lookup tables
+COMPACT_PROVENANCE_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS provenance_steps (
+        position INTEGER PRIMARY KEY,
+        step TEXT NOT NULL UNIQUE,
+        message TEXT NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS provenance_contexts (
+        id INTEGER PRIMARY KEY,
+        xsd_schema TEXT NOT NULL DEFAULT '',
+        schema_version TEXT NOT NULL DEFAULT '',
+        pipeline_version TEXT NOT NULL DEFAULT '',
+        UNIQUE (xsd_schema, schema_version, pipeline_version)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS provenance_files (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        measurement_id TEXT,
+        xml_file TEXT,
+        timestamp INTEGER NOT NULL,
+        context_id INTEGER NOT NULL,
+        stage_bits INTEGER NOT NULL,
+        message TEXT,
+        processing_time_ms REAL,
+        memory_peak_mb REAL,
+        validation_time_ms REAL,
+        extraction_time_ms REAL,
+        persistence_time_ms REAL,
+        FOREIGN KEY (context_id) REFERENCES provenance_contexts(id)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS provenance_file_errors (
+        file_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        line INTEGER,
+        column INTEGER,
+        domain INTEGER,
+        type INTEGER,
+        message TEXT,
+        PRIMARY KEY (file_id, position),
+        FOREIGN KEY (file_id) REFERENCES provenance_files(id)
+    ) WITHOUT ROWID;
+    """
+]
+
+# Detailed and expanded compact records with the columns of provenance;
+# compact timestamps are rendered in local time with milliseconds
+PROVENANCE_VIEW_DDL = """
+CREATE VIEW provenance_view AS
+SELECT
+    id, measurement_id, step, status, message, timestamp, xml_file,
+    xsd_schema, schema_version, pipeline_version, processing_time_ms,
+    memory_peak_mb, validation_time_ms, extraction_time_ms,
+    persistence_time_ms, run_id, 'detailed' AS source
+FROM provenance
+UNION ALL
+SELECT
+    f.id,
+    f.measurement_id,
+    s.step,
+    CASE WHEN f.stage_bits & (2 << (2 * s.position)) THEN 'error' ELSE 'success' END,
+    CASE WHEN f.stage_bits & (2 << (2 * s.position)) THEN f.message ELSE s.message END,
+    strftime('%Y-%m-%dT%H:%M:%f', f.timestamp / 1000.0, 'unixepoch', 'localtime'),
+    f.xml_file,
+    CASE WHEN s.step = 'validation' THEN nullif(c.xsd_schema, '') END,
+    CASE WHEN s.step = 'validation' THEN nullif(c.schema_version, '') END,
+    nullif(c.pipeline_version, ''),
+    CASE WHEN s.step = 'pipeline' THEN f.processing_time_ms END,
+    CASE WHEN s.step = 'pipeline' THEN f.memory_peak_mb END,
+    CASE WHEN s.step = 'pipeline' THEN f.validation_time_ms END,
+    CASE WHEN s.step = 'pipeline' THEN f.extraction_time_ms END,
+    CASE WHEN s.step = 'pipeline' THEN f.persistence_time_ms END,
+    f.run_id,
+    'compact'
+FROM provenance_files f
+JOIN provenance_contexts c ON c.id = f.context_id
+JOIN provenance_steps s ON f.stage_bits & (1 << (2 * s.position));
+"""
+
+# Provenance rolled up by compaction.py, per run, day, step, status, and
+# versions (run_id 0 for records without a run); sums of squares keep the
+# standard deviation of every timing recoverable
+PROVENANCE_SUMMARIES_DDL = """
+CREATE TABLE IF NOT EXISTS provenance_summaries (
+    run_id INTEGER NOT NULL DEFAULT 0,
+    day TEXT NOT NULL,
+    step TEXT NOT NULL,
+    status TEXT NOT NULL,
+    xsd_schema TEXT NOT NULL DEFAULT '',
+    schema_version TEXT NOT NULL DEFAULT '',
+    pipeline_version TEXT NOT NULL DEFAULT '',
+    record_count INTEGER NOT NULL,
+    timed_count INTEGER NOT NULL,
+    processing_time_sum REAL,
+    processing_time_sq_sum REAL,
+    processing_time_max REAL,
+    validation_time_sum REAL,
+    validation_time_sq_sum REAL,
+    validation_time_max REAL,
+    extraction_time_sum REAL,
+    extraction_time_sq_sum REAL,
+    extraction_time_max REAL,
+    persistence_time_sum REAL,
+    persistence_time_sq_sum REAL,
+    persistence_time_max REAL,
+    memory_peak_max REAL,
+    first_timestamp TEXT,
+    last_timestamp TEXT,
+    PRIMARY KEY (run_id, day, step, status, xsd_schema, schema_version, pipeline_version)
+);
+"""
+
+# One row per Pipeline run; config holds the pipeline settings as JSON
+RUNS_DDL = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    status TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    pipeline_version TEXT,
+    schema_version TEXT,
+    config TEXT,
+    total INTEGER,
+    successful INTEGER,
+    failed INTEGER,
+    skipped INTEGER,
+    runtime_ms REAL,
+    throughput_files_s REAL,
+    peak_memory_mb REAL
+);
+"""
+
+
+MEASUREMENT_VALUES_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS measurement_values (
+        measurement_id TEXT PRIMARY KEY,
+        druck REAL,
+        temperatur REAL,
+        frequenz REAL,
+        pumpe TEXT,
+        FOREIGN KEY (measurement_id) REFERENCES metadata(id)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sensor_readings (
+        measurement_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        sensor_id TEXT NOT NULL,
+        wert REAL NOT NULL,
+        PRIMARY KEY (measurement_id, position),
+        FOREIGN KEY (measurement_id) REFERENCES metadata(id)
+    ) WITHOUT ROWID;
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_sensor_readings_sensor
+    ON sensor_readings (sensor_id);
+    """
+]
+
+
+def resolve_profile(profile=None):
+    """
+    Return the SQLite settings of a performance profile.
+
+    Args:
+        profile: Name from PERFORMANCE_PROFILES, a dict of settings
+                 (journal_mode, synchronous, cache_size, mmap_size,
+                 temp_store), or None for SQLite defaults.
+    """
+    if profile is None:
+        return {}
+
+    if isinstance(profile, dict):
+        settings = dict(profile)
+    elif profile in PERFORMANCE_PROFILES:
+        settings = dict(PERFORMANCE_PROFILES[profile])
+    else:
+        raise ValueError(f"Unknown performance profile: {profile}")
+
+    for name, value in settings.items():
+        if name in _PRAGMA_VALUES:
+            if str(value).upper() not in _PRAGMA_VALUES[name]:
+                raise ValueError(f"Invalid value for {name}: {value}")
+        elif name in ("cache_size", "mmap_size"):
+            int(value)
+        else:
+            raise ValueError(f"Unknown SQLite setting: {name}")
+
+    return settings
+
+
+def apply_profile(conn, profile=None):
+    """Apply the settings of a performance profile to an open connection."""
+    settings = resolve_profile(profile)
+
+    for name in ("journal_mode", "synchronous", "cache_size", "mmap_size", "temp_store"):
+        if name in settings:
+            value = settings[name]
+            value = int(value) if name in ("cache_size", "mmap_size") else str(value).upper()
+            conn.execute(f"PRAGMA {name} = {value}")
+
+
+def connect(db_path, profile=None, **kwargs):
+    """
+    Open a SQLite connection with the settings of a performance profile.
+
+    Args:
+        db_path: Path of the SQLite database.
+        profile: Performance profile, see resolve_profile.
+        **kwargs: Passed on to sqlite3.connect.
+    """
+    conn = sqlite3.connect(db_path, **kwargs)
+    apply_profile(conn, profile)
+    return conn
+
+
+def _create_indexes(cursor):
+    """Migration 1: indexes for the reporting queries."""
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_provenance_step_status
+    ON provenance (step, status);
+    """)
+
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_provenance_measurement
+    ON provenance (measurement_id);
+    """)
+
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_metadata_geraet_timestamp
+    ON metadata (geraet, timestamp);
+    """)
+
+
+def _add_run_ids(cursor):
+    """
+    Migration 2: indexed run_id columns referencing runs.
+
+    Also recreates provenance_view with the run_id column, and keys the
+    provenance summaries by run; existing summaries get run_id 0.
+    """
+    for table in ("provenance", "metadata", "provenance_files"):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN run_id INTEGER REFERENCES runs(id)")
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_provenance_run ON provenance (run_id, step);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_metadata_run ON metadata (run_id);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_provenance_files_run ON provenance_files (run_id);")
+
+    cursor.execute("DROP VIEW IF EXISTS provenance_view")
+    cursor.execute(PROVENANCE_VIEW_DDL)
+
+    existing = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'provenance_summaries'"
+    ).fetchone()
+
+    if existing:
+        cursor.execute("ALTER TABLE provenance_summaries RENAME TO provenance_summaries_v1")
+
+    cursor.execute(PROVENANCE_SUMMARIES_DDL)
+
+    if existing:
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(provenance_summaries_v1)")]
+        column_list = ", ".join(columns)
+        cursor.execute(
+            f"INSERT INTO provenance_summaries ({column_list}) "
+            f"SELECT {column_list} FROM provenance_summaries_v1"
+        )
+        cursor.execute("DROP TABLE provenance_summaries_v1")
+
+
+def _add_metadata_keyset_indexes(cursor):
+    """
+    Migration 3: indexes for keyset pagination over metadata.
+
+    Every filter column is followed by (timestamp, id), the sort key of
+    metadata_query.py, so a page is one index range scan without sorting.
+    The (geraet, timestamp) index of migration 1 is a prefix of the new
+    device index and is dropped.
+    """
+    cursor.execute("DROP INDEX IF EXISTS idx_metadata_geraet_timestamp")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_metadata_timestamp ON metadata (timestamp, id);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_metadata_geraet ON metadata (geraet, timestamp, id);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_metadata_operator ON metadata (operator, timestamp, id);")
+
+
+# Ordered (version, migration) pairs applied by migrate_db
+MIGRATIONS = [
+    (1, _create_indexes),
+    (2, _add_run_ids),
+    (3, _add_metadata_keyset_indexes)
+]
+
+
+def init_db(db_path="../db/pipeline.db", profile=None):
+    """
+    Initialize SQLite database and create metadata and provenance tables if they do not exist.
+
+    New and existing databases are brought up to DB_SCHEMA_VERSION, and
+    the persistent settings of the performance profile are applied.
+    """
+    migrate_db(db_path, profile)
+
+
+def migrate_db(db_path="../db/pipeline.db", profile=None):
+    """
+    Bring a database up to DB_SCHEMA_VERSION.
+
+    Missing tables are created, and all migrations newer than the version
+    recorded in PRAGMA user_version are applied in one transaction.
+
+    Returns:
+        Tuple of (previous version, current version).
+    """
+    conn = connect(db_path, profile)
     cursor = conn.cursor()
 
+    cursor.execute("BEGIN")
+    _create_tables(cursor)
+
+    previous = cursor.execute("PRAGMA user_version").fetchone()[0]
+    current = previous
+
+    for version, migration in MIGRATIONS:
+        if version > current:
+            migration(cursor)
+            current = version
+
+    # PRAGMA does not accept parameters; current is an int from MIGRATIONS
+    cursor.execute(f"PRAGMA user_version = {int(current)}")
+
+    conn.commit()
+    conn.close()
+
+    return previous, current
+
+
+def _create_tables(cursor):
+    """Create all tables that do not exist yet."""
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS metadata (
         id TEXT PRIMARY KEY,
@@ -45,9 +472,39 @@ def init_db():
     );
     """)
 
-    conn.commit()
-    conn.close()
+    # Measurement values and sensor readings of the data section
+    for statement in MEASUREMENT_VALUES_DDL:
+        cursor.execute(statement)
+
+    # Files already processed successfully, for incremental re-ingestion
+    cursor.execute(INGEST_INDEX_DDL)
+
+    # Details of schema validation errors, see provenance.ProvenanceLogger
+    cursor.execute(VALIDATION_ERRORS_DDL)
+
+    # Compact provenance, see provenance.CompactProvenanceLogger
+    for statement in COMPACT_PROVENANCE_DDL:
+        cursor.execute(statement)
+
+    cursor.executemany(
+        "INSERT OR IGNORE INTO provenance_steps (position, step, message) VALUES (?, ?, ?)",
+        [(position, step, message) for position, (step, message) in enumerate(PROVENANCE_STEPS)]
+    )
+
+    # Pipeline runs; provenance_view and the summaries of compaction.py
+    # refer to run ids and are created by migration 2
+    cursor.execute(RUNS_DDL)
 
 
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Initialize or migrate the pipeline database.")
+    parser.add_argument("--db", default="../db/pipeline.db", help="SQLite database path")
+    parser.add_argument(
+        "--profile",
+        choices=sorted(PERFORMANCE_PROFILES),
+        help="performance profile to apply (journal mode is stored in the database)"
+    )
+    args = parser.parse_args()
+
+    previous, current = migrate_db(args.db, args.profile)
+    print(f"Database {args.db}: schema version {previous} -> {current}")
\ No newline at end of file
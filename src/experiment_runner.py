@@ -8,7 +8,12 @@ The script executes the XML processing pipeline under controlled conditions:
 - database reset before each measured run
 - one warm-up run per batch size
 - collection of runtime, throughput, memory, and stage-level metrics
+- in-process stage latency percentiles (p50/p95/p99/max) per batch size
 - export of raw benchmark measurements as CSV for reproducible boxplots
+- optional worker-scaling runs (python experiment_runner.py scaling)
+
+Configurable benchmark matrices with machine-readable results are run
+with benchmark.py.
 """
 
 import csv
@@ -16,10 +21,14 @@ import os
 import shutil
 import sqlite3
 import statistics
+import sys
 import time
 
 from db_init import init_db
 from pipeline import Pipeline
+from profiler import StageProfiler
+from provenance import close_provenance
+from sources import iter_xml_files
 
 
 XML_SOURCE = "../xml_pool/"
@@ -27,37 +36,62 @@ XML_WORKDIR = "../xml_experiment/"
 DB_PATH = "../db/pipeline.db"
 RESULTS_FILE = "../results/experiment_results.txt"
 RAW_RESULTS_FILE = "../results/raw_runtime_measurements.csv"
+SCALING_RESULTS_FILE = "../results/worker_scaling.csv"
+
+# SQLite performance profile, see db_init.PERFORMANCE_PROFILES
+DB_PROFILE = None
+
+# Memory accounting, see memory.MEMORY_MODES; 'off' for pure throughput runs
+MEMORY_MODE = "psutil"
+
+# One provenance row per file, see provenance.CompactProvenanceLogger
+COMPACT_PROVENANCE = False
+
+# Delete the database before every run. With False, runs are measured
+# against the existing database and told apart by their run id.
+RESET_DATABASE = True
 
 BATCH_SIZES = [100, 200, 500, 1000]
 RUNS = 20
 
+# False streams batches straight from XML_SOURCE instead of copying them
+COPY_BATCHES = True
 
-def reset_database():
+WORKER_COUNTS = [1, 2, 4, 8]
+SCALING_BATCH_SIZE = 1000
+SCALING_RUNS = 5
+
+
+def reset_database(db_path=DB_PATH, profile=DB_PROFILE):
     """Delete and re-initialize the SQLite database."""
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
-    init_db()
+    # Release the shared provenance connection before the file is removed
+    close_provenance()
 
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    init_db(db_path, profile)
 
-def prepare_batch(batch_size):
+
+def prepare_batch(batch_size, source=XML_SOURCE, workdir=XML_WORKDIR):
     """
     Prepare a controlled batch of XML files.
 
     If the source pool contains fewer files than required, files are reused
     with unique target names.
     """
-    if os.path.exists(XML_WORKDIR):
-        shutil.rmtree(XML_WORKDIR)
+    if os.path.exists(workdir):
+        shutil.rmtree(workdir)
 
-    os.makedirs(XML_WORKDIR)
+    os.makedirs(workdir)
 
     all_files = sorted([
-        filename for filename in os.listdir(XML_SOURCE)
+        filename for filename in os.listdir(source)
         if filename.endswith(".xml")
     ])
 
     if not all_files:
-        raise RuntimeError(f"No XML files found in {XML_SOURCE}.")
+        raise RuntimeError(f"No XML files found in {source}.")
 
     selected = []
 
@@ -71,8 +105,8 @@ def prepare_batch(batch_size):
             target_name = source_name
 
         shutil.copy(
-            os.path.join(XML_SOURCE, source_name),
-            os.path.join(XML_WORKDIR, target_name)
+            os.path.join(source, source_name),
+            os.path.join(workdir, target_name)
         )
 
         selected.append(target_name)
@@ -80,10 +114,38 @@ def prepare_batch(batch_size):
     return selected
 
 
-def get_stage_metrics_from_db():
+def iter_batch(batch_size):
+    """
+    Stream a batch of XML filenames from the source pool without copying.
+
+    The pool is scanned lazily with os.scandir and reused cyclically if it
+    contains fewer files than required. Filenames are relative to
+    XML_SOURCE and are produced in directory order.
+    """
+    produced = 0
+
+    while produced < batch_size:
+        found = False
+
+        for filename in iter_xml_files(XML_SOURCE):
+            found = True
+            yield filename
+            produced += 1
+
+            if produced >= batch_size:
+                return
+
+        if not found:
+            raise RuntimeError(f"No XML files found in {XML_SOURCE}.")
+
+
+def get_stage_metrics_from_db(run_ids=None):
     """
     Extract validation, extraction, and persistence timings from the database.
 
+    Args:
+        run_ids: Optional ids of the runs to include; all runs if None.
+
     Returns:
         A dictionary with mean, median, and standard deviation for each stage,
         or None if no stage-level data are available.
@@ -91,14 +153,23 @@ def get_stage_metrics_from_db():
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
 
-    cursor.execute("""
+    # provenance_view covers detailed and compact provenance records
+    query = """
         SELECT
             validation_time_ms,
             extraction_time_ms,
             persistence_time_ms
-        FROM provenance
+        FROM provenance_view
         WHERE step = 'pipeline' AND status = 'success'
-    """)
+    """
+    params = []
+
+    if run_ids is not None:
+        run_ids = sorted(set(run_ids))
+        query += f" AND run_id IN ({', '.join('?' * len(run_ids))})"
+        params = run_ids
+
+    cursor.execute(query, params)
 
     rows = cursor.fetchall()
     conn.close()
@@ -213,6 +284,17 @@ def save_results(results):
                     f"Median: {stages['persistence']['median']:.2f}ms\n"
                 )
 
+            if metrics.get("stage_latency"):
+                file.write("\nStage Latency Percentiles (all measured runs):\n")
+                for stage, latency in metrics["stage_latency"].items():
+                    file.write(
+                        f"  {stage:<17} p50: {latency['p50_ms']:.3f}ms, "
+                        f"p95: {latency['p95_ms']:.3f}ms, "
+                        f"p99: {latency['p99_ms']:.3f}ms, "
+                        f"max: {latency['max_ms']:.3f}ms "
+                        f"(n={latency['count']})\n"
+                    )
+
             file.write("\n")
 
 
@@ -269,34 +351,55 @@ def run_experiments():
         runtimes = []
         throughputs = []
         memory_peaks = []
+        run_ids = []
+
+        # Stage latencies of all measured runs of this batch size
+        profiler = StageProfiler()
 
         for run in range(RUNS):
             print(f"Run {run + 1}/{RUNS}...", end=" ")
 
-            reset_database()
-            file_list = prepare_batch(batch_size)
+            if RESET_DATABASE:
+                reset_database()
 
-            pipeline = Pipeline(xml_dir=XML_WORKDIR)
+            if COPY_BATCHES:
+                file_list = prepare_batch(batch_size)
+                pipeline = Pipeline(
+                    xml_dir=XML_WORKDIR, db_profile=DB_PROFILE,
+                    profiler=profiler, memory_mode=MEMORY_MODE,
+                    compact_provenance=COMPACT_PROVENANCE
+                )
+            else:
+                file_list = None
+                pipeline = Pipeline(
+                    xml_dir=XML_SOURCE, streaming=True, db_profile=DB_PROFILE,
+                    profiler=profiler, memory_mode=MEMORY_MODE,
+                    compact_provenance=COMPACT_PROVENANCE
+                )
 
             if run == 0:
                 print("(warm-up)...", end=" ")
-                pipeline.run(file_list)
-                reset_database()
+                pipeline.run(file_list if COPY_BATCHES else iter_batch(batch_size))
+                if RESET_DATABASE:
+                    reset_database()
+                profiler.reset()
 
             start = time.perf_counter()
-            result = pipeline.run(file_list)
+            result = pipeline.run(file_list if COPY_BATCHES else iter_batch(batch_size))
             runtime = time.perf_counter() - start
 
             successful = result["successful"]
             throughput = successful / runtime if runtime > 0 else 0
 
+            run_ids.append(result["run_id"])
+
             conn = sqlite3.connect(DB_PATH)
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT AVG(memory_peak_mb)
-                FROM provenance
-                WHERE step = 'pipeline' AND status = 'success'
-            """)
+                FROM provenance_view
+                WHERE run_id = ? AND step = 'pipeline' AND status = 'success'
+            """, (result["run_id"],))
             row = cursor.fetchone()
             avg_memory = row[0] if row and row[0] is not None else 0.0
             conn.close()
@@ -315,7 +418,7 @@ def run_experiments():
         q1_runtime, q3_runtime = get_quartiles(runtimes)
         iqr_runtime = q3_runtime - q1_runtime
 
-        stage_metrics = get_stage_metrics_from_db()
+        stage_metrics = get_stage_metrics_from_db(run_ids)
 
         results[batch_size] = {
             "runtimes": runtimes,
@@ -336,7 +439,8 @@ def run_experiments():
             "std_memory": statistics.stdev(memory_peaks) if len(memory_peaks) > 1 else 0,
             "mean_time_per_file": (mean_runtime / batch_size) * 1000,
             "median_time_per_file": (median_runtime / batch_size) * 1000,
-            "stage_metrics": stage_metrics
+            "stage_metrics": stage_metrics,
+            "stage_latency": profiler.summary()
         }
 
         print(f"\n{'=' * 80}")
@@ -357,6 +461,10 @@ def run_experiments():
             print(f"    Extraction:  {stage_metrics['extraction']['mean']:.2f}ms")
             print(f"    Persistence: {stage_metrics['persistence']['mean']:.2f}ms")
 
+        print("  Stage Latency:")
+        for line in profiler.format_summary().splitlines():
+            print(f"    {line}")
+
         print(f"{'=' * 80}")
 
     save_results(results)
@@ -369,5 +477,93 @@ def run_experiments():
     print(f"{'=' * 80}\n")
 
 
+def run_scaling_experiments(batch_size=SCALING_BATCH_SIZE,
+                            worker_counts=WORKER_COUNTS,
+                            runs=SCALING_RUNS):
+    """
+    Measure throughput scaling over the number of worker processes.
+
+    Every worker count is measured on the same batch with a database reset
+    before each run and one warm-up run. Runtimes include process-pool
+    start-up. Raw measurements are written to SCALING_RESULTS_FILE; the
+    speedup column is relative to the median runtime of the first
+    worker count.
+    """
+    print("=" * 80)
+    print(f"WORKER SCALING EVALUATION ({batch_size} files)")
+    print("=" * 80)
+
+    file_list = prepare_batch(batch_size)
+    rows = []
+    baseline_median = None
+
+    for workers in worker_counts:
+        pipeline = Pipeline(
+            xml_dir=XML_WORKDIR, workers=workers, db_profile=DB_PROFILE, memory_mode=MEMORY_MODE,
+            compact_provenance=COMPACT_PROVENANCE
+        )
+
+        if RESET_DATABASE:
+            reset_database()
+        pipeline.run(file_list)  # warm-up
+
+        runtimes = []
+        throughputs = []
+        memory_peaks = []
+
+        for run in range(runs):
+            if RESET_DATABASE:
+                reset_database()
+
+            start = time.perf_counter()
+            result = pipeline.run(file_list)
+            runtime = time.perf_counter() - start
+
+            runtimes.append(runtime)
+            throughputs.append(result["successful"] / runtime if runtime > 0 else 0)
+            memory_peaks.append(result["peak_memory_mb"])
+
+        median_runtime = statistics.median(runtimes)
+        if baseline_median is None:
+            baseline_median = median_runtime
+        speedup = baseline_median / median_runtime if median_runtime > 0 else 0
+
+        for run_id, (runtime, throughput, memory_peak) in enumerate(
+                zip(runtimes, throughputs, memory_peaks), start=1):
+            rows.append([
+                workers,
+                run_id,
+                f"{runtime * 1000:.2f}",
+                f"{throughput:.2f}",
+                "" if memory_peak is None else f"{memory_peak:.2f}",
+                f"{speedup:.2f}"
+            ])
+
+        print(
+            f"  Workers: {workers:2d} - Median Runtime: {median_runtime * 1000:.2f}ms, "
+            f"Median Throughput: {statistics.median(throughputs):.2f} files/s, "
+            f"Speedup: {speedup:.2f}x"
+        )
+
+    os.makedirs(os.path.dirname(SCALING_RESULTS_FILE), exist_ok=True)
+
+    with open(SCALING_RESULTS_FILE, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow([
+            "workers",
+            "run_id",
+            "runtime_ms",
+            "throughput_files_s",
+            "memory_peak_mb",
+            "speedup"
+        ])
+        writer.writerows(rows)
+
+    print(f"Scaling measurements saved to: {SCALING_RESULTS_FILE}")
+
+
 if __name__ == "__main__":
-    run_experiments()
+    if len(sys.argv) > 1 and sys.argv[1] == "scaling":
+        run_scaling_experiments()
+    else:
+        run_experiments()
@@ -1,23 +1,41 @@
 # -*- coding: utf-8 -*-
 """
 Metadata extractor for the XML measurement data pipeline.
-Parses measurement metadata from XML files and persists it to SQLite
-with provenance logging at each stage.
+Parses measurement metadata from XML files and persists it through a
+storage backend (SQLite by default, see storage.py) with provenance
+logging at each stage. Optionally, the measurement values and sensor
+readings of the data section are stored as well.
 
 License: MIT
 """
 
+import io
 import os
-import sqlite3
+import time
 from lxml import etree
 from provenance import log_provenance   # Import provenance logger
+from storage import SQLiteBackend, metadata_row
 
 
 class MetadataExtractor:
-    def __init__(self, db_path="../db/pipeline.db", pipeline_version="0.9.1"):
+    def __init__(self, db_path="../db/pipeline.db", pipeline_version="0.9.1", store_values=False,
+                 db_profile=None, backend=None):
         self.db_path = db_path
         self.pipeline_version = pipeline_version
 
+        # SQLite performance profile for write connections (see db_init)
+        self.db_profile = db_profile
+
+        # Storage backend of the metadata, see storage.py; SQLite at
+        # db_path unless given
+        self.backend = backend if backend is not None else SQLiteBackend(db_path, db_profile)
+
+        # Also extract and persist the measurement values of the data section
+        self.store_values = store_values
+
+        # Run that inserted rows belong to; set by Pipeline for each run
+        self.run_id = None
+
     def extract_metadata(self, xml_path):
         """
         Extract metadata from an XML file.
@@ -34,123 +52,381 @@ class MetadataExtractor:
 
         try:
             tree = etree.parse(xml_path)
+        except Exception as e:
+            return self._extraction_error(xml_filename, str(e))
+
+        return self.extract_from_document(tree, xml_filename)
+
+    def extract_metadata_bytes(self, xml_bytes, xml_filename):
+        """
+        Extract metadata from an in-memory XML document.
+
+        Args:
+            xml_bytes: Serialized XML document.
+            xml_filename: Source name used for provenance logging.
+
+        Returns:
+            dict: Same structure as extract_metadata.
+        """
+        try:
+            tree = etree.fromstring(xml_bytes).getroottree()
+        except Exception as e:
+            return self._extraction_error(xml_filename, str(e))
+
+        return self.extract_from_document(tree, xml_filename)
+
+    def extract_from_document(self, tree, xml_filename):
+        """
+        Extract metadata from an already parsed XML document.
+
+        Used by the pipeline to reuse the tree produced during validation,
+        so each file is parsed only once.
+
+        Args:
+            tree: Parsed lxml ElementTree.
+            xml_filename: Source XML filename used for provenance logging.
+
+        Returns:
+            dict: Same structure as extract_metadata.
+        """
+        try:
             root = tree.getroot()
 
+            values = None
+            if self.store_values:
+                values = self._read_values(root.find("data"))
+
             # Read metadata section
-            metadata = root.find("metadata")
-            if metadata is None:
-                msg = "metadata section missing"
-
-                log_provenance(
-                    measurement_id=xml_filename,
-                    step="metadata_extraction",
-                    status="error",
-                    message=msg,
-                    xml_file=xml_filename,
-                    pipeline_version=self.pipeline_version
-                )
-
-                return {
-                    "success": False,
-                    "data": None,
-                    "error": msg
-                }
-
-            measurement_id = metadata.findtext("measurement_id")
-            timestamp = metadata.findtext("timestamp")
-            geraet = metadata.findtext("geraet")
-            operator = metadata.findtext("operator")
-            parameter = metadata.findtext("parameter")
-
-            # Validate required fields
-            if not measurement_id or not timestamp or not geraet:
-                msg = "missing required metadata fields"
-
-                log_provenance(
-                    measurement_id=xml_filename,
-                    step="metadata_extraction",
-                    status="error",
-                    message=msg,
-                    xml_file=xml_filename,
-                    pipeline_version=self.pipeline_version
-                )
-
-                return {
-                    "success": False,
-                    "data": None,
-                    "error": msg
-                }
-
-            data = {
-                "id": measurement_id,
-                "timestamp": timestamp,
-                "geraet": geraet,
-                "operator": operator,
-                "parameter": parameter
-            }
+            return self._metadata_result(root.find("metadata"), xml_filename, values)
+
+        except Exception as e:
+            return self._extraction_error(xml_filename, str(e))
+
+    def extract_metadata_streaming(self, source, xml_filename=None):
+        """
+        Extract metadata with iterparse, without building the full tree.
+
+        The metadata section is always the first child of <measurement>, so
+        parsing stops as soon as </metadata> closes (or as soon as another
+        section starts, in which case the metadata section is missing). The
+        data section, including large sensor lists, is never read, so no
+        measurement values are returned even if store_values is set.
+        Intended for documents that are not validated in this run, because
+        validation is disabled or was already done.
+
+        Args:
+            source: Path of the XML file, XML bytes, or a binary file-like
+                    object.
+            xml_filename: Source name used for provenance logging; defaults
+                          to the basename of a path source.
+
+        Returns:
+            dict: Same structure as extract_metadata.
+        """
+        if xml_filename is None:
+            xml_filename = os.path.basename(source) if isinstance(source, str) else None
+
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+
+        try:
+            metadata = None
+            depth = 0
+
+            for event, element in etree.iterparse(source, events=("start", "end")):
+                if event == "start":
+                    depth += 1
+
+                    # Any other top-level section before metadata means it is missing
+                    if depth == 2 and element.tag != "metadata":
+                        break
+
+                    continue
+
+                depth -= 1
+
+                if depth == 1 and element.tag == "metadata":
+                    metadata = element
+                    break
+
+            result = self._metadata_result(metadata, xml_filename)
+
+            if metadata is not None:
+                metadata.clear()
+
+            return result
+
+        except Exception as e:
+            return self._extraction_error(xml_filename, str(e))
+
+    def _read_values(self, data_section):
+        """
+        Read measurement values and sensor readings from a <data> element.
+
+        Returns:
+            Dict with druck, temperatur, frequenz, pumpe and a list of
+            (sensor_id, wert) tuples under 'sensors', or None if the data
+            section is missing.
+        """
+        if data_section is None:
+            return None
+
+        return {
+            "druck": float(data_section.findtext("druck")),
+            "temperatur": float(data_section.findtext("temperatur")),
+            "frequenz": float(data_section.findtext("frequenz")),
+            "pumpe": data_section.findtext("pumpe"),
+            "sensors": [
+                (sensor.findtext("id"), float(sensor.findtext("wert")))
+                for sensor in data_section.iterfind("sensoren/sensor")
+            ]
+        }
+
+    def _metadata_result(self, metadata, xml_filename, values=None):
+        """
+        Read the metadata fields from a <metadata> element.
+
+        Args:
+            metadata: The <metadata> element, or None if it is missing.
+            xml_filename: Source XML filename used for provenance logging.
+            values: Optional measurement values, see _read_values.
+
+        Returns:
+            dict: Same structure as extract_metadata.
+        """
+        if metadata is None:
+            return self._extraction_error(xml_filename, "metadata section missing")
+
+        measurement_id = metadata.findtext("measurement_id")
+        timestamp = metadata.findtext("timestamp")
+        geraet = metadata.findtext("geraet")
+        operator = metadata.findtext("operator")
+        parameter = metadata.findtext("parameter")
+
+        # Validate required fields
+        if not measurement_id or not timestamp or not geraet:
+            return self._extraction_error(xml_filename, "missing required metadata fields")
+
+        data = {
+            "id": measurement_id,
+            "timestamp": timestamp,
+            "geraet": geraet,
+            "operator": operator,
+            "parameter": parameter
+        }
+
+        if values is not None:
+            data["values"] = values
+
+        # Provenance: success
+        log_provenance(
+            measurement_id=measurement_id,
+            step="metadata_extraction",
+            status="success",
+            message="metadata extracted",
+            xml_file=xml_filename,
+            pipeline_version=self.pipeline_version
+        )
+
+        return {
+            "success": True,
+            "data": data,
+            "error": None
+        }
+
+    def _extraction_error(self, xml_filename, msg):
+        """Log a failed extraction and build the error result."""
+        log_provenance(
+            measurement_id=xml_filename,
+            step="metadata_extraction",
+            status="error",
+            message=msg,
+            xml_file=xml_filename,
+            pipeline_version=self.pipeline_version
+        )
+
+        return {
+            "success": False,
+            "data": None,
+            "error": msg
+        }
+
+    def insert_metadata(self, data, xml_path=None, xml_file=None):
+        """
+        Persist extracted metadata, and measurement values if present.
+
+        Args:
+            data: Extracted metadata dict.
+            xml_path: Source XML path, used for provenance logging.
+            xml_file: Source name for provenance logging instead of the
+                      basename of xml_path, e.g. an archive member name.
+
+        Returns:
+            Tuple of (success: bool, error: str or None)
+        """
+        xml_filename = xml_file or (os.path.basename(xml_path) if xml_path else None)
+
+        try:
+            self.backend.write_metadata([data], self.run_id)
 
             # Provenance: success
             log_provenance(
-                measurement_id=measurement_id,
-                step="metadata_extraction",
+                measurement_id=data["id"],
+                step="db_insert",
                 status="success",
-                message="metadata extracted",
+                message="metadata stored",
                 xml_file=xml_filename,
                 pipeline_version=self.pipeline_version
             )
 
-            return {
-                "success": True,
-                "data": data,
-                "error": None
-            }
+            return True, None
 
         except Exception as e:
             msg = str(e)
 
             log_provenance(
-                measurement_id=xml_filename,
-                step="metadata_extraction",
+                measurement_id=data.get("id", "unknown"),
+                step="db_insert",
                 status="error",
                 message=msg,
                 xml_file=xml_filename,
                 pipeline_version=self.pipeline_version
             )
 
-            return {
-                "success": False,
-                "data": None,
-                "error": msg
-            }
+            return False, msg
 
-    def insert_metadata(self, data, xml_path=None):
+    def batch_writer(self, batch_size=500, flush_interval_ms=1000.0):
         """
-        Persist extracted metadata to SQLite.
+        Create a batched writer that shares this extractor's settings.
+
+        Args:
+            batch_size: Number of pending records that triggers a commit.
+            flush_interval_ms: Maximum age of the oldest uncommitted batch.
 
         Returns:
-            Tuple of (success: bool, error: str or None)
+            MetadataBatchWriter sharing this extractor's storage backend.
+        """
+        return MetadataBatchWriter(
+            db_path=self.db_path,
+            pipeline_version=self.pipeline_version,
+            batch_size=batch_size,
+            flush_interval_ms=flush_interval_ms,
+            db_profile=self.db_profile,
+            run_id=self.run_id,
+            backend=self.backend
+        )
+
+
+class MetadataBatchWriter:
+    """
+    Batched, transactional persistence of extracted metadata.
+
+    Records are queued with add() and written with one bulk write of the
+    storage backend once batch_size records are pending or
+    flush_interval_ms has elapsed since the last commit. If the bulk write
+    fails, the batch is replayed record by record so that every record
+    still receives its own success or error result and db_insert
+    provenance record.
+
+    Without a backend, the writer opens its own SQLite connection and
+    closes it in close(); a given backend is left open.
+    """
+
+    def __init__(self,
+                 db_path="../db/pipeline.db",
+                 pipeline_version="0.9.1",
+                 batch_size=500,
+                 flush_interval_ms=1000.0,
+                 db_profile=None,
+                 run_id=None,
+                 backend=None):
+
+        self.db_path = db_path
+        self.run_id = run_id
+        self.pipeline_version = pipeline_version
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval_ms = flush_interval_ms
+
+        self.owns_backend = backend is None
+        self.backend = backend if backend is not None else SQLiteBackend(db_path, db_profile)
+        self.pending = []
+        self.last_flush = time.perf_counter()
+
+    def add(self, data, xml_path=None, context=None, xml_file=None):
         """
-        xml_filename = os.path.basename(xml_path) if xml_path else None
+        Queue a metadata record for persistence.
+
+        Args:
+            data: Extracted metadata dict.
+            xml_path: Source XML path, used for provenance logging.
+            context: Arbitrary caller data returned with the record's result.
+            xml_file: Source name for provenance logging, see insert_metadata.
+
+        Returns:
+            List of result dicts for all records committed by this call
+            (empty if the record was only queued). See flush().
+        """
+        xml_filename = xml_file or (os.path.basename(xml_path) if xml_path else None)
 
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                INSERT OR REPLACE INTO metadata (id, timestamp, geraet, operator, parameter)
-                VALUES (?, ?, ?, ?, ?)
-            """, (
-                data["id"],
-                data["timestamp"],
-                data["geraet"],
-                data["operator"],
-                data["parameter"]
-            ))
-
-            conn.commit()
-            conn.close()
+            metadata_row(data)
+        except Exception as e:
+            return [self._result(data, xml_filename, context, str(e), 0.0)]
 
-            # Provenance: success
+        self.pending.append((data, xml_filename, context))
+
+        elapsed_ms = (time.perf_counter() - self.last_flush) * 1000
+        if len(self.pending) >= self.batch_size or (
+                self.flush_interval_ms is not None and elapsed_ms >= self.flush_interval_ms):
+            return self.flush()
+
+        return []
+
+    def flush(self):
+        """
+        Commit all pending records.
+
+        Returns:
+            List of dicts, one per record, with keys:
+                'data', 'xml_file', 'context',
+                'success': bool,
+                'error': error message or None,
+                'persistence_time_ms': commit time amortized over the batch
+        """
+        if not self.pending:
+            self.last_flush = time.perf_counter()
+            return []
+
+        pending = self.pending
+        self.pending = []
+
+        start = time.perf_counter()
+        records = [entry[0] for entry in pending]
+
+        try:
+            self.backend.write_metadata(records, self.run_id)
+            errors = [None] * len(records)
+        except Exception:
+            errors = self.backend.write_metadata_each(records, self.run_id)
+
+        self.last_flush = time.perf_counter()
+        per_record_ms = (self.last_flush - start) * 1000 / len(records)
+
+        return [
+            self._result(data, xml_filename, context, error, per_record_ms)
+            for (data, xml_filename, context), error in zip(pending, errors)
+        ]
+
+    def close(self):
+        """Flush pending records and close a backend opened by the writer."""
+        results = self.flush()
+        if self.owns_backend:
+            self.backend.close()
+        return results
+
+    def _result(self, data, xml_filename, context, error, persistence_time_ms):
+        """Log db_insert provenance for one record and build its result."""
+        if error is None:
             log_provenance(
                 measurement_id=data["id"],
                 step="db_insert",
@@ -159,22 +435,24 @@ class MetadataExtractor:
                 xml_file=xml_filename,
                 pipeline_version=self.pipeline_version
             )
-
-            return True, None
-
-        except Exception as e:
-            msg = str(e)
-
+        else:
             log_provenance(
-                measurement_id=data.get("id", "unknown"),
+                measurement_id=data.get("id", "unknown") if isinstance(data, dict) else "unknown",
                 step="db_insert",
                 status="error",
-                message=msg,
+                message=error,
                 xml_file=xml_filename,
                 pipeline_version=self.pipeline_version
             )
 
-            return False, msg
+        return {
+            "data": data,
+            "xml_file": xml_filename,
+            "context": context,
+            "success": error is None,
+            "error": error,
+            "persistence_time_ms": persistence_time_ms
+        }
 
 
 if __name__ == "__main__":
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Ingest index for incremental re-ingestion in the XML measurement data pipeline.
+Records path, size, mtime, and content hash of every successfully processed
+file together with the schema and pipeline versions, so that unchanged
+files can be skipped on later runs.
+
+License: MIT
+"""
+
+import hashlib
+import os
+import threading
+from datetime import datetime
+
+from db_init import INGEST_INDEX_DDL, connect
+
+
+INDEX_LOOKUP_SQL = """
+    SELECT size, mtime_ns, content_hash, schema_version, pipeline_version, measurement_id
+    FROM ingest_index
+    WHERE xml_path = ?
+"""
+
+INDEX_UPSERT_SQL = """
+    INSERT OR REPLACE INTO ingest_index (
+        xml_path,
+        size,
+        mtime_ns,
+        content_hash,
+        schema_version,
+        pipeline_version,
+        measurement_id,
+        processed_at
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def file_hash(xml_path, algorithm="sha256", chunk_size=1024 * 1024):
+    """Compute the hex digest of a file's content."""
+    digest = hashlib.new(algorithm)
+
+    with open(xml_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class IngestIndex:
+    """
+    Index of files that were already processed successfully.
+
+    check() first compares size and mtime with the indexed entry, which
+    costs one stat call and one primary-key lookup. The content is only
+    hashed if the file's metadata changed, so that touched but otherwise
+    identical files are still skipped. Entries written with a different
+    schema or pipeline version never match.
+
+    New entries are buffered and written in one transaction per
+    buffer_size records, so the index never holds a write lock while the
+    metadata and provenance writers commit. All methods are thread-safe.
+    """
+
+    def __init__(self,
+                 db_path="../db/pipeline.db",
+                 schema_version="1.0",
+                 pipeline_version="0.9.1",
+                 hash_algorithm="sha256",
+                 buffer_size=500,
+                 db_profile=None):
+
+        self.db_path = db_path
+        self.schema_version = schema_version
+        self.pipeline_version = pipeline_version
+        self.hash_algorithm = hash_algorithm
+        self.buffer_size = max(1, int(buffer_size))
+
+        self.conn = connect(db_path, db_profile, check_same_thread=False)
+        with self.conn:
+            self.conn.execute(INGEST_INDEX_DDL)
+
+        # Entries not yet written, keyed by path
+        self.pending = {}
+        self.lock = threading.RLock()
+
+    def check(self, xml_path):
+        """
+        Decide whether a file can be skipped.
+
+        Args:
+            xml_path: Path of the XML file.
+
+        Returns:
+            Tuple of (skip: bool, fingerprint). The fingerprint is None for
+            skipped files and must otherwise be passed to record() once the
+            file has been processed successfully.
+        """
+        key = os.path.abspath(xml_path)
+
+        try:
+            stat = os.stat(xml_path)
+        except OSError:
+            # Let the pipeline report the missing file as usual
+            return False, None
+
+        with self.lock:
+            entry = self._lookup(key)
+
+        if entry is not None:
+            size, mtime_ns, content_hash, schema_version, pipeline_version, measurement_id = entry
+
+            versions_match = (
+                schema_version == self.schema_version
+                and pipeline_version == self.pipeline_version
+            )
+
+            if versions_match and size == stat.st_size and mtime_ns == stat.st_mtime_ns:
+                return True, None
+
+        content_hash_now = file_hash(xml_path, self.hash_algorithm)
+        fingerprint = (key, stat.st_size, stat.st_mtime_ns, content_hash_now)
+
+        if entry is not None and versions_match and content_hash == content_hash_now:
+            # Unchanged content with new file metadata: refresh the entry
+            self.record(fingerprint, measurement_id)
+            return True, None
+
+        return False, fingerprint
+
+    def record(self, fingerprint, measurement_id):
+        """Mark a file as processed successfully."""
+        if fingerprint is None:
+            return
+
+        key, size, mtime_ns, content_hash = fingerprint
+
+        with self.lock:
+            self.pending[key] = (
+                key,
+                size,
+                mtime_ns,
+                content_hash,
+                self.schema_version,
+                self.pipeline_version,
+                measurement_id,
+                datetime.now().isoformat()
+            )
+
+            if len(self.pending) >= self.buffer_size:
+                self.flush()
+
+    def flush(self):
+        """Write buffered entries in a single transaction."""
+        with self.lock:
+            if not self.pending:
+                return
+
+            rows = list(self.pending.values())
+            self.pending = {}
+
+            with self.conn:
+                self.conn.executemany(INDEX_UPSERT_SQL, rows)
+
+    def close(self):
+        """Flush buffered entries and close the connection."""
+        self.flush()
+        self.conn.close()
+
+    def _lookup(self, key):
+        """Return the indexed entry for a path, including unwritten ones."""
+        row = self.pending.get(key)
+        if row is not None:
+            return row[1:7]
+
+        return self.conn.execute(INDEX_LOOKUP_SQL, (key,)).fetchone()
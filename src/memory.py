@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Memory accounting for the XML measurement data pipeline.
+
+Supports four modes:
+- 'psutil': RSS sampled every 10 ms by a background thread (run peak only)
+- 'rusage': peak RSS from the kernel's high-water mark, reset per file
+- 'tracemalloc': Python heap allocations traced by tracemalloc
+- 'off': no memory accounting at all
+
+The 'rusage' and 'tracemalloc' modes need no sampling thread and also
+report a high-water mark per file and allocation deltas per stage.
+tracemalloc only sees allocations made through Python's allocators; the
+trees built by libxml2 are not included, and tracing slows down
+processing noticeably, so it is meant for diagnosis, not throughput runs.
+
+License: MIT
+"""
+
+import sys
+import threading
+import time
+import tracemalloc
+
+import psutil
+
+# getrusage is Unix-only; without it, the 'rusage' mode is unavailable
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+MEMORY_MODES = ("psutil", "rusage", "tracemalloc", "off")
+
+MB = 1024 * 1024
+
+
+def _proc_status_mb(field):
+    """Read a memory field such as VmRSS or VmHWM from /proc/self/status."""
+    try:
+        with open("/proc/self/status", "rb") as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    return None
+
+
+def _maxrss_mb():
+    """Peak RSS of this process according to getrusage."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return maxrss / MB if sys.platform == "darwin" else maxrss / 1024
+
+
+class MemoryTracker:
+    """
+    Run-level and per-file memory accounting in one of MEMORY_MODES.
+
+    start() and stop() bracket a run. In the per-file modes ('rusage' and
+    'tracemalloc'), begin_file(), end_stage(), and end_file() bracket the
+    stages of one file, and record() adds the returned figures to the run
+    summary; the latter may happen in another process than the former.
+
+    High-water marks are per process: with several files in flight, as
+    in AsyncPipeline, they include the memory of the other files.
+    """
+
+    def __init__(self, mode="psutil", include_children=False, interval_s=0.01):
+        if mode not in MEMORY_MODES:
+            raise ValueError(f"Unknown memory mode: {mode}")
+        if mode == "rusage" and resource is None:
+            raise ValueError("Memory mode rusage requires the Unix resource module")
+
+        self.mode = mode
+        self.per_file = mode in ("rusage", "tracemalloc")
+
+        # Only used in psutil mode
+        self.include_children = include_children
+        self.interval_s = interval_s
+
+        self.lock = threading.Lock()
+        self.monitoring = False
+        self.monitor_thread = None
+        self.started_tracing = False
+
+        # False once resetting the kernel's high-water mark failed
+        self.can_reset_peak = True
+
+        self.file_state = None
+        self._reset_stats()
+
+    def _reset_stats(self):
+        """Clear the figures of the previous run."""
+        self.run_peak_mb = 0.0
+        self.file_peaks = [0, 0.0, 0.0]     # count, total, max
+        self.stage_deltas = {}              # stage -> [count, total, max]
+
+    def start(self):
+        """Begin accounting for a run."""
+        self._reset_stats()
+
+        if self.mode == "psutil":
+            self.monitoring = True
+            self.monitor_thread = threading.Thread(target=self._monitor_memory, daemon=True)
+            self.monitor_thread.start()
+
+        elif self.mode == "tracemalloc" and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+
+    def stop(self):
+        """
+        End accounting for a run.
+
+        Returns:
+            The run's peak memory in MB, or None in 'off' mode.
+        """
+        if self.monitor_thread is not None:
+            self.monitoring = False
+            self.monitor_thread.join(timeout=0.1)
+            self.monitor_thread = None
+
+        if self.mode == "rusage":
+            self._update_peak(self._peak_rss_mb())
+
+        elif self.mode == "tracemalloc" and tracemalloc.is_tracing():
+            self._update_peak(tracemalloc.get_traced_memory()[1] / MB)
+
+            if self.started_tracing:
+                tracemalloc.stop()
+                self.started_tracing = False
+
+        return self.peak_mb()
+
+    def peak_mb(self):
+        """Peak memory of the current run so far, or None in 'off' mode."""
+        return None if self.mode == "off" else self.run_peak_mb
+
+    def current_mb(self):
+        """Current memory use in this mode's unit, or None if unavailable."""
+        if self.mode == "tracemalloc":
+            return tracemalloc.get_traced_memory()[0] / MB
+        if self.mode == "rusage":
+            return _proc_status_mb(b"VmRSS:")
+        if self.mode == "psutil":
+            return psutil.Process().memory_info().rss / MB
+        return None
+
+    def begin_file(self):
+        """Open the high-water window of one file."""
+        if self.mode == "tracemalloc":
+            tracemalloc.reset_peak()
+        elif self.mode == "rusage":
+            self._reset_peak_rss()
+
+        self.file_state = (self.current_mb(), {})
+
+    def end_stage(self, stage):
+        """Attribute the memory change since the previous stage to stage."""
+        last, stages = self.file_state
+        now = self.current_mb()
+
+        if now is not None and last is not None:
+            stages[stage] = now - last
+
+        self.file_state = (now, stages)
+
+    def end_file(self):
+        """
+        Close the high-water window of the current file.
+
+        Returns:
+            Dict with 'peak_mb', the file's high-water mark, and 'stages',
+            the memory change in MB per stage.
+        """
+        if self.mode == "tracemalloc":
+            peak_mb = tracemalloc.get_traced_memory()[1] / MB
+        else:
+            peak_mb = self._peak_rss_mb()
+
+        stages = self.file_state[1]
+        self.file_state = None
+
+        return {"peak_mb": peak_mb, "stages": stages}
+
+    def record(self, file_memory):
+        """Add the result of end_file() to the run summary."""
+        with self.lock:
+            peak_mb = file_memory["peak_mb"]
+            self._update_peak(peak_mb)
+
+            self.file_peaks[0] += 1
+            self.file_peaks[1] += peak_mb
+            self.file_peaks[2] = max(self.file_peaks[2], peak_mb)
+
+            for stage, delta_mb in file_memory["stages"].items():
+                self._add_stage(stage, delta_mb)
+
+    def record_stage(self, stage, delta_mb):
+        """Add a stage delta measured outside of a file window."""
+        if delta_mb is None:
+            return
+
+        with self.lock:
+            self._add_stage(stage, delta_mb)
+
+    def summary(self):
+        """
+        Summarize the run.
+
+        Returns:
+            Dict with 'mode', 'peak_mb', 'file_peak_mb' (count, mean_mb,
+            max_mb), and 'stage_delta_mb' mapping each stage to count,
+            mean_mb, and max_mb.
+        """
+        def stats(count, total, maximum):
+            return {
+                "count": count,
+                "mean_mb": total / count if count else 0.0,
+                "max_mb": maximum
+            }
+
+        with self.lock:
+            return {
+                "mode": self.mode,
+                "peak_mb": self.peak_mb(),
+                "file_peak_mb": stats(*self.file_peaks),
+                "stage_delta_mb": {
+                    stage: stats(*values) for stage, values in self.stage_deltas.items()
+                }
+            }
+
+    def _add_stage(self, stage, delta_mb):
+        values = self.stage_deltas.setdefault(stage, [0, 0.0, float("-inf")])
+        values[0] += 1
+        values[1] += delta_mb
+        values[2] = max(values[2], delta_mb)
+
+    def _update_peak(self, peak_mb):
+        if peak_mb is not None and peak_mb > self.run_peak_mb:
+            self.run_peak_mb = peak_mb
+
+    def _reset_peak_rss(self):
+        """
+        Reset the kernel's RSS high-water mark (Linux only).
+
+        Where this is not possible, per-file peaks are the process peak
+        so far.
+        """
+        if not self.can_reset_peak:
+            return
+
+        # The high-water mark of the previous window still counts for the run
+        self._update_peak(self._peak_rss_mb())
+
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            self.can_reset_peak = False
+
+    def _peak_rss_mb(self):
+        peak_mb = _proc_status_mb(b"VmHWM:")
+        return _maxrss_mb() if peak_mb is None else peak_mb
+
+    def _monitor_memory(self):
+        """Background thread for continuous peak memory tracking."""
+        process = psutil.Process()
+        while self.monitoring:
+            current_rss = process.memory_info().rss
+
+            # In parallel mode the worker processes count towards the footprint
+            if self.include_children:
+                for child in process.children(recursive=True):
+                    try:
+                        current_rss += child.memory_info().rss
+                    except psutil.Error:
+                        pass
+
+            current_mem = current_rss / MB
+            self.run_peak_mb = max(self.run_peak_mb, current_mem)
+            time.sleep(self.interval_s)
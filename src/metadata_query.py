@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+Query and export API for the metadata table of the XML measurement data pipeline.
+
+Filters metadata by device (geraet), operator, and timestamp range and
+streams the matching rows in (timestamp, id) order. Rows are read page by
+page with keyset pagination: every page continues after the (timestamp,
+id) of the previous one, so a page costs an index seek instead of
+skipping all earlier rows as with OFFSET. The indexes of migration 3 in
+db_init.py cover the filter columns followed by (timestamp, id).
+
+Several devices or operators are queried one index range each and merged
+in order. The SQL text only depends on which filters are set, so the
+statement cache of the connection reuses one prepared statement for all
+pages of a query.
+
+Exports to CSV, JSON Lines, and Parquet write page by page and never hold
+more than one page in memory. pyarrow is an optional dependency and is
+only required for Parquet export.
+
+Usage:
+    python metadata_query.py --geraet Sensor_A --since 2024-01-01 --format csv --output sensor_a.csv
+
+License: MIT
+"""
+
+import argparse
+import csv
+import heapq
+import itertools
+import json
+import sys
+from functools import lru_cache
+
+from db_init import connect
+
+
+DB_PATH = "../db/pipeline.db"
+PAGE_SIZE = 1000
+
+COLUMNS = ("id", "timestamp", "geraet", "operator", "parameter", "run_id")
+
+# Column positions of the keyset within a row
+_TIMESTAMP = COLUMNS.index("timestamp")
+_ID = COLUMNS.index("id")
+
+FORMATS = ("csv", "jsonl", "parquet")
+
+
+def _pyarrow():
+    """Import pyarrow on demand with a helpful error message."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("pyarrow is required for Parquet export (pip install pyarrow)") from e
+
+    return pyarrow
+
+
+def _values(value):
+    """Return the filter values of a single value or an iterable, or None."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [value]
+
+    return list(dict.fromkeys(value))
+
+
+@lru_cache(maxsize=None)
+def _page_sql(geraet, operator, start, end, after):
+    """
+    Build the page query for a combination of filters.
+
+    The arguments only tell whether a filter is set, so that every query
+    of the same shape shares one SQL text and prepared statement.
+    """
+    clauses = []
+
+    if geraet:
+        clauses.append("geraet = ?")
+    if operator:
+        clauses.append("operator = ?")
+    if start:
+        clauses.append("timestamp >= ?")
+    if end:
+        clauses.append("timestamp < ?")
+    if after:
+        clauses.append("(timestamp, id) > (?, ?)")
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    return f"""
+        SELECT {", ".join(COLUMNS)}
+        FROM metadata
+        {where}
+        ORDER BY timestamp, id
+        LIMIT ?
+    """
+
+
+def fetch_page(conn, geraet=None, operator=None, start=None, end=None, after=None, page_size=PAGE_SIZE):
+    """
+    Fetch one page of metadata rows for a single device and operator.
+
+    Args:
+        conn: Open SQLite connection.
+        geraet: Device to match, or None for all devices.
+        operator: Operator to match, or None for all operators.
+        start: Earliest timestamp (inclusive), ISO text.
+        end: Latest timestamp (exclusive), ISO text.
+        after: Keyset (timestamp, id) of the last row of the previous
+               page, or None for the first page.
+        page_size: Maximum number of rows.
+
+    Returns:
+        List of row tuples in COLUMNS order.
+    """
+    sql = _page_sql(geraet is not None, operator is not None, start is not None,
+                    end is not None, after is not None)
+
+    params = [v for v in (geraet, operator, start, end) if v is not None]
+    if after is not None:
+        params.extend(after)
+    params.append(page_size)
+
+    return conn.execute(sql, params).fetchall()
+
+
+def _iter_range(conn, geraet, operator, start, end, after, page_size):
+    """Yield the rows of one index range page by page."""
+    while True:
+        rows = fetch_page(conn, geraet, operator, start, end, after, page_size)
+        yield from rows
+
+        if len(rows) < page_size:
+            return
+
+        after = (rows[-1][_TIMESTAMP], rows[-1][_ID])
+
+
+def iter_rows(conn, geraet=None, operator=None, start=None, end=None, after=None, page_size=PAGE_SIZE):
+    """
+    Stream metadata rows matching the filters in (timestamp, id) order.
+
+    Args:
+        conn: Open SQLite connection.
+        geraet: Device, iterable of devices, or None for all devices.
+        operator: Operator, iterable of operators, or None for all operators.
+        start: Earliest timestamp (inclusive), ISO text.
+        end: Latest timestamp (exclusive), ISO text.
+        after: Keyset (timestamp, id) to continue after, e.g. the 'next'
+               cursor returned by query_page.
+        page_size: Number of rows read per query.
+
+    Yields:
+        Row tuples in COLUMNS order.
+    """
+    devices = _values(geraet)
+    operators = _values(operator)
+
+    # An empty selection matches nothing, None matches everything
+    if devices == [] or operators == []:
+        return
+
+    ranges = [
+        _iter_range(conn, device, op, start, end, after, page_size)
+        for device, op in itertools.product(devices or [None], operators or [None])
+    ]
+
+    if len(ranges) == 1:
+        yield from ranges[0]
+        return
+
+    yield from heapq.merge(*ranges, key=lambda row: (row[_TIMESTAMP], row[_ID]))
+
+
+def query_page(db_path=DB_PATH, geraet=None, operator=None, start=None, end=None,
+               after=None, page_size=PAGE_SIZE, profile=None):
+    """
+    Return one page of matching metadata and the cursor of the next page.
+
+    Args:
+        db_path: Path of the SQLite database.
+        geraet, operator, start, end: Filters, see iter_rows.
+        after: Cursor returned as 'next' by the previous call, or None.
+        page_size: Maximum number of rows.
+        profile: Performance profile, see db_init.resolve_profile.
+
+    Returns:
+        Dict with 'rows' (list of dicts) and 'next' (cursor to pass as
+        after, or None after the last page).
+    """
+    conn = connect(db_path, profile)
+
+    try:
+        rows = list(itertools.islice(
+            iter_rows(conn, geraet, operator, start, end,
+                      tuple(after) if after is not None else None, page_size),
+            page_size
+        ))
+    finally:
+        conn.close()
+
+    next_cursor = None
+    if len(rows) == page_size:
+        next_cursor = [rows[-1][_TIMESTAMP], rows[-1][_ID]]
+
+    return {
+        "rows": [dict(zip(COLUMNS, row)) for row in rows],
+        "next": next_cursor
+    }
+
+
+def _pages(rows, page_size):
+    """Group a row stream into lists of at most page_size rows."""
+    rows = iter(rows)
+
+    while True:
+        page = list(itertools.islice(rows, page_size))
+        if not page:
+            return
+        yield page
+
+
+def _write_csv(pages, output):
+    """Write pages as CSV with a header row."""
+    writer = csv.writer(output)
+    writer.writerow(COLUMNS)
+
+    count = 0
+    for page in pages:
+        writer.writerows(page)
+        count += len(page)
+
+    return count
+
+
+def _write_jsonl(pages, output):
+    """Write pages as one JSON object per line."""
+    count = 0
+    for page in pages:
+        output.writelines(
+            json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n" for row in page
+        )
+        count += len(page)
+
+    return count
+
+
+def _write_parquet(pages, path):
+    """Write pages as a Parquet file with one row group per page."""
+    pa = _pyarrow()
+
+    schema = pa.schema([
+        ("id", pa.string()),
+        ("timestamp", pa.string()),
+        ("geraet", pa.string()),
+        ("operator", pa.string()),
+        ("parameter", pa.string()),
+        ("run_id", pa.int64())
+    ])
+
+    count = 0
+    with pa.parquet.ParquetWriter(path, schema) as writer:
+        for page in pages:
+            columns = list(zip(*page))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema
+            ))
+            count += len(page)
+
+    return count
+
+
+def export_metadata(output_path, fmt="csv", db_path=DB_PATH, geraet=None, operator=None,
+                    start=None, end=None, page_size=PAGE_SIZE, profile=None):
+    """
+    Stream matching metadata rows into a file.
+
+    Args:
+        output_path: Output file path; '-' writes CSV or JSON Lines to stdout.
+        fmt: 'csv', 'jsonl', or 'parquet'.
+        db_path: Path of the SQLite database.
+        geraet, operator, start, end: Filters, see iter_rows.
+        page_size: Rows read per query and written per Parquet row group.
+        profile: Performance profile, see db_init.resolve_profile.
+
+    Returns:
+        Number of exported rows.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    if fmt == "parquet":
+        _pyarrow()
+        if output_path == "-":
+            raise ValueError("Parquet export needs an output file")
+
+    conn = connect(db_path, profile)
+
+    try:
+        pages = _pages(iter_rows(conn, geraet, operator, start, end, None, page_size), page_size)
+
+        if fmt == "parquet":
+            return _write_parquet(pages, output_path)
+
+        write = _write_csv if fmt == "csv" else _write_jsonl
+
+        if output_path == "-":
+            return write(pages, sys.stdout)
+
+        with open(output_path, "w", encoding="utf-8", newline="") as f:
+            return write(pages, f)
+
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query and export stored measurement metadata.")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite database path")
+    parser.add_argument("--geraet", nargs="+", help="devices to include")
+    parser.add_argument("--operator", nargs="+", help="operators to include")
+    parser.add_argument("--since", help="earliest timestamp (inclusive), e.g. 2024-01-01")
+    parser.add_argument("--until", help="latest timestamp (exclusive)")
+    parser.add_argument("--format", choices=FORMATS, default="csv", help="export format (default csv)")
+    parser.add_argument("--output", default="-", help="output file (default stdout)")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE, help="rows per query (default 1000)")
+    args = parser.parse_args()
+
+    count = export_metadata(
+        args.output,
+        args.format,
+        db_path=args.db,
+        geraet=args.geraet,
+        operator=args.operator,
+        start=args.since,
+        end=args.until,
+        page_size=args.page_size
+    )
+
+    if args.output != "-":
+        print(f"Exported {count} metadata rows to {args.output}")
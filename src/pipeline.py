@@ -7,150 +7,789 @@ with stage-level performance monitoring and provenance logging.
 License: MIT
 """
 
+import json
 import os
-import psutil
 import time
-import threading
-from validator import XMLValidator
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import suppress
+from datetime import datetime
+from itertools import islice
+from validator import MAX_ERRORS, XMLValidator
 from extractor import MetadataExtractor
-from provenance import log_provenance
+from ingest_index import IngestIndex
+from memory import MemoryTracker
+from provenance import (
+    close_provenance,
+    configure_provenance,
+    flush_provenance,
+    get_provenance_logger,
+    log_provenance
+)
+from sources import iter_archive, iter_xml_files, prefetch
+from storage import SQLiteBackend
+from worker import init_worker, process_documents, process_files, validate_and_extract
+
+
+def _flush_provenance():
+    """Write buffered provenance records; raise if the write fails."""
+    ok, err = flush_provenance()
+    if not ok:
+        # The records stay buffered and are retried by the next flush
+        raise RuntimeError(f"Writing provenance records failed: {err}")
+
+
+def _document_bytes(content):
+    """
+    Return the content of an in-memory document as bytes.
+
+    Text, as delivered by many message queues, is encoded as UTF-8.
+
+    Raises:
+        TypeError: If content is neither bytes-like, text, nor a file-like
+                   object returning one of them.
+    """
+    if hasattr(content, "read"):
+        content = content.read()
+    if isinstance(content, str):
+        return content.encode("utf-8")
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        return bytes(content)
+
+    raise TypeError(f"unsupported document content of type {type(content).__name__}")
 
 
 class Pipeline:
+    # Validators use the process-wide schema cache; see StagedPipeline
+    shared_schemas = True
+
     def __init__(self,
                  xml_dir="../xml/",
                  schema_path="../schema/schema.xsd",
                  db_path="../db/pipeline.db",
                  schema_version="1.0",
-                 pipeline_version="0.9.1"):
+                 pipeline_version="0.9.1",
+                 schemas=None,
+                 prevalidation=None,
+                 max_validation_errors=MAX_ERRORS,
+                 format_validation_errors=True,
+                 compact_provenance=False,
+                 storage=None,
+                 insert_batch_size=None,
+                 insert_flush_ms=1000.0,
+                 workers=1,
+                 streaming=False,
+                 queue_size=1024,
+                 progress_every=None,
+                 incremental=False,
+                 validate=True,
+                 store_values=False,
+                 db_profile=None,
+                 profiler=None,
+                 memory_mode="psutil"):
 
         self.xml_dir = xml_dir
+        self.schema_path = schema_path
         self.schema_version = schema_version
+
+        # Further schema versions {version: xsd_path}, routed by the
+        # version attribute of each document (see schema_registry)
+        self.schemas = schemas
+
+        # Fast-fail structural checks before the XSD assertion, see
+        # prevalidation.resolve_rules; None disables them
+        self.prevalidation = prevalidation
+
+        # Schema errors captured per document, and whether their messages
+        # are formatted (see XMLValidator)
+        self.max_validation_errors = max_validation_errors
+        self.format_validation_errors = format_validation_errors
+
+        # One provenance row per file instead of one per step, see
+        # provenance.CompactProvenanceLogger
+        self.compact_provenance = compact_provenance
         self.pipeline_version = pipeline_version
         self.db_path = db_path
 
-        # Pass version information to validator and extractor
-        self.validator = XMLValidator(
-            schema_path=schema_path,
-            schema_version=schema_version,
-            pipeline_version=pipeline_version
-        )
+        # Storage backend of metadata, provenance, and runs (see storage.py);
+        # None writes to the SQLite database at db_path. The ingest index
+        # always stays in that database.
+        self.storage = storage
+        if compact_provenance and storage is not None and not isinstance(storage, SQLiteBackend):
+            raise ValueError("Compact provenance requires the SQLite storage backend")
+
+        # SQLite performance profile of all write connections (see db_init)
+        self.db_profile = db_profile
+
+        # Batched persistence: None keeps one commit per file
+        self.insert_batch_size = insert_batch_size
+        self.insert_flush_ms = insert_flush_ms
+
+        # Number of worker processes for validation and extraction
+        self.workers = max(1, int(workers))
+
+        # Streaming ingestion: lazy directory scan behind a bounded queue
+        self.streaming = streaming
+        self.queue_size = queue_size
+        self.progress_every = progress_every
+
+        # Incremental re-ingestion: skip files unchanged since their last success
+        self.incremental = incremental
+
+        # Optional profiler.StageProfiler for per-stage latency histograms
+        self.profiler = profiler
+
+        # Per-run state, set up by _start_run()
+        self.metadata_writer = None
+        self.ingest_index = None
+        self.run_start = None
+        self.run_id = None
+
+        # Pass version information to validator and extractor. Without
+        # validation, metadata is read with the streaming extractor.
+        self.validate = validate
+        self.validator = None
+        if validate:
+            self.validator = XMLValidator(
+                schema_path=schema_path,
+                schema_version=schema_version,
+                pipeline_version=pipeline_version,
+                schemas=schemas,
+                prevalidation=prevalidation,
+                max_errors=max_validation_errors,
+                format_errors=format_validation_errors,
+                shared_schemas=self.shared_schemas
+            )
 
         self.extractor = MetadataExtractor(
             db_path=db_path,
-            pipeline_version=pipeline_version
+            pipeline_version=pipeline_version,
+            store_values=store_values,
+            db_profile=db_profile,
+            backend=storage
         )
 
-        # Peak memory tracking
-        self.peak_memory = 0
-        self.monitoring = False
-
-    def _monitor_memory(self):
-        """Background thread for continuous peak memory tracking."""
-        process = psutil.Process()
-        while self.monitoring:
-            current_mem = process.memory_info().rss / (1024 * 1024)  # in MB
-            self.peak_memory = max(self.peak_memory, current_mem)
-            time.sleep(0.01)  # Sample every 10 ms
+        # Memory accounting, see memory.MEMORY_MODES. In parallel mode the
+        # worker processes count towards the sampled footprint.
+        self.memory = MemoryTracker(memory_mode, include_children=self.workers > 1)
 
     def run(self, file_list=None):
         """
         Process all XML files through validation, extraction, and persistence.
 
         Args:
-            file_list: Optional list of filenames. If None, all XML files
-                       in xml_dir are processed.
+            file_list: Optional list or iterable of filenames. If None, all
+                       XML files in xml_dir are processed. In streaming mode
+                       xml_dir is scanned lazily and files are processed
+                       while the scan is still running.
 
         Returns:
-            Dict with total, successful, failed counts and peak memory in MB.
+            Dict with total, successful, failed, and skipped counts and peak
+            memory in MB. Skipped files are unchanged files found in the
+            ingest index (incremental mode only) and count towards total.
+            With a profiler, 'stage_latency_ms' holds its summary. In the
+            per-file memory modes, 'memory' holds MemoryTracker.summary()
+            and peak_memory_mb is the highest per-file high-water mark.
+            'run_id' is the id of the run's row in the runs table, which
+            all provenance and metadata rows of the run refer to. If the
+            run raises, its row is marked 'failed'.
+        """
+
+        xml_files = self._resolve_files(file_list)
+        counts = None
+
+        try:
+            counts = self._start_run()
+            work_items = self._work_items(xml_files, counts)
+
+            if self.workers > 1:
+                if hasattr(xml_files, "__len__"):
+                    chunksize = max(1, min(64, len(xml_files) // (self.workers * 4)))
+                else:
+                    chunksize = 32
+                outcomes = self._iter_parallel(work_items, chunksize)
+            else:
+                outcomes = self._iter_sequential(work_items)
+
+            for filename, outcome in outcomes:
+                self._settle(counts, self._persist(filename, outcome))
+
+            return self._finish_run(counts)
+
+        finally:
+            self._abort_run(counts)
+
+    def run_documents(self, documents):
+        """
+        Process in-memory XML documents without a filesystem round trip.
+
+        Args:
+            documents: Iterable of (name, content) pairs. content is a
+                       bytes-like object, text (encoded as UTF-8), or a
+                       file-like object; name is recorded as xml_file in
+                       provenance. The iterable is consumed lazily, so it
+                       can be fed from a queue.
+
+        Returns:
+            Same dict as run(). The ingest index is not consulted, as
+            documents have no path, size, or mtime. Documents whose
+            content cannot be read are logged and counted as failed.
+        """
+        counts = None
+
+        try:
+            counts = self._start_run()
+            items = self._document_items(documents, counts)
+
+            if self.workers > 1:
+                outcomes = self._iter_parallel(items, 32, documents=True)
+            else:
+                outcomes = (
+                    (name, validate_and_extract(
+                        self.validator, self.extractor, name, xml_bytes, self._file_memory(), name
+                    ))
+                    for name, xml_bytes in items
+                )
+
+            for name, outcome in outcomes:
+                outcome["fingerprint"] = None
+                self._settle(counts, self._persist(name, outcome))
+
+            return self._finish_run(counts)
+
+        finally:
+            self._abort_run(counts)
+
+    def run_archive(self, archive_path):
+        """
+        Process the XML members of an archive without extracting it.
+
+        Supports tar (optionally compressed), zip, and length-prefixed
+        XML streams, see sources.iter_archive. Members are read one after
+        another, and each member name is recorded as xml_file.
+
+        Returns:
+            Same dict as run_documents().
+        """
+        print(f"Reading archive: {archive_path}")
+        return self.run_documents(iter_archive(archive_path))
+
+    def _resolve_files(self, file_list):
         """
+        Determine the filenames to process.
 
+        Returns:
+            A list of filenames, or an iterable in streaming mode.
+        """
         if file_list is None:
-            xml_files = [f for f in os.listdir(self.xml_dir) if f.endswith(".xml")]
+            if self.streaming:
+                xml_files = iter_xml_files(self.xml_dir)
+            else:
+                xml_files = [f for f in os.listdir(self.xml_dir) if f.endswith(".xml")]
         else:
             xml_files = file_list
 
-        print(f"Found XML files: {len(xml_files)}")
+        if hasattr(xml_files, "__len__"):
+            print(f"Found XML files: {len(xml_files)}")
+        else:
+            print(f"Streaming XML files from: {self.xml_dir}")
 
-        successful_runs = 0
-        failed_runs = 0
+        # Bounded queue between file enumeration and processing
+        if self.streaming:
+            xml_files = prefetch(xml_files, self.queue_size)
 
-        # Start memory monitoring
-        self.peak_memory = 0
-        self.monitoring = True
-        monitor_thread = threading.Thread(target=self._monitor_memory, daemon=True)
-        monitor_thread.start()
+        return xml_files
 
-        for filename in xml_files:
-            xml_path = os.path.join(self.xml_dir, filename)
+    def _start_run(self):
+        """
+        Prepare provenance, memory monitoring, and persistence for a run.
+
+        Returns:
+            Dict of run counters, updated by _settle() and _work_items().
+            Callers must call _finish_run() on success and _abort_run() in
+            any case.
+        """
+        # Route buffered provenance records to this pipeline's storage
+        logger = get_provenance_logger()
+        if self.storage is not None:
+            reconfigure = logger.backend is not self.storage
+        else:
+            reconfigure = (not isinstance(logger.backend, SQLiteBackend) or logger.db_path != self.db_path
+                           or logger.db_profile != self.db_profile)
+
+        if reconfigure or logger.compact != self.compact_provenance:
+            configure_provenance(
+                db_path=self.db_path,
+                db_profile=self.db_profile,
+                compact=self.compact_provenance,
+                backend=self.storage
+            )
+
+        get_provenance_logger().profiler = self.profiler
+
+        # Run record; provenance and metadata rows written until
+        # _finish_run() carry its id
+        self.run_id = self._create_run()
+        get_provenance_logger().run_id = self.run_id
+        self.extractor.run_id = self.run_id
+
+        # Start memory accounting
+        self.memory.start()
+
+        # Optional batched persistence through the extractor's storage backend
+        self.metadata_writer = None
+        if self.insert_batch_size:
+            self.metadata_writer = self.extractor.batch_writer(
+                batch_size=self.insert_batch_size,
+                flush_interval_ms=self.insert_flush_ms
+            )
+
+        # Optional ingest index for skipping unchanged files
+        self.ingest_index = None
+        if self.incremental:
+            self.ingest_index = IngestIndex(
+                db_path=self.db_path,
+                schema_version=self.schema_version,
+                pipeline_version=self.pipeline_version,
+                db_profile=self.db_profile
+            )
+
+        self.run_start = time.perf_counter()
+
+        return {"total": 0, "successful": 0, "failed": 0, "skipped": 0}
+
+    def _settle(self, counts, settled, processed=1):
+        """
+        Add the result of one persistence call to the run counters.
+
+        Args:
+            counts: Run counters from _start_run().
+            settled: Tuple of (successful, failed) returned by _persist().
+            processed: Number of files handed to _persist() by this call.
+        """
+        counts["total"] += processed
+        counts["successful"] += settled[0]
+        counts["failed"] += settled[1]
+
+        if processed and self.progress_every and counts["total"] % self.progress_every == 0:
+            self._report_progress(counts)
+
+    def _finish_run(self, counts):
+        """
+        Flush all pending writes and stop monitoring.
+
+        Returns:
+            The result dict of run().
+        """
+        if self.metadata_writer is not None:
+            self._settle(counts, self._complete_batched(self.metadata_writer.close()), processed=0)
+            self.metadata_writer = None
+
+        if self.ingest_index is not None:
+            self.ingest_index.close()
+            self.ingest_index = None
+
+        # Write out buffered provenance so the run is complete in the database
+        _flush_provenance()
+        get_provenance_logger().profiler = None
+        get_provenance_logger().run_id = None
+        self.extractor.run_id = None
+
+        # Stop memory accounting
+        peak_memory = self.memory.stop()
+        runtime = time.perf_counter() - self.run_start
+
+        result = {
+            "total": counts["total"],
+            "successful": counts["successful"],
+            "failed": counts["failed"],
+            "skipped": counts["skipped"],
+            "peak_memory_mb": peak_memory,  # True peak across the entire batch
+            "run_id": self.run_id
+        }
 
-            # Start per-file performance tracking
-            pipeline_start = time.perf_counter()
+        if self.profiler is not None:
+            result["stage_latency_ms"] = self.profiler.summary()
 
-            metrics = {}
+        if self.memory.per_file:
+            result["memory"] = self.memory.summary()
 
-            # 1. Validation with internal provenance logging
-            val_start = time.perf_counter()
-            validation_result = self.validator.validate(xml_path)
-            metrics['validation_time_ms'] = (time.perf_counter() - val_start) * 1000
+        self._complete_run(result, runtime)
+        self.run_id = None
 
-            if not validation_result["valid"]:
-                failed_runs += 1
+        # Release the default connections of metadata and provenance
+        # between runs, so that the database can be replaced; a given
+        # backend stays with its owner
+        if self.storage is None:
+            self.extractor.backend.close()
+            close_provenance()
+
+        return result
+
+    def _abort_run(self, counts=None):
+        """
+        Release the resources of a run that raised and mark it as failed.
+
+        Files queued on the batch writer are still committed if possible.
+        Does nothing once _finish_run() has completed the run. Errors of
+        the cleanup are suppressed, so that the caller re-raises the
+        error that ended the run.
+
+        Args:
+            counts: Run counters from _start_run(), or None if it failed.
+        """
+        if self.run_id is None:
+            return
+
+        if self.metadata_writer is not None:
+            writer = self.metadata_writer
+            self.metadata_writer = None
+            with suppress(Exception):
+                settled = self._complete_batched(writer.close())
+                if counts is not None:
+                    self._settle(counts, settled, processed=0)
+
+        if self.ingest_index is not None:
+            with suppress(Exception):
+                self.ingest_index.close()
+            self.ingest_index = None
+
+        # Records of the files processed so far still belong to this run
+        flush_provenance()
+        logger = get_provenance_logger()
+        logger.profiler = None
+        logger.run_id = None
+        self.extractor.run_id = None
+
+        values = {
+            "status": "failed",
+            "finished_at": datetime.now().isoformat(),
+            "peak_memory_mb": self.memory.stop()
+        }
+        if counts is not None:
+            values.update({key: counts[key] for key in ("total", "successful", "failed", "skipped")})
+            values["runtime_ms"] = (time.perf_counter() - self.run_start) * 1000
+
+        with suppress(Exception):
+            self.extractor.backend.complete_run(self.run_id, values)
+        self.run_id = None
+
+        if self.storage is None:
+            with suppress(Exception):
+                self.extractor.backend.close()
+            close_provenance()
+
+    def _run_config(self):
+        """Settings of this pipeline, stored with each run."""
+        return {
+            "xml_dir": self.xml_dir,
+            "schema_path": self.schema_path,
+            "schemas": self.schemas,
+            "workers": self.workers,
+            "streaming": self.streaming,
+            "incremental": self.incremental,
+            "validate": self.validate,
+            "prevalidation": self.prevalidation,
+            "store_values": self.extractor.store_values,
+            "insert_batch_size": self.insert_batch_size,
+            "db_profile": self.db_profile,
+            "memory_mode": self.memory.mode,
+            "compact_provenance": self.compact_provenance,
+            "storage": type(self.extractor.backend).__name__,
+            "max_validation_errors": self.max_validation_errors,
+            "format_validation_errors": self.format_validation_errors
+        }
+
+    def _create_run(self):
+        """Insert a runs row with status 'running' and return its id."""
+        return self.extractor.backend.create_run({
+            "status": "running",
+            "started_at": datetime.now().isoformat(),
+            "pipeline_version": self.pipeline_version,
+            "schema_version": self.schema_version,
+            "config": json.dumps(self._run_config())
+        })
+
+    def _complete_run(self, result, runtime):
+        """Record the end time, counts, throughput, and peak memory of the run."""
+        self.extractor.backend.complete_run(self.run_id, {
+            "status": "completed",
+            "finished_at": datetime.now().isoformat(),
+            "total": result["total"],
+            "successful": result["successful"],
+            "failed": result["failed"],
+            "skipped": result["skipped"],
+            "runtime_ms": runtime * 1000,
+            "throughput_files_s": result["successful"] / runtime if runtime > 0 else 0,
+            "peak_memory_mb": result["peak_memory_mb"]
+        })
+
+    def _work_items(self, xml_files, counts):
+        """
+        Pair filenames with their ingest index fingerprint.
+
+        In incremental mode, files that are unchanged according to the
+        ingest index are counted as skipped and not yielded.
+
+        Yields:
+            Tuples of (filename, fingerprint) for files to process.
+        """
+        for filename in xml_files:
+            if self.ingest_index is None:
+                yield filename, None
                 continue
 
-            # 2. Metadata extraction with internal provenance logging
-            ext_start = time.perf_counter()
-            meta = self.extractor.extract_metadata(xml_path)
-            metrics['extraction_time_ms'] = (time.perf_counter() - ext_start) * 1000
+            skip, fingerprint = self.ingest_index.check(os.path.join(self.xml_dir, filename))
 
-            if not meta["success"]:
-                failed_runs += 1
+            if skip:
+                counts["total"] += 1
+                counts["skipped"] += 1
                 continue
 
-            measurement_id = meta["data"]["id"]
+            yield filename, fingerprint
+
+    def _document_items(self, documents, counts):
+        """
+        Read the content of in-memory documents.
 
-            # 3. Persist metadata to database with internal provenance logging
-            pers_start = time.perf_counter()
-            ok, err = self.extractor.insert_metadata(meta["data"], xml_path)
-            metrics['persistence_time_ms'] = (time.perf_counter() - pers_start) * 1000
+        A document whose content cannot be read is logged as a failed
+        validation and counted as failed, instead of aborting the run.
 
-            if not ok:
-                failed_runs += 1
+        Yields:
+            Tuples of (name, xml_bytes).
+        """
+        for name, content in documents:
+            try:
+                xml_bytes = _document_bytes(content)
+            except (TypeError, ValueError, OSError) as e:
+                log_provenance(
+                    measurement_id=name,
+                    step="validation",
+                    status="error",
+                    message=f"Unreadable document: {e}",
+                    xml_file=name,
+                    pipeline_version=self.pipeline_version
+                )
+                counts["total"] += 1
+                counts["failed"] += 1
                 continue
 
-            # 4. Compute total pipeline metrics
-            metrics['processing_time_ms'] = (time.perf_counter() - pipeline_start) * 1000
+            yield name, xml_bytes
 
-            # Peak memory is tracked by the background thread
-            metrics['memory_peak_mb'] = self.peak_memory
+    def _iter_sequential(self, work_items):
+        """
+        Validate and extract files one after another in this process.
 
-            # 5. Log pipeline completion with full stage metrics
-            log_provenance(
-                measurement_id=measurement_id,
-                step="pipeline",
-                status="success",
-                message="processing completed",
-                xml_file=filename,
-                pipeline_version=self.pipeline_version,
-                processing_time_ms=metrics['processing_time_ms'],
-                memory_peak_mb=metrics['memory_peak_mb'],
-                validation_time_ms=metrics['validation_time_ms'],
-                extraction_time_ms=metrics['extraction_time_ms'],
-                persistence_time_ms=metrics['persistence_time_ms']
+        Yields:
+            Tuples of (filename, outcome) in the order of work_items.
+        """
+        for filename, fingerprint in work_items:
+            outcome = validate_and_extract(
+                self.validator, self.extractor, os.path.join(self.xml_dir, filename),
+                memory=self._file_memory()
             )
+            outcome["fingerprint"] = fingerprint
+            yield filename, outcome
 
-            successful_runs += 1
+    def _iter_parallel(self, work_items, chunksize, documents=False):
+        """
+        Validate and extract files in a process pool.
 
-        # Stop memory monitoring
-        self.monitoring = False
-        monitor_thread.join(timeout=0.1)
+        Work items are (filename, fingerprint) pairs, or (name, xml_bytes)
+        pairs if documents is True; document contents are sent to the
+        workers instead of paths.
 
-        return {
-            "total": len(xml_files),
-            "successful": successful_runs,
-            "failed": failed_runs,
-            "peak_memory_mb": self.peak_memory  # True peak across the entire batch
-        }
+        Files are submitted in chunks, and at most two chunks per worker
+        are in flight, so memory stays bounded for arbitrarily long inputs.
+        Each worker compiles the schema once (see worker.init_worker). The
+        provenance records captured by the workers are handed to the
+        shared logger of this process, which remains the only writer.
+
+        Yields:
+            Tuples of (filename, outcome) in the order of work_items.
+        """
+        # Nothing buffered in this process may be inherited by forked workers
+        _flush_provenance()
+
+        pending = deque()
+
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=init_worker,
+            initargs=self._worker_initargs()
+        ) as pool:
+            logger = get_provenance_logger()
+
+            while True:
+                chunk = list(islice(work_items, chunksize))
+
+                if chunk:
+                    if documents:
+                        future = pool.submit(process_documents, chunk)
+                    else:
+                        paths = [os.path.join(self.xml_dir, filename) for filename, _ in chunk]
+                        future = pool.submit(process_files, paths)
+
+                    pending.append((chunk, future))
+
+                    if len(pending) < self.workers * 2:
+                        continue
+
+                if not pending:
+                    break
+
+                chunk, future = pending.popleft()
+                for (filename, extra), outcome in zip(chunk, future.result()):
+                    logger.log_records(outcome.pop("provenance"))
+                    outcome["fingerprint"] = None if documents else extra
+                    yield filename, outcome
+
+    def _worker_initargs(self):
+        """Arguments for worker.init_worker in process pools."""
+        return (
+            self.schema_path,
+            self.schema_version,
+            self.pipeline_version,
+            self.db_path,
+            self.validate,
+            self.extractor.store_values,
+            self.memory.mode,
+            self.schemas,
+            self.prevalidation,
+            self.max_validation_errors,
+            self.format_validation_errors
+        )
+
+    def _file_memory(self):
+        """Memory tracker for validate_and_extract, if files are accounted."""
+        return self.memory if self.memory.per_file else None
+
+    def _report_progress(self, counts):
+        """Print the number of processed files and the current throughput."""
+        elapsed = time.perf_counter() - self.run_start
+        rate = counts["total"] / elapsed if elapsed > 0 else 0
+
+        print(
+            f"  Processed {counts['total']} files "
+            f"({counts['successful']} successful, {counts['failed']} failed, "
+            f"{rate:.2f} files/s)"
+        )
+
+    def _persist(self, filename, outcome, writer=None):
+        """
+        Persist the metadata of one processed file.
+
+        In batched mode the record is queued on the metadata writer, and
+        the counts refer to the files whose batch was committed.
+
+        Args:
+            filename: Filename as listed in the processed batch.
+            outcome: Result of worker.validate_and_extract.
+            writer: Batch writer to queue the record on instead of
+                    self.metadata_writer.
+
+        Returns:
+            Tuple of (successful, failed) counts settled by this call.
+        """
+        if self.profiler is not None:
+            self.profiler.record_stages(outcome["stages"])
+
+        metrics = outcome["metrics"]
+
+        if outcome["memory"] is not None:
+            self.memory.record(outcome["memory"])
+            metrics['memory_peak_mb'] = outcome["memory"]["peak_mb"]
+
+        if outcome["data"] is None:
+            return 0, 1
+
+        # 3. Persist metadata to database with internal provenance logging
+        if writer is None:
+            writer = self.metadata_writer
+
+        if writer is not None:
+            # Batched: stage timings are completed once the batch commits
+            completed = writer.add(
+                outcome["data"], outcome["xml_path"], context=(filename, outcome), xml_file=outcome["xml_file"]
+            )
+            return self._complete_batched(completed)
+
+        mem_before = self.memory.current_mb() if self.memory.per_file else None
+        pers_start = time.perf_counter()
+        ok, err = self.extractor.insert_metadata(outcome["data"], outcome["xml_path"], outcome["xml_file"])
+        metrics['persistence_time_ms'] = (time.perf_counter() - pers_start) * 1000
+
+        if mem_before is not None:
+            self.memory.record_stage("db_insert", self.memory.current_mb() - mem_before)
+
+        if self.profiler is not None:
+            self.profiler.record("db_insert", metrics['persistence_time_ms'])
+
+        if not ok:
+            return 0, 1
+
+        # 4. Compute total pipeline metrics
+        metrics['processing_time_ms'] += metrics['persistence_time_ms']
+
+        # 5. Log pipeline completion with full stage metrics
+        self._log_pipeline_success(outcome["data"]["id"], filename, metrics)
+        self._record_ingested(outcome)
+
+        return 1, 0
+
+    def _complete_batched(self, results):
+        """
+        Finish files whose metadata was committed by the batch writer.
+
+        Returns:
+            Tuple of (successful, failed) counts for the given results.
+        """
+        successful = 0
+        failed = 0
+
+        for result in results:
+            if not result["success"]:
+                failed += 1
+                continue
+
+            filename, outcome = result["context"]
+            metrics = outcome["metrics"]
+            metrics['persistence_time_ms'] = result["persistence_time_ms"]
+            metrics['processing_time_ms'] += result["persistence_time_ms"]
+
+            if self.profiler is not None:
+                self.profiler.record("db_insert", result["persistence_time_ms"])
+
+            self._log_pipeline_success(result["data"]["id"], filename, metrics)
+            self._record_ingested(outcome)
+            successful += 1
+
+        return successful, failed
+
+    def _record_ingested(self, outcome):
+        """Add a successfully persisted file to the ingest index."""
+        if self.ingest_index is not None:
+            self.ingest_index.record(outcome.get("fingerprint"), outcome["data"]["id"])
+
+    def _log_pipeline_success(self, measurement_id, filename, metrics):
+        """Log pipeline completion with full stage metrics."""
+        # Per-file high-water mark if accounted, else the run's peak so far
+        if metrics.get('memory_peak_mb') is None:
+            metrics['memory_peak_mb'] = self.memory.peak_mb()
+
+        log_provenance(
+            measurement_id=measurement_id,
+            step="pipeline",
+            status="success",
+            message="processing completed",
+            xml_file=filename,
+            pipeline_version=self.pipeline_version,
+            processing_time_ms=metrics['processing_time_ms'],
+            memory_peak_mb=metrics['memory_peak_mb'],
+            validation_time_ms=metrics['validation_time_ms'],
+            extraction_time_ms=metrics['extraction_time_ms'],
+            persistence_time_ms=metrics['persistence_time_ms']
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Fast-fail pre-validation for the XML measurement data pipeline.
+
+Rejects obviously broken documents before they are parsed into a tree
+and asserted against the XSD schema. The checks are:
+- an optional size limit, taken from the file size or the byte length
+- the tag of the root element
+- the presence of required elements, given as paths below the root
+
+Elements are read with iterparse and parsing stops as soon as all
+required elements have started, so for well-formed documents only their
+head is read, however large the sensor list is. Passing pre-validation
+does not make a document valid; the full XSD assertion still follows.
+
+License: MIT
+"""
+
+import io
+import os
+
+from lxml import etree
+
+
+# Structure required by schema.xsd up to the start of the sensor list
+DEFAULT_RULES = {
+    "root_tag": "measurement",
+    "required": (
+        "metadata/measurement_id",
+        "metadata/timestamp",
+        "metadata/geraet",
+        "data/sensoren"
+    ),
+    "max_bytes": None
+}
+
+
+def resolve_rules(rules):
+    """
+    Resolve a pre-validation setting to a complete rule dict.
+
+    Args:
+        rules: None (pre-validation disabled), True (DEFAULT_RULES), or a
+               dict overriding some of the DEFAULT_RULES keys.
+
+    Returns:
+        Rule dict, or None if pre-validation is disabled.
+    """
+    if rules is None or rules is False:
+        return None
+    if rules is True:
+        return dict(DEFAULT_RULES)
+
+    unknown = set(rules) - set(DEFAULT_RULES)
+    if unknown:
+        raise ValueError(f"Unknown pre-validation rules: {', '.join(sorted(unknown))}")
+
+    return {**DEFAULT_RULES, **rules}
+
+
+class PreValidator:
+    """Cheap structural checks run before the XSD assertion."""
+
+    def __init__(self, rules=True):
+        self.rules = resolve_rules(rules) or dict(DEFAULT_RULES)
+        self.root_tag = self.rules["root_tag"]
+        self.required = frozenset(self.rules["required"])
+        self.max_bytes = self.rules["max_bytes"]
+
+    def check(self, source):
+        """
+        Check a document against the rules.
+
+        Args:
+            source: Path of the XML file, or XML bytes.
+
+        Returns:
+            List of error messages; empty if the document passed.
+        """
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            size = len(source)
+        else:
+            try:
+                size = os.path.getsize(source)
+            except OSError as e:
+                return [f"Pre-validation failed: {e}"]
+
+        if self.max_bytes is not None and size > self.max_bytes:
+            return [f"Pre-validation failed: document has {size} bytes, limit is {self.max_bytes}"]
+
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return self._check_structure(io.BytesIO(source))
+
+        with open(source, "rb") as f:
+            return self._check_structure(f)
+
+    def _check_structure(self, f):
+        """Stream the elements of a document until all required paths started."""
+        missing = set(self.required)
+        path = []
+
+        try:
+            for event, element in etree.iterparse(f, events=("start", "end")):
+                if event == "end":
+                    path.pop()
+                    element.clear()
+                    continue
+
+                tag = element.tag.rpartition("}")[2]
+
+                if not path and self.root_tag is not None and tag != self.root_tag:
+                    return [
+                        f"Pre-validation failed: root element is <{tag}>, expected <{self.root_tag}>"
+                    ]
+
+                path.append(tag)
+                missing.discard("/".join(path[1:]))
+
+                if not missing:
+                    return []
+
+        except etree.XMLSyntaxError as e:
+            return [f"Pre-validation failed: {e}"]
+
+        if missing:
+            return [
+                f"Pre-validation failed: missing required element {name}"
+                for name in sorted(missing)
+            ]
+
+        return []
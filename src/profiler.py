@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+In-process stage profiler for the XML measurement data pipeline.
+Collects per-stage latency histograms (pre-validation, parse, schema
+assertion, extraction, database insert, and provenance write) in memory,
+so that tail latencies can be inspected without any additional database
+writes.
+
+Latencies are counted in log-linear buckets with a relative error of
+about 1.6 %, which keeps recording constant-time and the memory use
+independent of the number of processed files.
+
+License: MIT
+"""
+
+import csv
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Stages in pipeline order
+STAGES = ("prevalidate", "parse", "schema_assert", "extraction", "db_insert", "provenance_write")
+
+# Linear sub-buckets per power of two
+SUB_BUCKETS = 64
+
+SUMMARY_FIELDS = ("count", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+
+
+class LatencyHistogram:
+    """Log-linear histogram of latencies in milliseconds."""
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value_ms):
+        """Count one latency."""
+        if value_ms > 0:
+            mantissa, exponent = math.frexp(value_ms)
+            key = exponent * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+        else:
+            value_ms = 0.0
+            key = None
+
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+        self.count += 1
+        self.total += value_ms
+        if value_ms > self.max:
+            self.max = value_ms
+
+    def merge(self, other):
+        """Add the counts of another histogram."""
+        for key, n in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + n
+
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """
+        Return the latency at quantile q (0..1).
+
+        The result is the midpoint of the bucket holding the quantile,
+        capped at the largest recorded value.
+        """
+        if not self.count:
+            return 0.0
+
+        rank = max(1, math.ceil(q * self.count))
+        seen = self.buckets.get(None, 0)
+        if seen >= rank:
+            return 0.0
+
+        for key in sorted(k for k in self.buckets if k is not None):
+            seen += self.buckets[key]
+            if seen >= rank:
+                exponent, sub = divmod(key, SUB_BUCKETS)
+                low = math.ldexp(0.5 + sub / (2 * SUB_BUCKETS), exponent)
+                high = math.ldexp(0.5 + (sub + 1) / (2 * SUB_BUCKETS), exponent)
+                return min((low + high) / 2, self.max)
+
+        return self.max
+
+    def summary(self):
+        """Return count, mean, p50, p95, p99, and max."""
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count if self.count else 0.0,
+            "p50_ms": self.quantile(0.50),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": self.max
+        }
+
+
+class StageProfiler:
+    """
+    Per-stage latency histograms.
+
+    Pass an instance to Pipeline(profiler=...) to record the stages of
+    every processed file. Recording is thread-safe, so the worker threads
+    of a stage (see staged_pipeline.py) may share one histogram.
+    """
+
+    def __init__(self, stages=STAGES):
+        self.histograms = {stage: LatencyHistogram() for stage in stages}
+        self.lock = threading.Lock()
+
+    def record(self, stage, duration_ms):
+        """Record one latency of a stage; None is ignored."""
+        if duration_ms is None:
+            return
+
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms.setdefault(stage, LatencyHistogram())
+
+            histogram.record(duration_ms)
+
+    def record_stages(self, stage_times):
+        """Record a dict of stage name to latency in ms."""
+        for stage, duration_ms in stage_times.items():
+            self.record(stage, duration_ms)
+
+    @contextmanager
+    def time(self, stage):
+        """Context manager recording the duration of its block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - start) * 1000)
+
+    def merge(self, other):
+        """Add the histograms of another profiler."""
+        for stage, histogram in other.histograms.items():
+            self.histograms.setdefault(stage, LatencyHistogram()).merge(histogram)
+
+    def reset(self):
+        """Discard all recorded latencies."""
+        self.histograms = {stage: LatencyHistogram() for stage in self.histograms}
+
+    def summary(self):
+        """
+        Summarize all stages with recorded latencies.
+
+        Returns:
+            Dict mapping stage name to a dict with count, mean_ms, p50_ms,
+            p95_ms, p99_ms, and max_ms.
+        """
+        return {
+            stage: histogram.summary()
+            for stage, histogram in self.histograms.items()
+            if histogram.count
+        }
+
+    def format_summary(self):
+        """Return the summary as a fixed-width text table."""
+        lines = [
+            f"{'Stage':<18}{'Count':>9}{'Mean':>11}{'p50':>11}{'p95':>11}{'p99':>11}{'Max':>11}"
+        ]
+
+        for stage, s in self.summary().items():
+            lines.append(
+                f"{stage:<18}{s['count']:>9}"
+                f"{s['mean_ms']:>9.3f}ms{s['p50_ms']:>9.3f}ms{s['p95_ms']:>9.3f}ms"
+                f"{s['p99_ms']:>9.3f}ms{s['max_ms']:>9.3f}ms"
+            )
+
+        return "\n".join(lines)
+
+    def export(self, path):
+        """
+        Write the summary to a file.
+
+        Args:
+            path: Output path; '.json' files get a JSON object, all other
+                  paths a CSV file with one row per stage.
+        """
+        summary = self.summary()
+
+        if path.endswith(".json"):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(summary, f, indent=2)
+            return
+
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(("stage",) + SUMMARY_FIELDS)
+            for stage, s in summary.items():
+                writer.writerow([stage] + [s[field] for field in SUMMARY_FIELDS])
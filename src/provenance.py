@@ -1,19 +1,125 @@
 # -*- coding: utf-8 -*-
 """
 Provenance logger for the XML measurement data pipeline.
-Writes structured provenance records to SQLite with stage-level
-performance metrics for FAIR-aligned reproducibility.
+Writes structured provenance records with stage-level performance
+metrics for FAIR-aligned reproducibility, through a storage backend
+(SQLite by default, see storage.py).
+
+In compact mode, the records of one file are merged into a single row
+of provenance_files with per-step status bits, and the schema and
+pipeline versions are stored once in a lookup table. The view
+provenance_view shows detailed and compact records alike with the
+columns of the provenance table.
 
 License: MIT
 """
 
-import sqlite3
+import atexit
+import sys
+import threading
+import time
 from datetime import datetime
 
+from db_init import PROVENANCE_STEPS
+from storage import PROVENANCE_COLUMNS, SQLiteBackend, write_errors
+
+
+DEFAULT_DB_PATH = "../db/pipeline.db"
+
+# Buffering of the shared logger used by log_provenance()
+DEFAULT_BUFFER_SIZE = 256
+DEFAULT_FLUSH_INTERVAL_MS = 1000.0
+
+PROVENANCE_FILE_INSERT_SQL = """
+    INSERT INTO provenance_files (
+        measurement_id,
+        xml_file,
+        timestamp,
+        context_id,
+        stage_bits,
+        message,
+        processing_time_ms,
+        memory_peak_mb,
+        validation_time_ms,
+        extraction_time_ms,
+        persistence_time_ms,
+        run_id
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+PROVENANCE_FILE_ERRORS_INSERT_SQL = """
+    INSERT INTO provenance_file_errors (file_id, position, line, column, domain, type, message)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Position of each step in the stage bits of compact records
+_STEP_POSITIONS = {step: position for position, (step, _) in enumerate(PROVENANCE_STEPS)}
+
+
+def _text(value):
+    """
+    Return a value as text that can be stored.
+
+    Names that are not text, or that hold undecodable bytes (e.g. archive
+    member names decoded with surrogateescape), are converted with
+    backslash escapes instead of failing the write of the whole buffer.
+    """
+    if value is None:
+        return None
+
+    return str(value).encode("utf-8", "backslashreplace").decode("utf-8")
+
 
 class ProvenanceLogger:
-    def __init__(self, db_path="../db/pipeline.db"):
+    """
+    Provenance writer on a storage backend.
+
+    Without a backend, records are written to the SQLite database at
+    db_path over a single long-lived connection. Records are buffered in
+    memory and written with one bulk write once buffer_size records are
+    pending or flush_interval_ms has elapsed
+    since the last flush. The interval is checked whenever a record is
+    logged; flush() and close() write out anything still pending. With the
+    default buffer_size of 1, every record is written immediately. If a
+    write fails, its records stay buffered and are retried by the next
+    flush. If the retry fails as well, the records are written one by one,
+    and records that still fail are reported on stderr and kept in
+    dead_letters instead of blocking all later writes.
+
+    Validation error details passed with a record are written to the
+    validation_errors table in the same transaction.
+
+    If profiler is set to a profiler.StageProfiler, the duration of every
+    write is recorded as stage 'provenance_write'. Every record is
+    written with the run_id set when it was logged; Pipeline sets it for
+    the duration of a run, so records captured in worker processes and
+    handed over during the run belong to the run as well.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, buffer_size=1, flush_interval_ms=None, db_profile=None,
+                 backend=None):
         self.db_path = db_path
+        self.db_profile = db_profile
+        self.buffer_size = max(1, int(buffer_size))
+        self.flush_interval_ms = flush_interval_ms
+
+        # Storage backend, see storage.py; SQLite at db_path unless given.
+        # A given backend stays with its owner and is not closed here.
+        self.owns_backend = backend is None
+        self.backend = backend if backend is not None else SQLiteBackend(db_path, db_profile)
+
+        # Pairs of (run_id, record)
+        self.buffer = []
+        self.retrying = False
+        self.dead_letters = []
+        self.last_flush = time.perf_counter()
+        self.lock = threading.Lock()
+        self.profiler = None
+        self.run_id = None
+
+    # Records are written as they are; see CompactProvenanceLogger
+    compact = False
 
     def log_provenance(
         self,
@@ -29,10 +135,11 @@ class ProvenanceLogger:
         memory_peak_mb=None,
         validation_time_ms=None,
         extraction_time_ms=None,
-        persistence_time_ms=None
+        persistence_time_ms=None,
+        errors=None
     ):
         """
-        Write a provenance record to the SQLite database.
+        Write a provenance record to the storage backend.
 
         Args:
             measurement_id: Identifier of the measurement being processed.
@@ -48,62 +155,399 @@ class ProvenanceLogger:
             validation_time_ms: Time spent in validation stage.
             extraction_time_ms: Time spent in extraction stage.
             persistence_time_ms: Time spent in persistence stage.
+            errors: Optional list of (line, column, domain, type, message)
+                    tuples of schema validation errors; message may be
+                    None.
+
+        Returns:
+            Tuple of (success: bool, error: str or None). A record that is
+            only buffered reports success; write errors are reported by
+            the call that triggers the flush.
         """
 
         timestamp = datetime.now().isoformat()
 
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                INSERT INTO provenance (
-                    measurement_id,
-                    step,
-                    status,
-                    message,
-                    timestamp,
-                    xml_file,
-                    xsd_schema,
-                    schema_version,
-                    pipeline_version,
-                    processing_time_ms,
-                    memory_peak_mb,
-                    validation_time_ms,
-                    extraction_time_ms,
-                    persistence_time_ms
+        record = (
+            _text(measurement_id),
+            step,
+            status,
+            _text(message),
+            timestamp,
+            _text(xml_file),
+            xsd_schema,
+            schema_version,
+            pipeline_version,
+            processing_time_ms,
+            memory_peak_mb,
+            validation_time_ms,
+            extraction_time_ms,
+            persistence_time_ms,
+            errors
+        )
+
+        return self.log_records([record])
+
+    def log_records(self, records):
+        """
+        Queue already built provenance records, e.g. records captured by a
+        ProvenanceRecorder in a worker process.
+
+        Returns:
+            Tuple of (success: bool, error: str or None), see log_provenance.
+        """
+        with self.lock:
+            # Records belong to the run active now, not to the one active
+            # when they are written
+            self.buffer.extend((self.run_id, record) for record in records)
+
+            elapsed_ms = (time.perf_counter() - self.last_flush) * 1000
+            if len(self.buffer) >= self.buffer_size or (
+                    self.flush_interval_ms is not None and elapsed_ms >= self.flush_interval_ms):
+                return self._flush_locked()
+
+        return True, None
+
+    def flush(self):
+        """Write all buffered records in a single transaction."""
+        with self.lock:
+            return self._flush_locked()
+
+    def close(self):
+        """Flush buffered records and close the connections of a backend
+        opened by the logger.
+
+        The logger stays usable; the next flush reopens them.
+        """
+        with self.lock:
+            result = self._flush_locked()
+            if self.owns_backend:
+                self.backend.close()
+
+        return result
+
+    def _flush_locked(self):
+        """Write buffered records, one bulk write per run; the caller must hold self.lock."""
+        self.last_flush = time.perf_counter()
+
+        while self.buffer:
+            run_id = self.buffer[0][0]
+            count = next(
+                (index for index, entry in enumerate(self.buffer) if entry[0] != run_id), len(self.buffer)
+            )
+            records = [record for _, record in self.buffer[:count]]
+
+            result = self._execute(self._write, records, run_id)
+            if not result[0]:
+                if not self.retrying:
+                    # Retried by the next flush, e.g. after a lock timeout
+                    self.retrying = True
+                    return result
+
+                self._write_each(records, run_id)
+
+            self.retrying = False
+            del self.buffer[:count]
+
+        return True, None
+
+    def _write_each(self, records, run_id):
+        """Write records one at a time and set aside those that fail."""
+        for record in records:
+            ok, err = self._execute(self._write, [record], run_id)
+
+            if not ok:
+                self.dead_letters.append((run_id, record))
+                print(
+                    f"Dropped provenance record ({record[1]}, {record[2]}) of {record[5] or record[0]}: {err}",
+                    file=sys.stderr
                 )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                measurement_id,
-                step,
-                status,
-                message,
-                timestamp,
-                xml_file,
-                xsd_schema,
-                schema_version,
-                pipeline_version,
-                processing_time_ms,
-                memory_peak_mb,
-                validation_time_ms,
-                extraction_time_ms,
-                persistence_time_ms
-            ))
 
-            conn.commit()
-            conn.close()
+    def _execute(self, write, *args):
+        """Run write(*args), recording its duration and reporting failures."""
+        start = time.perf_counter()
+
+        try:
+            write(*args)
+
+            if self.profiler is not None:
+                self.profiler.record("provenance_write", (time.perf_counter() - start) * 1000)
 
             return True, None
 
         except Exception as e:
             return False, str(e)
 
+    def _write(self, records, run_id):
+        """Write records and their validation error details."""
+        self.backend.write_provenance(records, run_id)
+
+
+class CompactProvenanceLogger(ProvenanceLogger):
+    """
+    Provenance writer that stores one row per file.
+
+    Records are collected per xml_file until the file is finished: by an
+    error in any step, or by the 'pipeline' step. The file is then written
+    to provenance_files with a bit per step that ran and a bit per step
+    that failed, the message of the failed step, the stage timings of the
+    'pipeline' record, and the timestamp of its first record. Schema and
+    pipeline versions are replaced by an id of provenance_contexts.
+
+    Files that are unfinished when the logger is closed are written with
+    the steps they reached. Compact records need the SQLite backend.
+    """
+
+    compact = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        if not isinstance(self.backend, SQLiteBackend):
+            raise ValueError("Compact provenance requires the SQLite storage backend")
+
+        self.open_files = {}
+        self.context_ids = {}
+
+    def close(self):
+        """Flush buffered records, write unfinished files, and close the connection."""
+        with self.lock:
+            result = self._flush_locked()
+
+            if self.open_files:
+                unfinished_result = self._execute(self._write_files, list(self.open_files.values()))
+                if unfinished_result[0]:
+                    self.open_files = {}
+                if result[0]:
+                    result = unfinished_result
+
+            # The database may be replaced before the next write
+            if self.owns_backend:
+                self.backend.close()
+            self.context_ids = {}
+
+        return result
+
+    def _execute(self, write, *args):
+        result = super()._execute(write, *args)
+
+        # Context ids inserted by a rolled back transaction are gone
+        if not result[0]:
+            self.context_ids = {}
+
+        return result
+
+    def _write(self, records, run_id):
+        """Collect records per file and write the files they finish."""
+        # Files in flight, as xml_file -> (run_id, records), are only
+        # updated once the write succeeded, so that a failed write can be
+        # repeated with the same records
+        open_files = {
+            xml_file: (file_run_id, list(file_records))
+            for xml_file, (file_run_id, file_records) in self.open_files.items()
+        }
+        finished = []
+
+        for record in records:
+            xml_file = record[5]
+            if xml_file is None:
+                finished.append((run_id, [record]))
+                continue
+
+            open_files.setdefault(xml_file, (run_id, []))[1].append(record)
+
+            # A file belongs to the run of its last step
+            step, status = record[1], record[2]
+            if status == "error" or step == "pipeline":
+                finished.append((run_id, open_files.pop(xml_file)[1]))
+
+        if finished:
+            self._write_files(finished)
+
+        self.open_files = open_files
+
+    def _write_files(self, files):
+        """Insert one provenance_files row per (run_id, file records) pair."""
+        rows = []
+        errors = []
+
+        for run_id, records in files:
+            stage_bits = 0
+            message = None
+            timings = (None,) * 5
+            context = ["", "", ""]
+            file_errors = None
+
+            for record in records:
+                position = _STEP_POSITIONS.get(record[1])
+                if position is not None:
+                    stage_bits |= 1 << (2 * position)
+
+                if record[2] == "error":
+                    if position is not None:
+                        stage_bits |= 2 << (2 * position)
+                    message = record[3]
+
+                if record[1] == "pipeline":
+                    timings = record[9:14]
+
+                # xsd_schema, schema_version, pipeline_version
+                for index, value in enumerate(record[6:9]):
+                    if value and not context[index]:
+                        context[index] = value
+
+                if record[PROVENANCE_COLUMNS]:
+                    file_errors = record[PROVENANCE_COLUMNS]
+
+            first, last = records[0], records[-1]
+            timestamp = int(datetime.fromisoformat(first[4]).timestamp() * 1000)
+
+            rows.append((
+                last[0],
+                first[5],
+                timestamp,
+                tuple(context),
+                stage_bits,
+                message,
+                *timings,
+                run_id
+            ))
+            errors.append(file_errors)
+
+        with self.backend.transaction() as conn:
+            conn.executemany(PROVENANCE_FILE_INSERT_SQL, [
+                row[:3] + (self._context_id(conn, row[3]),) + row[4:] for row in rows
+            ])
+            write_errors(conn, PROVENANCE_FILE_ERRORS_INSERT_SQL, errors)
+
+    def _context_id(self, conn, context):
+        """Return the provenance_contexts id of (xsd_schema, schema_version, pipeline_version)."""
+        context_id = self.context_ids.get(context)
+
+        if context_id is None:
+            conn.execute(
+                "INSERT OR IGNORE INTO provenance_contexts (xsd_schema, schema_version, pipeline_version) "
+                "VALUES (?, ?, ?)",
+                context
+            )
+            context_id = conn.execute(
+                "SELECT id FROM provenance_contexts "
+                "WHERE xsd_schema = ? AND schema_version = ? AND pipeline_version = ?",
+                context
+            ).fetchone()[0]
+            self.context_ids[context] = context_id
+
+        return context_id
+
+
+class ProvenanceRecorder(ProvenanceLogger):
+    """
+    Logger that keeps records in memory instead of writing them.
+
+    Installed in worker processes so that only the parent process writes
+    to SQLite: the worker drains the captured records after each file and
+    returns them to the parent, which passes them to log_records().
+    """
+
+    def __init__(self):
+        super().__init__(db_path=None, buffer_size=sys.maxsize)
+
+    def drain(self):
+        """Return and clear all captured records."""
+        with self.lock:
+            records = [record for _, record in self.buffer]
+            self.buffer = []
+
+        return records
+
+    def _flush_locked(self):
+        return True, None
+
+
+# Shared logger behind the module-level convenience functions
+_shared_logger = None
+_shared_lock = threading.Lock()
+
+
+def get_provenance_logger():
+    """Return the shared buffered logger, creating it on first use."""
+    global _shared_logger
+
+    with _shared_lock:
+        if _shared_logger is None:
+            _shared_logger = ProvenanceLogger(
+                buffer_size=DEFAULT_BUFFER_SIZE,
+                flush_interval_ms=DEFAULT_FLUSH_INTERVAL_MS
+            )
+
+        return _shared_logger
+
+
+def install_provenance_logger(logger):
+    """
+    Make logger the shared logger used by log_provenance().
+
+    The previous logger is returned unchanged and is not flushed, so this
+    is safe to call in a freshly forked worker process.
+    """
+    global _shared_logger
+
+    with _shared_lock:
+        previous = _shared_logger
+        _shared_logger = logger
+
+    return previous
+
+
+def configure_provenance(db_path=DEFAULT_DB_PATH,
+                         buffer_size=DEFAULT_BUFFER_SIZE,
+                         flush_interval_ms=DEFAULT_FLUSH_INTERVAL_MS,
+                         db_profile=None,
+                         compact=False,
+                         backend=None):
+    """
+    Replace the shared logger used by log_provenance().
+
+    The previous shared logger is flushed and closed first. With compact,
+    the new logger is a CompactProvenanceLogger. With a storage backend,
+    records are written to it instead of the SQLite database at db_path.
+    """
+    logger_class = CompactProvenanceLogger if compact else ProvenanceLogger
+    logger = logger_class(
+        db_path=db_path,
+        buffer_size=buffer_size,
+        flush_interval_ms=flush_interval_ms,
+        db_profile=db_profile,
+        backend=backend
+    )
+
+    previous = install_provenance_logger(logger)
+    if previous is not None:
+        previous.close()
+
+    return logger
+
 
 # Convenience function for direct import
 def log_provenance(*args, **kwargs):
-    logger = ProvenanceLogger()
-    return logger.log_provenance(*args, **kwargs)
+    return get_provenance_logger().log_provenance(*args, **kwargs)
+
+
+def flush_provenance():
+    """Write all records buffered by the shared logger."""
+    if _shared_logger is None:
+        return True, None
+    return _shared_logger.flush()
+
+
+def close_provenance():
+    """Flush the shared logger and release its database connection."""
+    if _shared_logger is None:
+        return True, None
+    return _shared_logger.close()
+
+
+# Buffered records must survive normal interpreter exit and uncaught exceptions
+atexit.register(close_provenance)
 
 
 if __name__ == "__main__":
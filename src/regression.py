@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+Performance regression check for the XML measurement data pipeline.
+
+Compares a candidate run against a baseline, both in the raw CSV format
+written by experiment_runner.save_raw_results_csv (batch_size, run_id,
+runtime_ms, throughput_files_s, memory_peak_mb). For every batch size:
+- throughput: one-sided Mann-Whitney U test and a bootstrap confidence
+  interval of the ratio of median throughputs (candidate / baseline)
+- memory: one-sided Mann-Whitney U test on peak memory
+
+A batch size fails if the median throughput dropped, or the median peak
+memory grew, by more than the allowed threshold and the change is
+significant at the given level. The command exits with status 1 if any
+batch size fails, so it can gate pipeline upgrades.
+
+Usage:
+    python regression.py [baseline.csv] [candidate.csv]
+
+License: MIT
+"""
+
+import argparse
+import csv
+import math
+import random
+import statistics
+import sys
+
+
+BASELINE_FILE = "../results/reported/raw_runtime_measurements.csv"
+CANDIDATE_FILE = "../results/raw_runtime_measurements.csv"
+
+# Allowed relative changes and significance level
+MAX_THROUGHPUT_DROP = 0.05
+MAX_MEMORY_GROWTH = 0.10
+ALPHA = 0.05
+
+BOOTSTRAP_RESAMPLES = 2000
+BOOTSTRAP_SEED = 42
+
+
+def load_measurements(path, group_by=("batch_size",)):
+    """
+    Load raw measurements grouped by configuration.
+
+    Args:
+        path: CSV file with throughput_files_s and memory_peak_mb columns.
+        group_by: Columns identifying a configuration.
+
+    Returns:
+        Dict mapping a tuple of group_by values to a dict with the lists
+        'throughput' and 'memory' (empty memory values are skipped).
+    """
+    groups = {}
+
+    with open(path, encoding="utf-8", newline="") as f:
+        reader = csv.DictReader(f)
+
+        missing = [c for c in (*group_by, "throughput_files_s") if c not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"{path}: missing columns {', '.join(missing)}")
+
+        for row in reader:
+            key = tuple(row[column] for column in group_by)
+            group = groups.setdefault(key, {"throughput": [], "memory": []})
+            group["throughput"].append(float(row["throughput_files_s"]))
+
+            if row.get("memory_peak_mb"):
+                group["memory"].append(float(row["memory_peak_mb"]))
+
+    return groups
+
+
+def mann_whitney_less(x, y):
+    """
+    One-sided Mann-Whitney U test that x tends to be smaller than y.
+
+    Uses the normal approximation with tie and continuity correction.
+
+    Returns:
+        Tuple of (U statistic of x, p-value).
+    """
+    n1, n2 = len(x), len(y)
+    if not n1 or not n2:
+        return None, 1.0
+
+    # Midranks over the pooled sample
+    pooled = sorted([(v, 0) for v in x] + [(v, 1) for v in y])
+    ranks = [0.0] * len(pooled)
+    tie_term = 0
+    i = 0
+
+    while i < len(pooled):
+        j = i
+        while j + 1 < len(pooled) and pooled[j + 1][0] == pooled[i][0]:
+            j += 1
+
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+
+        ties = j - i + 1
+        tie_term += ties ** 3 - ties
+        i = j + 1
+
+    rank_sum_x = sum(rank for rank, (_, sample) in zip(ranks, pooled) if sample == 0)
+    u_x = rank_sum_x - n1 * (n1 + 1) / 2
+
+    n = n1 + n2
+    mean_u = n1 * n2 / 2
+    var_u = n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1)))
+
+    if var_u <= 0:
+        return u_x, 1.0
+
+    z = (u_x - mean_u + 0.5) / math.sqrt(var_u)
+    p = 0.5 * math.erfc(-z / math.sqrt(2))
+
+    return u_x, p
+
+
+def bootstrap_median_ratio(baseline, candidate, confidence=0.95,
+                           resamples=BOOTSTRAP_RESAMPLES, seed=BOOTSTRAP_SEED):
+    """
+    Percentile bootstrap confidence interval of median(candidate) / median(baseline).
+
+    Returns:
+        Tuple of (lower, upper) bounds.
+    """
+    rng = random.Random(seed)
+    ratios = []
+
+    for _ in range(resamples):
+        b = statistics.median(rng.choices(baseline, k=len(baseline)))
+        c = statistics.median(rng.choices(candidate, k=len(candidate)))
+        if b > 0:
+            ratios.append(c / b)
+
+    if not ratios:
+        return None, None
+
+    ratios.sort()
+    tail = (1 - confidence) / 2
+    lower = ratios[int(tail * (len(ratios) - 1))]
+    upper = ratios[int(math.ceil((1 - tail) * (len(ratios) - 1)))]
+
+    return lower, upper
+
+
+def compare(baseline, candidate, max_throughput_drop=MAX_THROUGHPUT_DROP,
+            max_memory_growth=MAX_MEMORY_GROWTH, alpha=ALPHA):
+    """
+    Compare candidate measurements with the baseline per configuration.
+
+    Args:
+        baseline: Result of load_measurements for the baseline.
+        candidate: Result of load_measurements for the candidate.
+        max_throughput_drop: Allowed relative drop of median throughput.
+        max_memory_growth: Allowed relative growth of median peak memory.
+        alpha: Significance level of the one-sided tests.
+
+    Returns:
+        List of per-configuration dicts with the medians, relative
+        changes, p-values, the bootstrap interval, 'failures' (list of
+        messages), and 'passed'.
+    """
+    report = []
+
+    for key in sorted(set(baseline) | set(candidate), key=_sort_key):
+        entry = {"config": key, "failures": []}
+        report.append(entry)
+
+        if key not in baseline or key not in candidate:
+            entry["missing"] = "baseline" if key not in baseline else "candidate"
+            entry["passed"] = True
+            continue
+
+        base, cand = baseline[key], candidate[key]
+
+        # Throughput: lower is worse
+        base_tp = statistics.median(base["throughput"])
+        cand_tp = statistics.median(cand["throughput"])
+        entry["throughput_baseline"] = base_tp
+        entry["throughput_candidate"] = cand_tp
+        entry["throughput_change"] = cand_tp / base_tp - 1 if base_tp > 0 else 0.0
+        entry["throughput_p"] = mann_whitney_less(cand["throughput"], base["throughput"])[1]
+        entry["throughput_ci"] = bootstrap_median_ratio(
+            base["throughput"], cand["throughput"], confidence=1 - alpha
+        )
+
+        if entry["throughput_change"] < -max_throughput_drop and entry["throughput_p"] < alpha:
+            entry["failures"].append(
+                f"median throughput dropped by {-entry['throughput_change']:.1%} "
+                f"(allowed {max_throughput_drop:.1%}, p={entry['throughput_p']:.4f})"
+            )
+
+        # Peak memory: higher is worse; skipped if not recorded
+        if base["memory"] and cand["memory"]:
+            base_mem = statistics.median(base["memory"])
+            cand_mem = statistics.median(cand["memory"])
+            entry["memory_baseline"] = base_mem
+            entry["memory_candidate"] = cand_mem
+            entry["memory_change"] = cand_mem / base_mem - 1 if base_mem > 0 else 0.0
+            entry["memory_p"] = mann_whitney_less(base["memory"], cand["memory"])[1]
+
+            if entry["memory_change"] > max_memory_growth and entry["memory_p"] < alpha:
+                entry["failures"].append(
+                    f"median peak memory grew by {entry['memory_change']:.1%} "
+                    f"(allowed {max_memory_growth:.1%}, p={entry['memory_p']:.4f})"
+                )
+
+        entry["passed"] = not entry["failures"]
+
+    return report
+
+
+def _sort_key(key):
+    """Sort configurations numerically where possible."""
+    return tuple((0, float(v), "") if _is_number(v) else (1, 0.0, v) for v in key)
+
+
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def format_report(report, group_by=("batch_size",)):
+    """Render the comparison as human-readable text."""
+    lines = []
+
+    for entry in report:
+        label = ", ".join(f"{column}={value}" for column, value in zip(group_by, entry["config"]))
+
+        if "missing" in entry:
+            lines.append(f"{label}: SKIPPED (no {entry['missing']} measurements)")
+            continue
+
+        lower, upper = entry["throughput_ci"]
+        ci = f"[{lower:.3f}, {upper:.3f}]" if lower is not None else "n/a"
+
+        lines.append(f"{label}: {'PASS' if entry['passed'] else 'FAIL'}")
+        lines.append(
+            f"  Throughput: {entry['throughput_baseline']:.2f} -> "
+            f"{entry['throughput_candidate']:.2f} files/s "
+            f"({entry['throughput_change']:+.1%}, p={entry['throughput_p']:.4f}, "
+            f"median ratio CI {ci})"
+        )
+
+        if "memory_change" in entry:
+            lines.append(
+                f"  Peak RSS:   {entry['memory_baseline']:.2f} -> "
+                f"{entry['memory_candidate']:.2f} MB "
+                f"({entry['memory_change']:+.1%}, p={entry['memory_p']:.4f})"
+            )
+
+        for failure in entry["failures"]:
+            lines.append(f"  ✗ {failure}")
+
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check a benchmark run for performance regressions.")
+    parser.add_argument("baseline", nargs="?", default=BASELINE_FILE, help="baseline CSV")
+    parser.add_argument("candidate", nargs="?", default=CANDIDATE_FILE, help="candidate CSV")
+    parser.add_argument("--max-throughput-drop", type=float, default=MAX_THROUGHPUT_DROP,
+                        help="allowed relative drop of median throughput (default 0.05)")
+    parser.add_argument("--max-memory-growth", type=float, default=MAX_MEMORY_GROWTH,
+                        help="allowed relative growth of median peak memory (default 0.10)")
+    parser.add_argument("--alpha", type=float, default=ALPHA,
+                        help="significance level of the one-sided tests (default 0.05)")
+    parser.add_argument("--group-by", nargs="+", default=["batch_size"],
+                        help="columns identifying a configuration (default batch_size)")
+    args = parser.parse_args(argv)
+
+    try:
+        baseline = load_measurements(args.baseline, args.group_by)
+        candidate = load_measurements(args.candidate, args.group_by)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    if not set(baseline) & set(candidate):
+        print("Error: baseline and candidate have no configuration in common", file=sys.stderr)
+        return 2
+
+    report = compare(
+        baseline,
+        candidate,
+        max_throughput_drop=args.max_throughput_drop,
+        max_memory_growth=args.max_memory_growth,
+        alpha=args.alpha
+    )
+
+    print(f"Baseline:  {args.baseline}")
+    print(f"Candidate: {args.candidate}\n")
+    print(format_report(report, args.group_by))
+
+    failed = [entry for entry in report if not entry["passed"]]
+    print(f"\n{'REGRESSION' if failed else 'OK'}: {len(failed)} of {len(report)} configurations failed")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Schema registry for the XML measurement data pipeline.
+
+Compiled XSD schemas are cached per process, keyed by schema path,
+content hash, and version, so that validators created for every run or
+every worker reuse one compiled etree.XMLSchema instead of compiling the
+file again. A changed schema file gets a new hash and is compiled anew.
+
+A registry created with shared=False compiles its own schemas instead,
+so that validators used by different threads at the same time do not
+share a compiled schema.
+
+A registry holds several schema versions side by side. Documents declare
+their version in the 'version' attribute of the root element; documents
+without it are validated against the default version.
+
+Compiled schemas are not thread-safe: a cached schema must not be used
+by several threads at the same time.
+
+License: MIT
+"""
+
+import hashlib
+import os
+import threading
+
+from lxml import etree
+
+
+# Root attribute declaring the schema version of a document
+VERSION_ATTRIBUTE = "version"
+
+# (absolute path, SHA-256 of the content, version) -> compiled schema
+_compiled = {}
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0}
+
+
+def compile_schema(schema_path, version=None):
+    """
+    Return the compiled schema of a file, compiling it only once per process.
+
+    Args:
+        schema_path: Path to the XSD file.
+        version: Schema version the file is registered for.
+
+    Returns:
+        etree.XMLSchema instance.
+    """
+    path = os.path.abspath(schema_path)
+
+    with open(path, "rb") as f:
+        content = f.read()
+
+    key = (path, hashlib.sha256(content).hexdigest(), version)
+
+    with _cache_lock:
+        schema = _compiled.get(key)
+        if schema is not None:
+            _cache_stats["hits"] += 1
+            return schema
+
+        schema = _compile(content, path)
+        _compiled[key] = schema
+        _cache_stats["misses"] += 1
+
+    return schema
+
+
+def _compile(content, path):
+    """Compile XSD content read from path."""
+    # base_url resolves xs:include and xs:import relative to the file
+    return etree.XMLSchema(etree.XML(content, base_url=path))
+
+
+def cache_info():
+    """Return hits, misses, and the number of compiled schemas of this process."""
+    with _cache_lock:
+        return {**_cache_stats, "size": len(_compiled)}
+
+
+def clear_cache():
+    """Discard all compiled schemas of this process."""
+    with _cache_lock:
+        _compiled.clear()
+        _cache_stats["hits"] = 0
+        _cache_stats["misses"] = 0
+
+
+class SchemaRegistry:
+    """
+    Schema versions available for validation.
+
+    Schemas are compiled on first use through the process-wide cache, or
+    all at once by preload(), and kept by the registry afterwards; the
+    schema files are only read once per registry.
+    """
+
+    def __init__(self, schemas, default_version, shared=True):
+        """
+        Args:
+            schemas: Dict mapping schema version to XSD path.
+            default_version: Version of documents that declare none; must
+                             be one of the registered versions.
+            shared: Use the process-wide cache; if False, the registry
+                    compiles and keeps its own schemas.
+        """
+        if default_version not in schemas:
+            raise ValueError(f"Default schema version {default_version} is not registered")
+
+        self.paths = dict(schemas)
+        self.default_version = default_version
+        self.shared = shared
+        self.compiled = {}
+
+    def preload(self):
+        """Compile all registered schemas."""
+        for version in self.paths:
+            self.get(version)
+
+    def get(self, version=None):
+        """
+        Return the compiled schema and XSD path of a version.
+
+        Raises:
+            KeyError: If the version is not registered.
+        """
+        if version is None:
+            version = self.default_version
+
+        path = self.paths[version]
+
+        schema = self.compiled.get(version)
+        if schema is None:
+            if self.shared:
+                schema = compile_schema(path, version)
+            else:
+                with open(path, "rb") as f:
+                    schema = _compile(f.read(), os.path.abspath(path))
+            self.compiled[version] = schema
+
+        return schema, path
+
+    def version_of(self, xml_doc):
+        """Return the schema version declared by a parsed document."""
+        return xml_doc.getroot().get(VERSION_ATTRIBUTE) or self.default_version
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+NumPy export of stored measurement values for the XML measurement data pipeline.
+Reads the measurement_values and sensor_readings tables written by
+Pipeline(store_values=True) and returns contiguous arrays per measurement
+or per device, so analyses do not need to re-parse the XML files.
+
+NumPy is an optional dependency and is only required by this module.
+
+License: MIT
+"""
+
+import sqlite3
+from itertools import groupby
+
+
+def _numpy():
+    """Import NumPy on demand with a helpful error message."""
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError("NumPy is required for array export (pip install numpy)") from e
+
+    return numpy
+
+
+def _filters(measurement_ids=None, geraet=None):
+    """Build the WHERE clause and parameters shared by the export queries."""
+    clauses = []
+    params = []
+
+    if measurement_ids is not None:
+        measurement_ids = list(measurement_ids)
+        clauses.append(f"m.id IN ({', '.join('?' * len(measurement_ids))})")
+        params.extend(measurement_ids)
+
+    if geraet is not None:
+        clauses.append("m.geraet = ?")
+        params.append(geraet)
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return where, params
+
+
+def load_sensor_arrays(db_path="../db/pipeline.db", by="measurement", measurement_ids=None, geraet=None):
+    """
+    Load sensor readings as contiguous NumPy arrays.
+
+    Args:
+        db_path: Path of the SQLite database.
+        by: 'measurement' to group by measurement ID, or 'device' to group
+            by device (geraet), ordered by measurement timestamp.
+        measurement_ids: Optional iterable of measurement IDs to include.
+        geraet: Optional device to restrict the export to.
+
+    Returns:
+        Dict mapping each measurement ID or device to a dict of arrays:
+            'sensor_id': str array,
+            'wert': float64 array,
+            'measurement_id': str array (only when grouped by device)
+    """
+    np = _numpy()
+
+    if by not in ("measurement", "device"):
+        raise ValueError(f"Unknown grouping: {by}")
+
+    where, params = _filters(measurement_ids, geraet)
+    key_column = "m.id" if by == "measurement" else "m.geraet"
+    order = "m.id, s.position" if by == "measurement" else "m.geraet, m.timestamp, m.id, s.position"
+
+    conn = sqlite3.connect(db_path)
+
+    try:
+        cursor = conn.execute(f"""
+            SELECT {key_column}, s.measurement_id, s.sensor_id, s.wert
+            FROM sensor_readings s
+            JOIN metadata m ON m.id = s.measurement_id
+            {where}
+            ORDER BY {order}
+        """, params)
+
+        arrays = {}
+
+        for key, group in groupby(cursor, key=lambda row: row[0]):
+            rows = list(group)
+
+            arrays[key] = {
+                "sensor_id": np.array([row[2] for row in rows], dtype=str),
+                "wert": np.fromiter((row[3] for row in rows), dtype=np.float64, count=len(rows))
+            }
+
+            if by == "device":
+                arrays[key]["measurement_id"] = np.array([row[1] for row in rows], dtype=str)
+
+        return arrays
+
+    finally:
+        conn.close()
+
+
+def load_measurement_values(db_path="../db/pipeline.db", measurement_ids=None, geraet=None):
+    """
+    Load the scalar measurement values as column arrays.
+
+    Args:
+        db_path: Path of the SQLite database.
+        measurement_ids: Optional iterable of measurement IDs to include.
+        geraet: Optional device to restrict the export to.
+
+    Returns:
+        Dict of equally long arrays: 'measurement_id', 'geraet', 'timestamp'
+        and 'pumpe' (str), 'druck', 'temperatur' and 'frequenz' (float64).
+    """
+    np = _numpy()
+    where, params = _filters(measurement_ids, geraet)
+
+    conn = sqlite3.connect(db_path)
+
+    try:
+        rows = conn.execute(f"""
+            SELECT m.id, m.geraet, m.timestamp, v.druck, v.temperatur, v.frequenz, v.pumpe
+            FROM measurement_values v
+            JOIN metadata m ON m.id = v.measurement_id
+            {where}
+            ORDER BY m.timestamp, m.id
+        """, params).fetchall()
+
+    finally:
+        conn.close()
+
+    columns = list(zip(*rows)) if rows else [()] * 7
+
+    return {
+        "measurement_id": np.array(columns[0], dtype=str),
+        "geraet": np.array(columns[1], dtype=str),
+        "timestamp": np.array(columns[2], dtype=str),
+        "druck": np.array(columns[3], dtype=np.float64),
+        "temperatur": np.array(columns[4], dtype=np.float64),
+        "frequenz": np.array(columns[5], dtype=np.float64),
+        "pumpe": np.array(columns[6], dtype=str)
+    }
+
+
+if __name__ == "__main__":
+    for measurement_id, arrays in load_sensor_arrays().items():
+        print(measurement_id, arrays["sensor_id"], arrays["wert"])
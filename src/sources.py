@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Input sources for the XML measurement data pipeline.
+Provides lazy enumeration of measurement files and a bounded prefetch
+queue, so that ingestion can start before a directory is fully listed
+and memory use does not grow with the number of input files.
+
+Packed inputs (tar, zip, and length-prefixed XML streams) are read
+member by member without extracting them to disk.
+
+License: MIT
+"""
+
+import os
+import queue
+import struct
+import tarfile
+import threading
+import zipfile
+
+
+# Marks the end of a prefetched stream
+_END = object()
+
+# Length-prefixed XML stream: STREAM_MAGIC, then per document a header of
+# name length (uint16) and content length (uint64), both big-endian,
+# followed by the UTF-8 name and the content
+STREAM_MAGIC = b"XMLSTRM1"
+STREAM_SUFFIX = ".xmls"
+_STREAM_HEADER = struct.Struct(">HQ")
+
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+
+def iter_xml_files(xml_dir, suffix=".xml"):
+    """
+    Yield the names of XML files in xml_dir.
+
+    Entries are produced as os.scandir reads them from the directory, so
+    the full listing is never held in memory.
+
+    Args:
+        xml_dir: Directory to scan.
+        suffix: Filename suffix of measurement files.
+
+    Yields:
+        Filenames relative to xml_dir.
+    """
+    with os.scandir(xml_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith(suffix) and entry.is_file():
+                yield entry.name
+
+
+def prefetch(iterable, maxsize=1024):
+    """
+    Consume an iterable in a background thread through a bounded queue.
+
+    The producer blocks once maxsize items are waiting, which bounds memory
+    while letting directory scanning overlap with processing. Exceptions
+    raised by the producer are re-raised in the consumer.
+
+    Args:
+        iterable: Source of items, e.g. iter_xml_files().
+        maxsize: Maximum number of items buffered between the stages.
+
+    Yields:
+        Items of iterable in their original order.
+    """
+    items = queue.Queue(maxsize=max(1, int(maxsize)))
+    stop = threading.Event()
+    errors = []
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            put(_END)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+
+    try:
+        while True:
+            item = items.get()
+            if item is _END:
+                break
+            yield item
+
+        if errors:
+            raise errors[0]
+
+    finally:
+        # Release the producer if the consumer stops early
+        stop.set()
+
+
+def iter_tar(path, suffix=".xml"):
+    """
+    Yield (member name, content) pairs of a tar archive.
+
+    The archive is read sequentially, so compressed archives are never
+    decompressed to disk or seeked in. Members are not kept in memory
+    after they were read.
+    """
+    with tarfile.open(path, "r|*") as archive:
+        while True:
+            member = archive.next()
+            if member is None:
+                break
+
+            if member.isfile() and member.name.endswith(suffix):
+                yield member.name, archive.extractfile(member).read()
+
+            # TarFile records every member it reads, even in stream mode
+            archive.members = []
+
+
+def iter_zip(path, suffix=".xml"):
+    """Yield (member name, content) pairs of a zip archive."""
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            if not info.is_dir() and info.filename.endswith(suffix):
+                yield info.filename, archive.read(info)
+
+
+def iter_stream(source):
+    """
+    Yield (name, content) pairs of a length-prefixed XML stream.
+
+    Args:
+        source: Path or binary file object, e.g. sys.stdin.buffer.
+    """
+    f = open(source, "rb") if isinstance(source, (str, os.PathLike)) else source
+
+    try:
+        if f.read(len(STREAM_MAGIC)) != STREAM_MAGIC:
+            raise ValueError("Not a length-prefixed XML stream")
+
+        while True:
+            header = f.read(_STREAM_HEADER.size)
+            if not header:
+                return
+            if len(header) < _STREAM_HEADER.size:
+                raise ValueError("Truncated stream header")
+
+            name_length, content_length = _STREAM_HEADER.unpack(header)
+            name = f.read(name_length).decode("utf-8")
+            content = f.read(content_length)
+
+            if len(content) < content_length:
+                raise ValueError(f"Truncated stream record: {name}")
+
+            yield name, content
+
+    finally:
+        if f is not source:
+            f.close()
+
+
+class StreamWriter:
+    """Writer for length-prefixed XML streams, see iter_stream."""
+
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.file.write(STREAM_MAGIC)
+
+    def add(self, name, content):
+        """Append one document."""
+        name = name.encode("utf-8")
+        self.file.write(_STREAM_HEADER.pack(len(name), len(content)))
+        self.file.write(name)
+        self.file.write(content)
+
+    def close(self):
+        self.file.close()
+
+
+def iter_archive(path, suffix=".xml"):
+    """
+    Yield (member name, content) pairs of a tar, zip, or XML stream file.
+
+    The format is chosen by file extension and otherwise detected from
+    the content. Stream documents are yielded regardless of suffix.
+
+    Raises:
+        ValueError: If the format is not recognized.
+    """
+    if path.endswith(".zip"):
+        return iter_zip(path, suffix)
+    if path.endswith(TAR_SUFFIXES):
+        return iter_tar(path, suffix)
+    if path.endswith(STREAM_SUFFIX):
+        return iter_stream(path)
+
+    with open(path, "rb") as f:
+        is_stream = f.read(len(STREAM_MAGIC)) == STREAM_MAGIC
+
+    if is_stream:
+        return iter_stream(path)
+    if zipfile.is_zipfile(path):
+        return iter_zip(path, suffix)
+    if tarfile.is_tarfile(path):
+        return iter_tar(path, suffix)
+
+    raise ValueError(f"Unsupported archive format: {path}")
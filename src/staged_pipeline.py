@@ -0,0 +1,475 @@
+# -*- coding: utf-8 -*-
+"""
+Staged pipeline orchestrator for the XML measurement data pipeline.
+
+Runs the per-file work as stages, each with its own pool of worker
+threads, connected by bounded queues:
+
+    read -> validate -> extract -> persist
+
+A stage whose output queue is full blocks until the next stage catches
+up, so a slow commit only holds back parsing once the queues in between
+are full, and memory stays bounded by the queue sizes. Every stage is
+sized on its own with stage_workers: more read threads on storage with a
+high per-open latency, more validate threads on nodes with many cores,
+more persist threads with a DB-API backend (a SQLite database has a
+single writer anyway). lxml releases the GIL while parsing and
+validating, so validate threads run in parallel; each of them has its
+own validator with its own compiled schemas.
+
+For every stage, the result reports the processed files, the time spent
+working, waiting for input, and blocked on a full output queue, and the
+depth of its input queue. shutdown() or Ctrl-C stop reading new files;
+everything already queued is processed and persisted before run()
+returns.
+
+The validator, extractor, persistence, provenance, and run bookkeeping
+are those of Pipeline. Without validation, the validate stage is left
+out and extraction reads the metadata with the streaming extractor.
+
+License: MIT
+"""
+
+import os
+import queue
+import threading
+import time
+
+from pipeline import Pipeline
+from validator import XMLValidator
+from worker import validate_and_extract
+
+
+STAGES = ("read", "validate", "extract", "persist")
+
+# Worker threads per stage; override with StagedPipeline(stage_workers=...)
+DEFAULT_STAGE_WORKERS = {
+    "read": 2,
+    "validate": 1,
+    "extract": 1,
+    "persist": 1
+}
+
+# Capacity of the input queue of every stage
+STAGE_QUEUE_SIZE = 64
+
+# End of input, passed on once per worker of the next stage
+_DONE = object()
+
+
+def _read_file(xml_path):
+    """Read the complete content of a file."""
+    with open(xml_path, "rb") as f:
+        return f.read()
+
+
+class Stage:
+    """
+    One pipeline stage: a pool of worker threads and its bounded input queue.
+
+    The counters are updated by the worker threads and read by metrics()
+    once the stage has stopped.
+    """
+
+    def __init__(self, name, workers, handler, queue_size=STAGE_QUEUE_SIZE):
+        """
+        Args:
+            name: Stage name, one of STAGES.
+            workers: Number of worker threads.
+            handler: Callable (item, state) -> item for the next stage, or
+                     None to pass nothing on.
+            queue_size: Capacity of the input queue.
+        """
+        self.name = name
+        self.workers = max(1, int(workers))
+        self.handler = handler
+        self.input = queue.Queue(maxsize=queue_size)
+        self.next = None
+
+        self.lock = threading.Lock()
+        self.running = self.workers
+        self.processed = 0
+        self.busy_ms = 0.0
+        self.idle_ms = 0.0
+        self.blocked_ms = 0.0
+        self.depth_sum = 0
+        self.depth_count = 0
+        self.depth_max = 0
+
+    def put(self, item):
+        """
+        Queue an item for this stage, blocking while the queue is full.
+
+        Returns:
+            Time spent blocked in ms.
+        """
+        start = time.perf_counter()
+        self.input.put(item)
+        blocked_ms = (time.perf_counter() - start) * 1000
+
+        if item is _DONE:
+            return blocked_ms
+
+        # Depth seen by every arriving item
+        depth = self.input.qsize()
+        with self.lock:
+            self.depth_sum += depth
+            self.depth_count += 1
+            self.depth_max = max(self.depth_max, depth)
+
+        return blocked_ms
+
+    def emit(self, item):
+        """Pass an item to the next stage; blocked time counts towards this stage."""
+        blocked_ms = self.next.put(item)
+
+        with self.lock:
+            self.blocked_ms += blocked_ms
+
+    def metrics(self, runtime_ms):
+        """
+        Summarize the stage.
+
+        Args:
+            runtime_ms: Wall time of the run.
+
+        Returns:
+            Dict with workers, processed, busy_ms, idle_ms (waiting for
+            input), blocked_ms (waiting for space in the next queue),
+            utilization (busy share of all worker time), queue_size,
+            queue_max, and queue_mean (input queue depth seen by arriving
+            items).
+        """
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "processed": self.processed,
+                "busy_ms": self.busy_ms,
+                "idle_ms": self.idle_ms,
+                "blocked_ms": self.blocked_ms,
+                "utilization": self.busy_ms / (self.workers * runtime_ms) if runtime_ms > 0 else 0.0,
+                "queue_size": self.input.maxsize,
+                "queue_max": self.depth_max,
+                "queue_mean": self.depth_sum / self.depth_count if self.depth_count else 0.0
+            }
+
+
+def format_stage_metrics(stages):
+    """Return the stage metrics of a run result as a fixed-width text table."""
+    lines = [
+        f"{'Stage':<10}{'Workers':>8}{'Files':>8}{'Busy':>9}{'Idle':>12}{'Blocked':>12}"
+        f"{'Queue mean':>12}{'Queue max':>11}"
+    ]
+
+    for name, s in stages.items():
+        lines.append(
+            f"{name:<10}{s['workers']:>8}{s['processed']:>8}{s['utilization']:>9.1%}"
+            f"{s['idle_ms']:>10.1f}ms{s['blocked_ms']:>10.1f}ms"
+            f"{s['queue_mean']:>12.1f}{s['queue_max']:>7}/{s['queue_size']:<3}"
+        )
+
+    return "\n".join(lines)
+
+
+class StagedPipeline(Pipeline):
+    """
+    Pipeline variant with a thread pool per stage and bounded queues between them.
+
+    Accepts all Pipeline arguments except workers > 1 and the per-file
+    memory modes, which account a single thread. In batched mode, every
+    persist thread commits its own batches.
+    """
+
+    # The validator built by Pipeline serves the first validate thread
+    shared_schemas = False
+
+    def __init__(self, *args, stage_workers=None, stage_queue_size=STAGE_QUEUE_SIZE, **kwargs):
+        """
+        Args:
+            stage_workers: Dict overriding some of DEFAULT_STAGE_WORKERS.
+            stage_queue_size: Capacity of the input queue of every stage.
+            *args, **kwargs: Passed on to Pipeline.
+        """
+        super().__init__(*args, **kwargs)
+
+        unknown = set(stage_workers or {}) - set(STAGES)
+        if unknown:
+            raise ValueError(f"Unknown stages: {', '.join(sorted(unknown))}")
+        if self.workers > 1:
+            raise ValueError("StagedPipeline is sized with stage_workers instead of workers")
+        if self.memory.per_file:
+            raise ValueError(f"Memory mode {self.memory.mode} is not supported by StagedPipeline")
+
+        self.stage_workers = {**DEFAULT_STAGE_WORKERS, **(stage_workers or {})}
+        self.stage_queue_size = max(1, int(stage_queue_size))
+
+        # One validator per validate thread; compiled schemas must not be
+        # used by several threads at the same time
+        self.stage_validators = []
+        if self.validate:
+            self.stage_validators = [self.validator] + [
+                XMLValidator(
+                    schema_path=self.schema_path,
+                    schema_version=self.schema_version,
+                    pipeline_version=self.pipeline_version,
+                    schemas=self.schemas,
+                    prevalidation=self.prevalidation,
+                    max_errors=self.max_validation_errors,
+                    format_errors=self.format_validation_errors,
+                    shared_schemas=False
+                )
+                for _ in range(max(1, int(self.stage_workers["validate"])) - 1)
+            ]
+
+        # Run counters and the ingest index are shared by the persist threads
+        self.lock = threading.RLock()
+        self.stopping = threading.Event()
+        self.counts = None
+        self.errors = []
+
+    def shutdown(self):
+        """
+        Stop reading new files; queued files are still processed.
+
+        May be called from any thread while run() is active.
+        """
+        self.stopping.set()
+
+    def run(self, file_list=None):
+        """
+        Process all XML files through the stages.
+
+        Returns:
+            Same dict as Pipeline.run, plus 'stages' (Stage.metrics per
+            stage) and 'stopped' (True if shutdown() or Ctrl-C ended the
+            intake early).
+        """
+        xml_files = self._resolve_files(file_list)
+        self.counts = None
+        self.errors = []
+        self.stopping.clear()
+
+        try:
+            self.counts = self._start_run()
+
+            # Every persist thread batches on its own writer
+            if self.metadata_writer is not None:
+                self.metadata_writer.close()
+                self.metadata_writer = None
+
+            stages = self._build_stages()
+            threads = [
+                threading.Thread(target=self._work, args=(stage, index), name=f"{stage.name}-{index}", daemon=True)
+                for stage in stages
+                for index in range(stage.workers)
+            ]
+
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+
+            try:
+                for item in self._work_items(xml_files, self.counts):
+                    if self.stopping.is_set():
+                        break
+                    stages[0].put(item)
+
+            except KeyboardInterrupt:
+                print("\nInterrupted, draining queued files...")
+                self.stopping.set()
+
+            finally:
+                # Graceful drain: the end marker follows the queued files
+                for _ in range(stages[0].workers):
+                    stages[0].put(_DONE)
+
+                for thread in threads:
+                    thread.join()
+
+            runtime_ms = (time.perf_counter() - start) * 1000
+
+            if self.errors:
+                raise self.errors[0]
+
+            result = self._finish_run(self.counts)
+            result["stages"] = {stage.name: stage.metrics(runtime_ms) for stage in stages}
+            result["stopped"] = self.stopping.is_set()
+
+            return result
+
+        finally:
+            # Marks the run 'failed' unless _finish_run() completed it
+            self._abort_run(self.counts)
+            self.counts = None
+
+    def _build_stages(self):
+        """Create the stages of a run and link each to the next."""
+        handlers = [("read", self._read)]
+        if self.validate:
+            handlers.append(("validate", self._validate))
+        handlers += [("extract", self._extract), ("persist", self._store)]
+
+        stages = [
+            Stage(name, self.stage_workers[name], handler, self.stage_queue_size)
+            for name, handler in handlers
+        ]
+
+        for stage, following in zip(stages, stages[1:]):
+            stage.next = following
+
+        return stages
+
+    def _work(self, stage, index):
+        """Worker thread: process items of a stage until its end marker arrives."""
+        state = self._stage_state(stage.name, index)
+
+        try:
+            while True:
+                wait_start = time.perf_counter()
+                item = stage.input.get()
+                work_start = time.perf_counter()
+
+                if item is _DONE:
+                    break
+
+                try:
+                    result = stage.handler(item, state)
+                except Exception as e:
+                    # Keep draining, but stop the intake and fail the run
+                    self._fail(e)
+                    result = None
+
+                with stage.lock:
+                    stage.processed += 1
+                    stage.idle_ms += (work_start - wait_start) * 1000
+                    stage.busy_ms += (time.perf_counter() - work_start) * 1000
+
+                if result is not None and stage.next is not None:
+                    stage.emit(result)
+
+        finally:
+            try:
+                self._close_stage_state(stage.name, state)
+            except Exception as e:
+                self._fail(e)
+
+            with stage.lock:
+                stage.running -= 1
+                last = stage.running == 0
+
+            # The last worker of a stage ends the next one
+            if last and stage.next is not None:
+                for _ in range(stage.next.workers):
+                    stage.next.put(_DONE)
+
+    def _fail(self, error):
+        """Record an unexpected stage error and stop reading new files."""
+        with self.lock:
+            self.errors.append(error)
+        self.stopping.set()
+
+    def _stage_state(self, name, index):
+        """Per-thread state of a stage: its validator, or its batch writer."""
+        if name == "validate":
+            return self.stage_validators[index]
+
+        if name == "persist" and self.insert_batch_size:
+            return self.extractor.batch_writer(
+                batch_size=self.insert_batch_size,
+                flush_interval_ms=self.insert_flush_ms
+            )
+
+        return None
+
+    def _close_stage_state(self, name, state):
+        """Commit the last batch of a persist thread."""
+        if name == "persist" and state is not None:
+            settled = self._complete_batched(state.close())
+            with self.lock:
+                self._settle(self.counts, settled, processed=0)
+
+    def _read(self, item, state):
+        """Read stage: load the file content."""
+        filename, fingerprint = item
+        xml_path = os.path.join(self.xml_dir, filename)
+
+        try:
+            xml_bytes = _read_file(xml_path)
+        except OSError:
+            # Let validation report the unreadable file as usual
+            xml_bytes = None
+
+        return filename, fingerprint, xml_path, xml_bytes
+
+    def _validate(self, item, validator):
+        """Validate stage: parse and assert the document with this thread's validator."""
+        filename, fingerprint, xml_path, xml_bytes = item
+
+        start = time.perf_counter()
+        if xml_bytes is None:
+            validation = validator.validate(xml_path)
+        else:
+            validation = validator.validate_bytes(xml_bytes, os.path.basename(xml_path))
+        validation_ms = (time.perf_counter() - start) * 1000
+
+        return filename, fingerprint, xml_path, validation, validation_ms
+
+    def _extract(self, item, state):
+        """
+        Extract stage: read the metadata from the validated tree.
+
+        Builds the outcome of worker.validate_and_extract; the processing
+        time covers validation and extraction without the queue waits.
+        """
+        if not self.validate:
+            filename, fingerprint, xml_path, xml_bytes = item
+            outcome = validate_and_extract(None, self.extractor, xml_path, xml_bytes)
+            outcome["fingerprint"] = fingerprint
+            return filename, outcome
+
+        filename, fingerprint, xml_path, validation, validation_ms = item
+        xml_file = os.path.basename(xml_path)
+        metrics = {"validation_time_ms": validation_ms}
+        stages = validation["stage_times"]
+        data = None
+
+        if validation["valid"]:
+            start = time.perf_counter()
+            meta = self.extractor.extract_from_document(validation["document"], xml_file)
+            metrics["extraction_time_ms"] = (time.perf_counter() - start) * 1000
+            stages["extraction"] = metrics["extraction_time_ms"]
+
+            if meta["success"]:
+                data = meta["data"]
+
+        metrics["processing_time_ms"] = validation_ms + metrics.get("extraction_time_ms", 0.0)
+
+        return filename, {
+            "xml_path": xml_path,
+            "xml_file": xml_file,
+            "data": data,
+            "metrics": metrics,
+            "stages": stages,
+            "memory": None,
+            "fingerprint": fingerprint
+        }
+
+    def _store(self, item, writer):
+        """Persist stage: write the metadata, on this thread's batch writer if batched."""
+        filename, outcome = item
+        settled = self._persist(filename, outcome, writer)
+
+        with self.lock:
+            self._settle(self.counts, settled)
+
+    def _record_ingested(self, outcome):
+        with self.lock:
+            super()._record_ingested(outcome)
+
+
+if __name__ == "__main__":
+    pipeline = StagedPipeline()
+    result = pipeline.run()
+    print(f"\nResult: {result['successful']}/{result['total']} successfully processed")
+    print(f"Peak Memory: {result['peak_memory_mb']:.2f}MB")
+    print(format_stage_metrics(result["stages"]))
@@ -0,0 +1,870 @@
+# -*- coding: utf-8 -*-
+"""
+Storage backends for the XML measurement data pipeline.
+
+Metadata, provenance records, and run records are written through a
+storage backend with bulk write methods:
+- SQLiteBackend: the SQLite database created by db_init.py (default)
+- DBAPIBackend: a DB-API 2.0 driver with a pool of connections, so that
+  several threads can write at the same time; tested with sqlite3 on a
+  database created by db_init.py
+- SegmentLogBackend: an append-only log of JSON lines in size-bounded
+  segment files for the highest ingest rate; replay() loads a log into
+  another backend later
+
+Every bulk write is atomic for the SQL backends and raises on failure.
+close() releases connections and files; a backend stays usable and
+reopens them on the next write.
+
+License: MIT
+"""
+
+import glob
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+from db_init import connect
+
+
+DEFAULT_DB_PATH = "../db/pipeline.db"
+DEFAULT_POOL_SIZE = 4
+SEGMENT_BYTES = 64 * 1024 * 1024
+
+
+METADATA_INSERT_SQL = """
+    INSERT OR REPLACE INTO metadata (id, timestamp, geraet, operator, parameter, run_id)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+VALUES_INSERT_SQL = """
+    INSERT OR REPLACE INTO measurement_values (measurement_id, druck, temperatur, frequenz, pumpe)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+SENSOR_DELETE_SQL = "DELETE FROM sensor_readings WHERE measurement_id = ?"
+
+SENSOR_INSERT_SQL = """
+    INSERT INTO sensor_readings (measurement_id, position, sensor_id, wert)
+    VALUES (?, ?, ?, ?)
+"""
+
+PROVENANCE_INSERT_SQL = """
+    INSERT INTO provenance (
+        measurement_id,
+        step,
+        status,
+        message,
+        timestamp,
+        xml_file,
+        xsd_schema,
+        schema_version,
+        pipeline_version,
+        processing_time_ms,
+        memory_peak_mb,
+        validation_time_ms,
+        extraction_time_ms,
+        persistence_time_ms,
+        run_id
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# "column" is quoted, as it is a reserved word in PostgreSQL
+VALIDATION_ERRORS_INSERT_SQL = """
+    INSERT INTO validation_errors (provenance_id, position, line, "column", domain, type, message)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Number of provenance record fields; records carry the validation error
+# details as one more element, and run_id is added when they are written
+PROVENANCE_COLUMNS = 14
+
+# Columns of a runs row besides its id
+RUN_COLUMNS = (
+    "status",
+    "started_at",
+    "finished_at",
+    "pipeline_version",
+    "schema_version",
+    "config",
+    "total",
+    "successful",
+    "failed",
+    "skipped",
+    "runtime_ms",
+    "throughput_files_s",
+    "peak_memory_mb"
+)
+
+
+def metadata_row(data, run_id=None):
+    """Convert an extracted metadata dict into a metadata table row."""
+    return (
+        data["id"],
+        data["timestamp"],
+        data["geraet"],
+        data["operator"],
+        data["parameter"],
+        run_id
+    )
+
+
+def _values_row(data):
+    """Convert the measurement values of an extracted record into a table row."""
+    values = data["values"]
+    return (data["id"], values["druck"], values["temperatur"], values["frequenz"], values["pumpe"])
+
+
+def _sensor_rows(records):
+    """Yield the sensor_readings rows of extracted records."""
+    for data in records:
+        for position, (sensor_id, wert) in enumerate(data["values"]["sensors"]):
+            yield data["id"], position, sensor_id, wert
+
+
+def write_records(conn, records, run_id=None):
+    """
+    Write extracted records with executemany on an open SQLite connection.
+
+    Measurement values and sensor readings are written for records that
+    carry them under 'values'; previously stored sensor readings of the
+    same measurements are replaced. The caller controls the transaction.
+
+    Args:
+        conn: sqlite3 connection.
+        records: List of extracted metadata dicts.
+        run_id: Id of the runs row the records belong to, or None.
+    """
+    conn.executemany(METADATA_INSERT_SQL, [metadata_row(data, run_id) for data in records])
+
+    with_values = [data for data in records if data.get("values")]
+    if not with_values:
+        return
+
+    conn.executemany(SENSOR_DELETE_SQL, [(data["id"],) for data in with_values])
+    conn.executemany(VALUES_INSERT_SQL, [_values_row(data) for data in with_values])
+    conn.executemany(SENSOR_INSERT_SQL, _sensor_rows(with_values))
+
+
+def write_errors(conn, sql, errors):
+    """
+    Write the validation error details of rows just inserted.
+
+    The write transaction locks out other writers, so the AUTOINCREMENT
+    ids of the rows are consecutive and end at last_insert_rowid().
+
+    Args:
+        conn: SQLite connection that inserted the rows.
+        sql: Insert statement of the error table.
+        errors: Per inserted row, its list of error tuples or None.
+    """
+    if not any(errors):
+        return
+
+    last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    first_id = last_id - len(errors) + 1
+
+    conn.executemany(sql, [
+        (first_id + index, position, *error)
+        for index, row_errors in enumerate(errors) if row_errors
+        for position, error in enumerate(row_errors)
+    ])
+
+
+def _run_insert_sql(values):
+    """Build the insert of a runs row from the RUN_COLUMNS present in values."""
+    columns = [column for column in RUN_COLUMNS if column in values]
+    return (
+        f"INSERT INTO runs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+        [values[column] for column in columns]
+    )
+
+
+def _run_update_sql(run_id, values):
+    """Build the update of a runs row from the RUN_COLUMNS present in values."""
+    columns = [column for column in RUN_COLUMNS if column in values]
+    return (
+        f"UPDATE runs SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?",
+        [values[column] for column in columns] + [run_id]
+    )
+
+
+class StorageBackend(ABC):
+    """
+    Interface of the storage backends.
+
+    A subclass that misses one of the abstract write methods fails when
+    it is instantiated, not in the middle of a run.
+
+    Provenance records are tuples of the PROVENANCE_COLUMNS fields of
+    provenance.ProvenanceLogger followed by their validation error details.
+    Run values are dicts with a subset of RUN_COLUMNS.
+    """
+
+    @abstractmethod
+    def write_metadata(self, records, run_id=None):
+        """Write extracted metadata dicts in one transaction."""
+
+    def write_metadata_each(self, records, run_id=None):
+        """
+        Write extracted metadata dicts one by one to attribute failures.
+
+        Returns:
+            List with None or an error message per record.
+        """
+        errors = []
+
+        for data in records:
+            try:
+                self.write_metadata([data], run_id)
+                errors.append(None)
+            except Exception as e:
+                errors.append(str(e))
+
+        return errors
+
+    @abstractmethod
+    def write_provenance(self, records, run_id=None):
+        """Write provenance records and their error details in one transaction."""
+
+    @abstractmethod
+    def create_run(self, values):
+        """Insert a run record and return its id."""
+
+    @abstractmethod
+    def complete_run(self, run_id, values):
+        """Update a run record with the given values."""
+
+    def close(self):
+        """Release connections and files; the backend stays usable."""
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Storage in the SQLite database created by db_init.py.
+
+    One connection is opened on first use and shared by all threads under
+    a lock. A process forked while the connection is open opens its own.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, profile=None):
+        self.db_path = db_path
+        self.profile = profile
+        self.conn = None
+        self.pid = None
+        self.lock = threading.RLock()
+
+    def _connection(self):
+        """Return the connection of this process, opening it if needed."""
+        if self.conn is None or self.pid != os.getpid():
+            self.conn = connect(self.db_path, self.profile, check_same_thread=False)
+            self.pid = os.getpid()
+
+        return self.conn
+
+    @contextmanager
+    def transaction(self):
+        """Hold the connection for one transaction; commits on success."""
+        with self.lock:
+            conn = self._connection()
+            with conn:
+                yield conn
+
+    def write_metadata(self, records, run_id=None):
+        with self.transaction() as conn:
+            write_records(conn, records, run_id)
+
+    def write_metadata_each(self, records, run_id=None):
+        """
+        Write records one by one in a single transaction.
+
+        Each record is written under its own savepoint, so a failing record
+        leaves no partial metadata or values behind.
+        """
+        errors = []
+
+        with self.lock:
+            conn = self._connection()
+            conn.execute("BEGIN")
+
+            for data in records:
+                try:
+                    conn.execute("SAVEPOINT record")
+                    write_records(conn, [data], run_id)
+                    conn.execute("RELEASE record")
+                    errors.append(None)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO record")
+                    conn.execute("RELEASE record")
+                    errors.append(str(e))
+
+            try:
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                errors = [str(e)] * len(records)
+
+        return errors
+
+    def write_provenance(self, records, run_id=None):
+        with self.transaction() as conn:
+            conn.executemany(
+                PROVENANCE_INSERT_SQL, [record[:PROVENANCE_COLUMNS] + (run_id,) for record in records]
+            )
+            write_errors(conn, VALIDATION_ERRORS_INSERT_SQL, [
+                record[PROVENANCE_COLUMNS] for record in records
+            ])
+
+    def create_run(self, values):
+        sql, params = _run_insert_sql(values)
+        with self.transaction() as conn:
+            return conn.execute(sql, params).lastrowid
+
+    def complete_run(self, run_id, values):
+        sql, params = _run_update_sql(run_id, values)
+        with self.transaction() as conn:
+            conn.execute(sql, params)
+
+    def close(self):
+        with self.lock:
+            # A connection inherited from the parent process is left alone
+            if self.conn is not None and self.pid == os.getpid():
+                self.conn.close()
+            self.conn = None
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of DB-API connections.
+
+    Connections are created on demand up to size; further callers wait
+    until a connection is returned, or raise TimeoutError after timeout
+    seconds. A connection whose rollback fails is discarded.
+    """
+
+    def __init__(self, factory, size=DEFAULT_POOL_SIZE, timeout=None):
+        """
+        Args:
+            factory: Callable returning a new DB-API connection.
+            size: Maximum number of open connections.
+            timeout: Seconds to wait for a free connection; None waits forever.
+        """
+        self.factory = factory
+        self.size = max(1, int(size))
+        self.timeout = timeout
+
+        self.idle = []
+        self.created = 0
+        self.pid = os.getpid()
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def transaction(self):
+        """Borrow a connection for one transaction; commits on success, rolls back on error."""
+        conn = self._acquire()
+        healthy = True
+
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except Exception:
+                healthy = False
+            raise
+        finally:
+            self._release(conn, healthy)
+
+    def _acquire(self):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+
+        with self.condition:
+            # Connections of the parent process must not be shared with a fork
+            if self.pid != os.getpid():
+                self.idle = []
+                self.created = 0
+                self.pid = os.getpid()
+
+            while not self.idle and self.created >= self.size:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"No database connection available after {self.timeout}s")
+                self.condition.wait(remaining)
+
+            if self.idle:
+                return self.idle.pop()
+
+            self.created += 1
+
+        try:
+            return self.factory()
+        except Exception:
+            with self.condition:
+                self.created -= 1
+                self.condition.notify()
+            raise
+
+    def _release(self, conn, healthy=True):
+        with self.condition:
+            if healthy and self.pid == os.getpid():
+                self.idle.append(conn)
+            else:
+                self.created -= 1
+                _close_quietly(conn)
+
+            self.condition.notify()
+
+    def close(self):
+        """Close all idle connections; borrowed ones are returned as usual."""
+        with self.condition:
+            idle = self.idle
+            self.idle = []
+            self.created -= len(idle)
+
+        for conn in idle:
+            _close_quietly(conn)
+
+
+def _close_quietly(conn):
+    """Close a connection that may already be broken."""
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def convert_placeholders(sql, paramstyle):
+    """
+    Rewrite the qmark placeholders of a statement for a DB-API paramstyle.
+
+    Supports 'qmark', 'format', 'pyformat', and 'numeric'.
+    """
+    if paramstyle == "qmark":
+        return sql
+    if paramstyle in ("format", "pyformat"):
+        return sql.replace("?", "%s")
+    if paramstyle == "numeric":
+        parts = sql.split("?")
+        return parts[0] + "".join(f":{index}{part}" for index, part in enumerate(parts[1:], 1))
+
+    raise ValueError(f"Unsupported DB-API paramstyle: {paramstyle}")
+
+
+class DBAPIBackend(StorageBackend):
+    """
+    Storage in a database reachable through a DB-API 2.0 driver.
+
+    The tables of db_init.py must exist. db_init.py only creates them in
+    SQLite, so the backend is tested with the sqlite3 driver; for another
+    database, equivalent tables have to be created by other means. The
+    statements avoid SQLite-only syntax: placeholders follow the driver's
+    paramstyle, and upserts are written as DELETE and INSERT. Every bulk
+    write borrows one connection of the pool.
+
+    Example:
+        import sqlite3
+        backend = DBAPIBackend(sqlite3, ("../db/pipeline.db",), {"check_same_thread": False})
+    """
+
+    def __init__(self, module, connect_args=(), connect_kwargs=None, pool_size=DEFAULT_POOL_SIZE,
+                 pool_timeout=None, returning_ids=False):
+        """
+        Args:
+            module: DB-API driver module; its paramstyle is used for all
+                    statements.
+            connect_args: Positional arguments of module.connect.
+            connect_kwargs: Keyword arguments of module.connect.
+            pool_size: Maximum number of open connections.
+            pool_timeout: Seconds to wait for a free connection.
+            returning_ids: Read ids of inserted rows with RETURNING id
+                           instead of cursor.lastrowid, for drivers
+                           without lastrowid (e.g. psycopg).
+        """
+        self.module = module
+        self.paramstyle = module.paramstyle
+        self.returning_ids = returning_ids
+
+        connect_kwargs = dict(connect_kwargs or {})
+        self.pool = ConnectionPool(
+            lambda: module.connect(*connect_args, **connect_kwargs), pool_size, pool_timeout
+        )
+
+        self.metadata_delete_sql = self._sql("DELETE FROM metadata WHERE id = ?")
+        self.metadata_insert_sql = self._sql(METADATA_INSERT_SQL.replace("INSERT OR REPLACE", "INSERT"))
+        self.values_delete_sql = self._sql("DELETE FROM measurement_values WHERE measurement_id = ?")
+        self.values_insert_sql = self._sql(VALUES_INSERT_SQL.replace("INSERT OR REPLACE", "INSERT"))
+        self.sensor_delete_sql = self._sql(SENSOR_DELETE_SQL)
+        self.sensor_insert_sql = self._sql(SENSOR_INSERT_SQL)
+        self.provenance_insert_sql = self._sql(PROVENANCE_INSERT_SQL)
+        self.errors_insert_sql = self._sql(VALIDATION_ERRORS_INSERT_SQL)
+
+    def _sql(self, statement):
+        """Rewrite a qmark statement for the paramstyle of the driver."""
+        return convert_placeholders(statement, self.paramstyle)
+
+    def _insert_returning_id(self, cursor, statement, params):
+        """Insert one row and return its id."""
+        if self.returning_ids:
+            cursor.execute(f"{statement.rstrip()} RETURNING id", params)
+            return cursor.fetchone()[0]
+
+        cursor.execute(statement, params)
+        return cursor.lastrowid
+
+    def write_metadata(self, records, run_id=None):
+        with self.pool.transaction() as conn:
+            cursor = conn.cursor()
+            ids = [(data["id"],) for data in records]
+
+            cursor.executemany(self.metadata_delete_sql, ids)
+            cursor.executemany(self.metadata_insert_sql, [metadata_row(data, run_id) for data in records])
+
+            with_values = [data for data in records if data.get("values")]
+            if not with_values:
+                return
+
+            ids = [(data["id"],) for data in with_values]
+            cursor.executemany(self.values_delete_sql, ids)
+            cursor.executemany(self.values_insert_sql, [_values_row(data) for data in with_values])
+            cursor.executemany(self.sensor_delete_sql, ids)
+            cursor.executemany(self.sensor_insert_sql, list(_sensor_rows(with_values)))
+
+    def write_provenance(self, records, run_id=None):
+        with self.pool.transaction() as conn:
+            cursor = conn.cursor()
+            plain = []
+
+            # Records without error details are inserted in bulk; a record
+            # with details is inserted alone to learn its id. Record order
+            # is kept.
+            for record in records:
+                row = record[:PROVENANCE_COLUMNS] + (run_id,)
+
+                if not record[PROVENANCE_COLUMNS]:
+                    plain.append(row)
+                    continue
+
+                if plain:
+                    cursor.executemany(self.provenance_insert_sql, plain)
+                    plain = []
+
+                provenance_id = self._insert_returning_id(cursor, self.provenance_insert_sql, row)
+                cursor.executemany(self.errors_insert_sql, [
+                    (provenance_id, position, *error)
+                    for position, error in enumerate(record[PROVENANCE_COLUMNS])
+                ])
+
+            if plain:
+                cursor.executemany(self.provenance_insert_sql, plain)
+
+    def create_run(self, values):
+        sql, params = _run_insert_sql(values)
+        with self.pool.transaction() as conn:
+            return self._insert_returning_id(conn.cursor(), self._sql(sql), params)
+
+    def complete_run(self, run_id, values):
+        sql, params = _run_update_sql(run_id, values)
+        with self.pool.transaction() as conn:
+            conn.cursor().execute(self._sql(sql), params)
+
+    def close(self):
+        self.pool.close()
+
+
+class SegmentLogBackend(StorageBackend):
+    """
+    Append-only log of JSON lines in size-bounded segment files.
+
+    Every bulk write is encoded first and appended to the current segment
+    with a single write; a new segment is started once segment_bytes would
+    be exceeded. Nothing is read or indexed while writing, so the ingest
+    rate is bounded by encoding and sequential file I/O only.
+
+    Run ids are millisecond timestamps, unique within the log. replay()
+    loads the log into another backend and maps them to its run ids.
+    """
+
+    SEGMENT_PATTERN = "segment-*.log"
+
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES, fsync=False):
+        """
+        Args:
+            directory: Directory of the segment files; created if missing.
+            segment_bytes: Size after which a new segment is started.
+            fsync: Force every write to disk before returning.
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+
+        self.file = None
+        self.number = 0
+        self.size = 0
+        self.last_run_id = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+    def segments(self):
+        """Return the segment paths in write order."""
+        return sorted(glob.glob(os.path.join(self.directory, self.SEGMENT_PATTERN)))
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f"segment-{number:06d}.log")
+
+    def _open(self):
+        """Continue the last segment, or start a new one if it is full or torn."""
+        segments = self.segments()
+        number = 1
+
+        if segments:
+            last = segments[-1]
+            number = int(os.path.basename(last)[8:-4])
+            size = os.path.getsize(last)
+
+            torn = False
+            if size:
+                with open(last, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    torn = f.read(1) != b"\n"
+
+            if size >= self.segment_bytes or torn:
+                number += 1
+
+        self.file = open(self._segment_path(number), "ab")
+        self.size = self.file.tell()
+        self.number = number
+
+    def _append(self, entries):
+        """Encode entries and append them to the log with one write."""
+        payload = "".join(
+            json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n" for entry in entries
+        ).encode("utf-8")
+
+        with self.lock:
+            if self.file is None:
+                self._open()
+            elif self.size and self.size + len(payload) > self.segment_bytes:
+                self.file.close()
+                self.file = open(self._segment_path(self.number + 1), "ab")
+                self.number += 1
+                self.size = 0
+
+            self.file.write(payload)
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+
+            self.size += len(payload)
+
+    def write_metadata(self, records, run_id=None):
+        # Fails like the SQL backends on records without metadata fields
+        for data in records:
+            metadata_row(data)
+
+        self._append([{"type": "metadata", "run_id": run_id, "data": data} for data in records])
+
+    def write_provenance(self, records, run_id=None):
+        self._append([{"type": "provenance", "run_id": run_id, "record": record} for record in records])
+
+    def create_run(self, values):
+        with self.lock:
+            self.last_run_id = max(self.last_run_id + 1, int(time.time() * 1000))
+            run_id = self.last_run_id
+
+        self._append([{"type": "run", "id": run_id, "values": values}])
+        return run_id
+
+    def complete_run(self, run_id, values):
+        self._append([{"type": "run_update", "id": run_id, "values": values}])
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def iter_entries(self):
+        """
+        Yield the decoded log entries in write order.
+
+        An incomplete last line, left by a crash during a write, is skipped.
+        """
+        for path in self.segments():
+            with open(path, "rb") as f:
+                for number, line in enumerate(f, 1):
+                    if not line.endswith(b"\n"):
+                        break
+
+                    try:
+                        yield json.loads(line)
+                    except ValueError as e:
+                        raise ValueError(f"{path}:{number}: corrupt log entry: {e}") from e
+
+    def replay(self, target, batch_size=1000):
+        """
+        Write the log into another backend.
+
+        Consecutive metadata and provenance entries of the same run are
+        written in batches of up to batch_size. Run records get new ids in
+        the target, and the entries of a run are written with its new id.
+        The log enforces no table constraints, so metadata the target
+        rejects is skipped and counted.
+
+        Returns:
+            Dict with the numbers of replayed 'metadata', 'provenance', and
+            'runs' entries, and of 'rejected' metadata records.
+        """
+        counts = {"metadata": 0, "provenance": 0, "runs": 0, "rejected": 0}
+        run_ids = {}
+        batch = []
+        batch_key = None
+
+        def flush():
+            if not batch:
+                return
+
+            kind, run_id = batch_key
+            if kind == "provenance":
+                target.write_provenance(batch, run_id)
+                counts["provenance"] += len(batch)
+            else:
+                try:
+                    target.write_metadata(batch, run_id)
+                    rejected = 0
+                except Exception:
+                    errors = target.write_metadata_each(batch, run_id)
+                    rejected = sum(error is not None for error in errors)
+
+                counts["metadata"] += len(batch) - rejected
+                counts["rejected"] += rejected
+
+            batch.clear()
+
+        for entry in self.iter_entries():
+            kind = entry["type"]
+
+            if kind == "run":
+                flush()
+                run_ids[entry["id"]] = target.create_run(entry["values"])
+                counts["runs"] += 1
+                continue
+
+            if kind == "run_update":
+                flush()
+                if entry["id"] in run_ids:
+                    target.complete_run(run_ids[entry["id"]], entry["values"])
+                continue
+
+            key = (kind, run_ids.get(entry["run_id"]))
+            if key != batch_key or len(batch) >= batch_size:
+                flush()
+                batch_key = key
+
+            if kind == "metadata":
+                batch.append(entry["data"])
+            else:
+                # JSON turned the tuples into lists
+                record = entry["record"]
+                errors = record[PROVENANCE_COLUMNS]
+                batch.append(tuple(record[:PROVENANCE_COLUMNS]) + (
+                    [tuple(error) for error in errors] if errors else errors,
+                ))
+
+        flush()
+
+        return counts
+
+
+if __name__ == "__main__":
+    # Self-check of the backends on temporary databases: SQLiteBackend,
+    # DBAPIBackend on the sqlite3 driver, and a segment log replayed into
+    # SQLite must store identical rows, also after a torn last log entry
+    import shutil
+    import sqlite3
+    import tempfile
+
+    from db_init import init_db
+
+    def write_sample(backend, first, count):
+        run_id = backend.create_run({"status": "running", "started_at": "2024-01-01T00:00:00"})
+        records = [
+            {
+                "id": f"M{index:04d}",
+                "timestamp": f"2024-01-01T00:{index // 60:02d}:{index % 60:02d}",
+                "geraet": f"Sensor_{'AB'[index % 2]}",
+                "operator": "self-check",
+                "parameter": "druck"
+            }
+            for index in range(first, first + count)
+        ]
+        backend.write_metadata(records, run_id)
+
+        errors = [(3, 7, "SCHEMASV", "SCHEMAV_CVC_DATATYPE_VALID_1_2_1", "not a decimal")]
+        backend.write_provenance([
+            (data["id"], "pipeline", "success", None, data["timestamp"], f"{data['id']}.xml",
+             "schema.xsd", "1.0", "0.9.1", 1.0, 2.0, 0.5, 0.25, 0.25, None)
+            for data in records
+        ] + [
+            ("broken.xml", "validation", "error", "schema violation", "2024-01-01T01:00:00",
+             "broken.xml", "schema.xsd", "1.0", "0.9.1", None, None, None, None, None, errors)
+        ], run_id)
+        backend.complete_run(run_id, {"status": "completed", "total": count + 1, "successful": count})
+
+    def dump(db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            return {
+                table: conn.execute(f"SELECT * FROM {table} ORDER BY 1").fetchall()
+                for table in ("metadata", "provenance", "validation_errors", "runs")
+            }
+        finally:
+            conn.close()
+
+    directory = tempfile.mkdtemp(prefix="storage-check-")
+
+    try:
+        paths = {name: os.path.join(directory, f"{name}.db") for name in ("sqlite", "dbapi", "replay")}
+        for path in paths.values():
+            init_db(path)
+
+        sqlite_backend = SQLiteBackend(paths["sqlite"])
+        dbapi_backend = DBAPIBackend(sqlite3, (paths["dbapi"],), {"check_same_thread": False}, pool_size=2)
+        log_backend = SegmentLogBackend(os.path.join(directory, "log"), segment_bytes=4096)
+
+        for backend in (sqlite_backend, dbapi_backend, log_backend):
+            write_sample(backend, 0, 100)
+            backend.close()
+
+        # A crash in the middle of a write leaves an incomplete last line;
+        # it is skipped, and the next write starts a new segment
+        segments = log_backend.segments()
+        with open(segments[-1], "ab") as f:
+            f.write(b'{"type":"metadata","run_id":')
+        entries = sum(1 for _ in log_backend.iter_entries())
+
+        for backend in (sqlite_backend, dbapi_backend, log_backend):
+            write_sample(backend, 100, 10)
+            backend.close()
+
+        assert len(log_backend.segments()) == len(segments) + 1, "no new segment after a torn entry"
+        assert sum(1 for _ in log_backend.iter_entries()) > entries, "entries after the torn one are lost"
+
+        counts = log_backend.replay(SQLiteBackend(paths["replay"]), batch_size=32)
+        assert counts == {"metadata": 110, "provenance": 112, "runs": 2, "rejected": 0}, counts
+
+        expected = dump(paths["sqlite"])
+        for name in ("dbapi", "replay"):
+            for table, rows in dump(paths[name]).items():
+                assert rows == expected[table], f"{name}: {table} differs from SQLiteBackend"
+
+        print(f"SQLite, DB-API, and replayed segment log ({len(log_backend.segments())} segments) "
+              f"store identical rows: {counts}")
+
+    finally:
+        shutil.rmtree(directory)
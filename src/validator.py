@@ -2,43 +2,162 @@
 """
 XML validator for the XML measurement data pipeline.
 Validates XML files against an XSD schema with provenance logging
-for both successful and failed validation outcomes.
+for both successful and failed validation outcomes. Schemas come from
+the process-wide schema registry, so several validators share one
+compiled schema, and documents are routed to the schema of the version
+they declare. An optional pre-validation tier rejects structurally
+broken documents before they are parsed and asserted.
+
+Schema errors are capped per document, and their line, column, domain,
+and type are stored in the validation_errors table. In compact error
+mode, messages are not formatted at all.
 
 License: MIT
 """
 
 import os
+import time
+from itertools import islice
 from lxml import etree
+from prevalidation import PreValidator, resolve_rules
 from provenance import log_provenance
+from schema_registry import SchemaRegistry
+
+
+# Schema errors captured per document; all further errors are only counted
+MAX_ERRORS = 20
 
 
 class XMLValidator:
-    def __init__(self, schema_path="../schema/schema.xsd", schema_version="1.0", pipeline_version="0.9.1"):
+    def __init__(self, schema_path="../schema/schema.xsd", schema_version="1.0", pipeline_version="0.9.1",
+                 schemas=None, prevalidation=None, max_errors=MAX_ERRORS, format_errors=True,
+                 shared_schemas=True):
+        """
+        Args:
+            schema_path: XSD of the default schema version.
+            schema_version: Version of documents that declare none.
+            pipeline_version: Pipeline version recorded in provenance.
+            schemas: Optional dict mapping further schema versions to XSD
+                     paths; all of them are compiled up front.
+            prevalidation: Optional pre-validation rules, see
+                           prevalidation.resolve_rules; None disables it.
+            max_errors: Schema errors captured per document, or None for
+                        all of them.
+            format_errors: Format the message of every captured error. If
+                           False, only a summary with the error count and
+                           the position of the first error is logged.
+            shared_schemas: Use the compiled schemas of the process-wide
+                            registry cache. Validators running in
+                            different threads at the same time need
+                            their own (False).
+        """
         self.schema_path = schema_path
         self.schema_version = schema_version
         self.pipeline_version = pipeline_version
+        self.max_errors = max_errors
+        self.format_errors = format_errors
 
-        # Load XSD schema
-        with open(schema_path, "rb") as f:
-            schema_doc = etree.XML(f.read())
-            self.schema = etree.XMLSchema(schema_doc)
+        self.registry = SchemaRegistry(
+            {**(schemas or {}), schema_version: schema_path}, schema_version, shared=shared_schemas
+        )
+        self.registry.preload()
+        self.schema = self.registry.get()[0]
+
+        rules = resolve_rules(prevalidation)
+        self.prevalidator = PreValidator(rules) if rules is not None else None
 
     def validate(self, xml_path):
         """
-        Validate an XML file against the XSD schema.
+        Parse an XML file and validate it against the XSD schema.
 
         Returns:
             Dict with keys:
                 'valid': bool,
-                'errors': list of error messages
+                'errors': list of error messages,
+                'error_count': total number of schema errors (only for
+                               documents that failed the XSD assertion),
+                'document': parsed ElementTree for valid files, else None,
+                'stage_times': 'prevalidate' (if enabled), 'parse', and
+                               'schema_assert' durations in ms, as far
+                               as they ran
         """
 
         xml_filename = os.path.basename(xml_path)
-        xsd_filename = os.path.basename(self.schema_path)
 
+        rejected, stage_times = self._prevalidate(xml_path, xml_filename)
+        if rejected is not None:
+            return rejected
+
+        parse_start = time.perf_counter()
         try:
             xml_doc = etree.parse(xml_path)
-            self.schema.assertValid(xml_doc)
+        except Exception as e:
+            # General errors, such as missing files or malformed XML documents
+            return self._unexpected_error(xml_filename, e, stage_times=stage_times)
+        stage_times["parse"] = (time.perf_counter() - parse_start) * 1000
+
+        result = self.validate_document(xml_doc, xml_filename)
+        result["stage_times"].update(stage_times)
+        return result
+
+    def validate_bytes(self, xml_bytes, xml_filename):
+        """
+        Parse an in-memory XML document and validate it against the XSD schema.
+
+        Args:
+            xml_bytes: Serialized XML document.
+            xml_filename: Source name used for provenance logging.
+
+        Returns:
+            Dict with keys 'valid', 'errors', 'document' and 'stage_times'
+            (see validate).
+        """
+        rejected, stage_times = self._prevalidate(xml_bytes, xml_filename)
+        if rejected is not None:
+            return rejected
+
+        parse_start = time.perf_counter()
+        try:
+            xml_doc = etree.fromstring(xml_bytes).getroottree()
+        except Exception as e:
+            return self._unexpected_error(xml_filename, e, stage_times=stage_times)
+        stage_times["parse"] = (time.perf_counter() - parse_start) * 1000
+
+        result = self.validate_document(xml_doc, xml_filename)
+        result["stage_times"].update(stage_times)
+        return result
+
+    def validate_document(self, xml_doc, xml_filename):
+        """
+        Validate an already parsed XML document against the XSD schema
+        of the version it declares.
+
+        The parsed document is handed back in the result so that callers
+        can extract from the same tree instead of parsing the file again.
+
+        Args:
+            xml_doc: Parsed lxml ElementTree.
+            xml_filename: Source XML filename used for provenance logging.
+
+        Returns:
+            Dict with keys 'valid', 'errors', 'document' and 'stage_times'
+            (see validate); only 'schema_assert' is timed here.
+        """
+
+        assert_start = time.perf_counter()
+
+        try:
+            schema_version = self.registry.version_of(xml_doc)
+            try:
+                schema, schema_path = self.registry.get(schema_version)
+            except KeyError:
+                return self._unexpected_error(
+                    xml_filename, f"unsupported schema version {schema_version}", schema_version
+                )
+            xsd_filename = os.path.basename(schema_path)
+
+            schema.assertValid(xml_doc)
+            stage_times = {"schema_assert": (time.perf_counter() - assert_start) * 1000}
 
             # Provenance: success
             log_provenance(
@@ -48,19 +167,21 @@ class XMLValidator:
                 message="XML validated successfully",
                 xml_file=xml_filename,
                 xsd_schema=xsd_filename,
-                schema_version=self.schema_version,
+                schema_version=schema_version,
                 pipeline_version=self.pipeline_version
             )
 
             return {
                 "valid": True,
-                "errors": []
+                "errors": [],
+                "document": xml_doc,
+                "stage_times": stage_times
             }
 
         except etree.DocumentInvalid:
-            # Extract validation errors
-            error_log = self.schema.error_log
-            errors = [str(err) for err in error_log]
+            stage_times = {"schema_assert": (time.perf_counter() - assert_start) * 1000}
+
+            errors, details, total = self._capture_errors(schema.error_log)
 
             # Provenance: error
             log_provenance(
@@ -70,34 +191,112 @@ class XMLValidator:
                 message="; ".join(errors),
                 xml_file=xml_filename,
                 xsd_schema=xsd_filename,
-                schema_version=self.schema_version,
-                pipeline_version=self.pipeline_version
+                schema_version=schema_version,
+                pipeline_version=self.pipeline_version,
+                errors=details
             )
 
             return {
                 "valid": False,
-                "errors": errors
+                "errors": errors,
+                "error_count": total,
+                "document": None,
+                "stage_times": stage_times
             }
 
         except Exception as e:
-            # General errors, such as missing files or malformed XML documents
-            msg = f"Unexpected error: {str(e)}"
+            return self._unexpected_error(xml_filename, e)
 
-            log_provenance(
-                measurement_id=xml_filename,
-                step="validation",
-                status="error",
-                message=msg,
-                xml_file=xml_filename,
-                xsd_schema=xsd_filename,
-                schema_version=self.schema_version,
-                pipeline_version=self.pipeline_version
-            )
+    def _capture_errors(self, error_log):
+        """
+        Capture at most max_errors entries of a schema error log.
 
-            return {
-                "valid": False,
-                "errors": [msg]
-            }
+        Returns:
+            Tuple of (messages, details, total): the error messages for
+            the result and provenance, (line, column, domain, type,
+            message) tuples for the validation_errors table, and the
+            number of errors in the log.
+        """
+        total = len(error_log)
+        captured = list(islice(error_log, self.max_errors))
+
+        if not self.format_errors:
+            details = [(e.line, e.column, e.domain, e.type, None) for e in captured]
+
+            summary = f"{total} schema validation errors"
+            if captured:
+                summary += f", first at line {captured[0].line}, column {captured[0].column}"
+
+            return [summary], details, total
+
+        details = [(e.line, e.column, e.domain, e.type, e.message) for e in captured]
+        errors = [str(e) for e in captured]
+
+        if total > len(captured):
+            errors.append(f"{total - len(captured)} more errors ({total} in total)")
+
+        return errors, details, total
+
+    def _prevalidate(self, source, xml_filename):
+        """
+        Run pre-validation on a path or bytes.
+
+        Returns:
+            Tuple of (result, stage_times): the validation result of a
+            rejected document or None, and a dict with the 'prevalidate'
+            duration in ms (empty if pre-validation is disabled).
+        """
+        if self.prevalidator is None:
+            return None, {}
+
+        start = time.perf_counter()
+        errors = self.prevalidator.check(source)
+        stage_times = {"prevalidate": (time.perf_counter() - start) * 1000}
+
+        if not errors:
+            return None, stage_times
+
+        log_provenance(
+            measurement_id=xml_filename,
+            step="validation",
+            status="error",
+            message="; ".join(errors),
+            xml_file=xml_filename,
+            xsd_schema=os.path.basename(self.schema_path),
+            schema_version=self.schema_version,
+            pipeline_version=self.pipeline_version
+        )
+
+        return {
+            "valid": False,
+            "errors": errors,
+            "document": None,
+            "stage_times": stage_times
+        }, stage_times
+
+    def _unexpected_error(self, xml_filename, error, schema_version=None, stage_times=None):
+        """Log and report a parse or I/O failure as a validation error."""
+        msg = f"Unexpected error: {str(error)}"
+        schema_version = schema_version or self.schema_version
+        schema_path = self.registry.paths.get(schema_version, self.schema_path)
+
+        log_provenance(
+            measurement_id=xml_filename,
+            step="validation",
+            status="error",
+            message=msg,
+            xml_file=xml_filename,
+            xsd_schema=os.path.basename(schema_path),
+            schema_version=schema_version,
+            pipeline_version=self.pipeline_version
+        )
+
+        return {
+            "valid": False,
+            "errors": [msg],
+            "document": None,
+            "stage_times": stage_times or {}
+        }
 
 
 if __name__ == "__main__":
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Per-file processing stages and process-pool workers for the XML
+measurement data pipeline.
+
+validate_and_extract() runs the CPU-bound part of the pipeline for one
+file. It is shared by the sequential loop in Pipeline.run and by the
+process-pool workers used with Pipeline(workers=N). Workers never touch
+the database: their provenance records are captured in memory and
+returned to the parent process, which is the single writer.
+
+License: MIT
+"""
+
+import os
+import time
+from validator import MAX_ERRORS, XMLValidator
+from extractor import MetadataExtractor
+from memory import MemoryTracker
+from provenance import ProvenanceRecorder, install_provenance_logger
+
+
+# Per-process state, created once by init_worker()
+_validator = None
+_extractor = None
+_recorder = None
+_memory = None
+
+
+def validate_and_extract(validator, extractor, xml_path, xml_bytes=None, memory=None, xml_file=None):
+    """
+    Parse, validate, and extract metadata from one XML file.
+
+    Args:
+        validator: XMLValidator instance, or None to skip validation and
+                   use the streaming metadata extraction instead.
+        extractor: MetadataExtractor instance.
+        xml_path: Path of the XML file, or its source name if xml_bytes
+                  is given.
+        xml_bytes: Optional file content that was already read; the file
+                   is then not opened again.
+        memory: Optional memory.MemoryTracker in a per-file mode; the file
+                is then accounted from parsing to extraction.
+        xml_file: Source name recorded in provenance; defaults to the
+                  basename of xml_path.
+
+    Returns:
+        Dict with keys:
+            'xml_path': the processed path,
+            'xml_file': the source name recorded in provenance,
+            'data': extracted metadata dict, or None if the file failed,
+            'metrics': stage timings in ms; 'processing_time_ms' covers
+                       validation and extraction only,
+            'stages': latencies in ms for profiler.StageProfiler, keyed by
+                      'prevalidate', 'parse', 'schema_assert', and
+                      'extraction' (as far as they ran); without
+                      validation, parsing counts towards extraction,
+            'memory': MemoryTracker.end_file() result, or None without
+                      a tracker
+    """
+    pipeline_start = time.perf_counter()
+    metrics = {}
+
+    if xml_file is None:
+        xml_file = os.path.basename(xml_path)
+
+    if memory is not None:
+        memory.begin_file()
+
+    if validator is None:
+        # Validation disabled or done upstream: read only the metadata
+        # section, unless the data section is stored as well
+        ext_start = time.perf_counter()
+        if extractor.store_values:
+            if xml_bytes is None:
+                meta = extractor.extract_metadata(xml_path)
+            else:
+                meta = extractor.extract_metadata_bytes(xml_bytes, xml_file)
+        else:
+            meta = extractor.extract_metadata_streaming(
+                xml_path if xml_bytes is None else xml_bytes, xml_file
+            )
+        metrics['validation_time_ms'] = None
+        metrics['extraction_time_ms'] = (time.perf_counter() - ext_start) * 1000
+        metrics['processing_time_ms'] = (time.perf_counter() - pipeline_start) * 1000
+
+        if memory is not None:
+            memory.end_stage("extraction")
+
+        return {
+            "xml_path": xml_path,
+            "xml_file": xml_file,
+            "data": meta["data"] if meta["success"] else None,
+            "metrics": metrics,
+            "stages": {"extraction": metrics['extraction_time_ms']},
+            "memory": memory.end_file() if memory is not None else None
+        }
+
+    # 1. Parse and validate with internal provenance logging
+    val_start = time.perf_counter()
+    if xml_bytes is None:
+        validation_result = validator.validate(xml_path)
+    else:
+        validation_result = validator.validate_bytes(xml_bytes, xml_file)
+    metrics['validation_time_ms'] = (time.perf_counter() - val_start) * 1000
+
+    stages = validation_result["stage_times"]
+    data = None
+
+    if memory is not None:
+        memory.end_stage("validation")
+
+    if validation_result["valid"]:
+        # 2. Metadata extraction from the validated tree (no second parse)
+        ext_start = time.perf_counter()
+        meta = extractor.extract_from_document(
+            validation_result["document"], xml_file
+        )
+        metrics['extraction_time_ms'] = (time.perf_counter() - ext_start) * 1000
+        stages["extraction"] = metrics['extraction_time_ms']
+
+        if memory is not None:
+            memory.end_stage("extraction")
+
+        if meta["success"]:
+            data = meta["data"]
+
+    metrics['processing_time_ms'] = (time.perf_counter() - pipeline_start) * 1000
+
+    return {
+        "xml_path": xml_path,
+        "xml_file": xml_file,
+        "data": data,
+        "metrics": metrics,
+        "stages": stages,
+        "memory": memory.end_file() if memory is not None else None
+    }
+
+
+def init_worker(schema_path, schema_version, pipeline_version, db_path,
+                validate=True, store_values=False, memory_mode="off", schemas=None,
+                prevalidation=None, max_errors=MAX_ERRORS, format_errors=True):
+    """
+    Process-pool initializer.
+
+    Compiles all schema versions once per worker process (unless
+    validation is disabled; forked workers reuse the schemas compiled by
+    the parent) and replaces the shared provenance logger with an
+    in-memory recorder. In a per-file memory mode, each worker accounts
+    its files with its own tracker.
+    """
+    global _validator, _extractor, _recorder, _memory
+
+    _recorder = ProvenanceRecorder()
+    install_provenance_logger(_recorder)
+
+    _validator = None
+    if validate:
+        _validator = XMLValidator(
+            schema_path=schema_path,
+            schema_version=schema_version,
+            pipeline_version=pipeline_version,
+            schemas=schemas,
+            prevalidation=prevalidation,
+            max_errors=max_errors,
+            format_errors=format_errors
+        )
+
+    _extractor = MetadataExtractor(
+        db_path=db_path,
+        pipeline_version=pipeline_version,
+        store_values=store_values
+    )
+
+    _memory = None
+    if memory_mode in ("rusage", "tracemalloc"):
+        _memory = MemoryTracker(memory_mode)
+        _memory.start()
+
+
+def process_file(xml_path):
+    """
+    Worker entry point: validate and extract one file.
+
+    Returns:
+        The validate_and_extract() result with an additional 'provenance'
+        key holding the records captured while processing the file.
+    """
+    outcome = validate_and_extract(_validator, _extractor, xml_path, memory=_memory)
+    outcome["provenance"] = _recorder.drain()
+    return outcome
+
+
+def process_files(xml_paths):
+    """
+    Worker entry point for a chunk of files.
+
+    Returns:
+        List of process_file() results in the order of xml_paths.
+    """
+    return [process_file(xml_path) for xml_path in xml_paths]
+
+
+def process_bytes(xml_path, xml_bytes, xml_file=None):
+    """
+    Worker entry point for a file whose content was read by the parent.
+
+    Returns:
+        Same as process_file().
+    """
+    outcome = validate_and_extract(_validator, _extractor, xml_path, xml_bytes, _memory, xml_file)
+    outcome["provenance"] = _recorder.drain()
+    return outcome
+
+
+def process_documents(documents):
+    """
+    Worker entry point for a chunk of in-memory documents.
+
+    Args:
+        documents: List of (name, xml_bytes) pairs.
+
+    Returns:
+        List of process_bytes() results in the order of documents.
+    """
+    return [process_bytes(name, xml_bytes, name) for name, xml_bytes in documents]
@@ -3,12 +3,32 @@
 XML test data generator for the XML measurement data pipeline.
 Generates valid XML files conforming to the XSD schema for performance evaluation.
 
+Workload profiles describe a mix closer to production data: the
+distribution of sensor readings per document (and thereby the document
+size), the fraction of invalid documents per failure kind, and the
+fraction of duplicate measurement IDs. Generation is reproducible for a
+given seed regardless of the number of worker processes, and can write
+loose files, a single tar or zip archive, or a length-prefixed stream.
+
 License: MIT
 """
 
+import argparse
+import csv
+import io
+import math
 import os
-from datetime import datetime, timedelta
 import random
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+from collections import deque
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+
+from sources import STREAM_SUFFIX, StreamWriter
 
 OUTPUT_DIR = "../xml_pool/"
 
@@ -17,85 +37,452 @@ OPERATORS = ["Alice", "Bob", "Charlie", "Diana", "Eve"]
 PARAMETERS = ["Temperature", "Pressure", "Humidity", "Voltage", "Current"]
 PUMPEN = ["Pumpe_1", "Pumpe_2", "Pumpe_3", "Pumpe_Alpha", "Pumpe_Beta"]
 
+BASE_TIME = datetime(2024, 1, 1, 10, 0, 0)
 
-def generate_xml(measurement_id, geraet, operator, parameter, timestamp):
-    """Generate a valid XML file conforming to the XSD schema."""
+# Failure kinds modelled on the examples in xml/invalid_*.xml, plus
+# documents that are not well-formed at all
+FAILURE_KINDS = ("constraints", "missing_metadata", "structure", "malformed")
 
-    # Random measurement values
-    druck = round(random.uniform(1.0, 10.0), 2)
-    temperatur = round(random.uniform(-50.0, 150.0), 2)
-    frequenz = round(random.uniform(50.0, 60.0), 2)
-    pumpe = random.choice(PUMPEN)
-
-    # Random number of sensors (2-5)
-    num_sensors = random.randint(2, 5)
-    sensoren_xml = ""
-    for i in range(num_sensors):
-        sensor_id = f"S{i+1:03d}"
-        sensor_wert = round(random.uniform(0.0, 100.0), 2)
-        sensoren_xml += f"""                        <sensor>
-                            <id>{sensor_id}</id>
-                            <wert>{sensor_wert}</wert>
+# sensors: ("fixed", n), ("uniform", low, high), or
+#          ("lognormal", median, sigma, maximum)
+# invalid: fraction of documents per failure kind
+# duplicate_fraction: fraction of documents reusing an earlier measurement ID
+WORKLOAD_PROFILES = {
+    # The original experiment pool: small, always valid, unique IDs
+    "default": {
+        "sensors": ("uniform", 2, 5),
+        "invalid": {},
+        "duplicate_fraction": 0.0
+    },
+    # Mostly small documents with a long tail of large ones, some invalid
+    # files, and occasional re-deliveries of the same measurement
+    "production": {
+        "sensors": ("lognormal", 50, 1.5, 50000),
+        "invalid": {
+            "constraints": 0.02,
+            "missing_metadata": 0.01,
+            "structure": 0.01,
+            "malformed": 0.005
+        },
+        "duplicate_fraction": 0.01
+    },
+    # Large, valid documents for memory and streaming experiments
+    "large": {
+        "sensors": ("uniform", 10000, 50000),
+        "invalid": {},
+        "duplicate_fraction": 0.0
+    }
+}
+
+# Files per task handed to a generator process
+CHUNK_SIZE = 500
+
+# Chunks per generator process that may be generated ahead of the writer
+CHUNKS_IN_FLIGHT = 2
+
+MANIFEST_FIELDS = ["filename", "measurement_id", "kind", "duplicate_of", "sensors", "size_bytes"]
+
+SENSOR_XML = """                        <sensor>
+                            <id>S{:03d}</id>
+                            <wert>{}</wert>
                         </sensor>
 """
 
-    xml_content = f"""<?xml version="1.0" encoding="UTF-8"?>
+
+def render_document(rng, measurement_id, timestamp, num_sensors, kind="valid",
+                    geraet=None, operator=None, parameter=None):
+    """
+    Render one measurement document.
+
+    Args:
+        rng: random.Random instance (or the random module) for all values.
+        measurement_id: Measurement identifier.
+        timestamp: ISO timestamp string.
+        num_sensors: Number of sensor readings.
+        kind: 'valid' or one of FAILURE_KINDS.
+        geraet, operator, parameter: Metadata values; chosen at random
+                                     if None.
+
+    Returns:
+        The document as str.
+    """
+    geraet = geraet or rng.choice(GERAETE)
+    operator = operator or rng.choice(OPERATORS)
+    parameter = parameter or rng.choice(PARAMETERS)
+
+    # Random measurement values
+    druck = round(rng.uniform(1.0, 10.0), 2)
+    temperatur = round(rng.uniform(-50.0, 150.0), 2)
+    frequenz = round(rng.uniform(50.0, 60.0), 2)
+    pumpe = rng.choice(PUMPEN)
+
+    if kind == "constraints":
+        # Values below the schema's lower bounds
+        druck = -druck
+        temperatur = -300.0
+
+    parts = [f"""<?xml version="1.0" encoding="UTF-8"?>
 <measurement>
     <metadata>
         <measurement_id>{measurement_id}</measurement_id>
         <timestamp>{timestamp}</timestamp>
         <operator>{operator}</operator>
-        <geraet>{geraet}</geraet>
-        <parameter>{parameter}</parameter>
+"""]
+
+    if kind != "missing_metadata":
+        parts.append(f"        <geraet>{geraet}</geraet>\n")
+
+    parts.append(f"""        <parameter>{parameter}</parameter>
     </metadata>
     <data>
         <druck>{druck}</druck>
         <temperatur>{temperatur}</temperatur>
         <frequenz>{frequenz}</frequenz>
         <pumpe>{pumpe}</pumpe>
-        <sensoren>
-{sensoren_xml}        </sensoren>
-    </data>
-</measurement>"""
+""")
+
+    if kind != "structure":
+        parts.append("        <sensoren>\n")
+        parts.extend(
+            SENSOR_XML.format(i + 1, round(rng.uniform(0.0, 100.0), 2))
+            for i in range(num_sensors)
+        )
+        parts.append("        </sensoren>\n")
+
+    parts.append("""    </data>
+</measurement>""")
+
+    xml_content = "".join(parts)
+
+    if kind == "malformed":
+        # Cut the document off inside the data section
+        data_start = xml_content.index("<data>") + len("<data>")
+        xml_content = xml_content[:rng.randint(data_start, len(xml_content) - 20)]
 
     return xml_content
 
 
-def generate_dataset(num_files=1000):
+def generate_xml(measurement_id, geraet, operator, parameter, timestamp, num_sensors=None):
     """
-    Generate a dataset of distinct valid XML files.
+    Generate a valid XML file conforming to the XSD schema.
 
     Args:
-        num_files: Number of XML files to generate.
+        num_sensors: Number of sensors; None picks 2 to 5 at random.
     """
+    # Random number of sensors (2-5) unless a document size is requested
+    if num_sensors is None:
+        num_sensors = random.randint(2, 5)
 
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    return render_document(
+        random, measurement_id, timestamp, num_sensors,
+        geraet=geraet, operator=operator, parameter=parameter
+    )
 
-    print(f"Generating {num_files} XSD-conformant XML files...")
 
-    base_time = datetime(2024, 1, 1, 10, 0, 0)
+def resolve_workload(profile="default"):
+    """
+    Return a validated workload profile.
+
+    Args:
+        profile: Name from WORKLOAD_PROFILES, or a dict overriding keys of
+                 the default profile.
+    """
+    if isinstance(profile, dict):
+        workload = dict(WORKLOAD_PROFILES["default"])
+        workload.update(profile)
+    elif profile in WORKLOAD_PROFILES:
+        workload = dict(WORKLOAD_PROFILES[profile])
+    else:
+        raise ValueError(f"Unknown workload profile: {profile}")
+
+    unknown = set(workload["invalid"]) - set(FAILURE_KINDS)
+    if unknown:
+        raise ValueError(f"Unknown failure kinds: {', '.join(sorted(unknown))}")
+
+    if not 0 <= sum(workload["invalid"].values()) <= 1:
+        raise ValueError("Invalid fractions must sum to at most 1")
+    if not 0 <= workload["duplicate_fraction"] <= 1:
+        raise ValueError("duplicate_fraction must be between 0 and 1")
+
+    _sensor_count(random.Random(0), workload["sensors"])
+
+    return workload
+
+
+def _sensor_count(rng, spec):
+    """Draw a sensor count from a distribution spec (see WORKLOAD_PROFILES)."""
+    kind = spec[0]
+
+    if kind == "fixed":
+        return max(1, int(spec[1]))
+    if kind == "uniform":
+        return rng.randint(max(1, int(spec[1])), int(spec[2]))
+    if kind == "lognormal":
+        median, sigma, maximum = spec[1:]
+        return max(1, min(int(maximum), int(rng.lognormvariate(math.log(median), sigma))))
 
-    for i in range(num_files):
-        measurement_id = f"M{i+1:06d}"
-        geraet = random.choice(GERAETE)
-        operator = random.choice(OPERATORS)
-        parameter = random.choice(PARAMETERS)
-        timestamp = (base_time + timedelta(minutes=i)).isoformat()
+    raise ValueError(f"Unknown sensor distribution: {kind}")
 
-        xml_content = generate_xml(measurement_id, geraet, operator, parameter, timestamp)
 
-        filename = f"measurement_{i+1:06d}.xml"
-        filepath = os.path.join(OUTPUT_DIR, filename)
+def workload_document(index, workload, seed):
+    """
+    Generate document number index of a workload.
+
+    Every document has its own RNG derived from seed and index, so the
+    output does not depend on how the work is split between processes.
+
+    Returns:
+        Tuple of (filename, content as bytes, manifest row dict).
+    """
+    rng = random.Random(f"{seed}:{index}")
+
+    measurement_id = f"M{index + 1:06d}"
+    duplicate_of = None
+
+    if index > 0 and rng.random() < workload["duplicate_fraction"]:
+        earlier = rng.randrange(index)
+        measurement_id = f"M{earlier + 1:06d}"
+        duplicate_of = f"measurement_{earlier + 1:06d}.xml"
+
+    kind = "valid"
+    draw = rng.random()
+    threshold = 0.0
+    for failure in FAILURE_KINDS:
+        threshold += workload["invalid"].get(failure, 0.0)
+        if draw < threshold:
+            kind = failure
+            break
 
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(xml_content)
+    num_sensors = _sensor_count(rng, workload["sensors"])
+    timestamp = (BASE_TIME + timedelta(minutes=index)).isoformat()
 
-        if (i + 1) % 100 == 0:
-            print(f"  {i + 1}/{num_files} created...")
+    content = render_document(rng, measurement_id, timestamp, num_sensors, kind).encode("utf-8")
+    filename = f"measurement_{index + 1:06d}.xml"
+
+    return filename, content, {
+        "filename": filename,
+        "measurement_id": measurement_id,
+        "kind": kind,
+        "duplicate_of": duplicate_of or "",
+        "sensors": num_sensors,
+        "size_bytes": len(content)
+    }
+
+
+def _generate_chunk(task):
+    """
+    Generate a range of documents into output_dir.
+
+    Returns:
+        The manifest rows of the documents.
+    """
+    start, stop, workload, seed, output_dir = task
+    rows = []
 
-    print(f"\n✓ {num_files} XSD-conformant XML files created in: {OUTPUT_DIR}")
+    for index in range(start, stop):
+        filename, content, row = workload_document(index, workload, seed)
+        rows.append(row)
+
+        with open(os.path.join(output_dir, filename), "wb") as f:
+            f.write(content)
+
+    return rows
+
+
+def _imap_bounded(pool, func, tasks, in_flight):
+    """
+    Like pool.imap, but with at most in_flight tasks submitted ahead of
+    the consumer, so that a slow consumer does not pile up results.
+    """
+    pending = deque()
+
+    for task in tasks:
+        pending.append(pool.apply_async(func, (task,)))
+        if len(pending) >= in_flight:
+            yield pending.popleft().get()
+
+    while pending:
+        yield pending.popleft().get()
+
+
+def _open_archive(path):
+    """Open a tar (optionally gzip-compressed), zip, or stream archive for writing."""
+    if path.endswith(STREAM_SUFFIX):
+        archive = StreamWriter(path)
+        add = archive.add
+
+    elif path.endswith(".zip"):
+        archive = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED)
+
+        def add(name, content):
+            archive.writestr(name, content)
+
+    elif path.endswith((".tar", ".tar.gz", ".tgz")):
+        archive = tarfile.open(path, "w:gz" if path.endswith((".gz", ".tgz")) else "w")
+        mtime = time.time()
+
+        def add(name, content):
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            info.mtime = mtime
+            archive.addfile(info, io.BytesIO(content))
+
+    else:
+        raise ValueError(f"Unsupported archive type: {path}")
+
+    return archive, add
+
+
+def generate_workload(num_files, output_dir=OUTPUT_DIR, profile="default", seed=None,
+                      workers=1, archive=None, manifest=True):
+    """
+    Generate a synthetic workload.
+
+    Args:
+        num_files: Number of documents.
+        output_dir: Directory for loose files (ignored with archive).
+        profile: Workload profile name or dict, see resolve_workload.
+        seed: Seed for reproducible output; None picks a random seed.
+        workers: Number of generator processes.
+        archive: Optional .tar, .tar.gz, .tgz, .zip, or .xmls (stream,
+                 see sources.iter_stream) path; all documents are then
+                 packed into this archive instead of loose files.
+        manifest: Write a CSV listing kind, duplicate, and size of every
+                  document next to the output (manifest.csv in output_dir,
+                  or <archive>.manifest.csv).
+
+    Returns:
+        Dict with the seed, the number of files, valid files, invalid files
+        per failure kind, duplicates, and the total size in bytes.
+    """
+    workload = resolve_workload(profile)
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+
+    if archive is None:
+        os.makedirs(output_dir, exist_ok=True)
+        add = None
+        chunk_dir = output_dir
+        manifest_path = os.path.join(output_dir, "manifest.csv")
+    else:
+        os.makedirs(os.path.dirname(archive) or ".", exist_ok=True)
+        packed, add = _open_archive(archive)
+        manifest_path = archive + ".manifest.csv"
+
+        # Chunks are generated into a scratch directory and packed one
+        # file at a time, so documents are never held in memory per chunk
+        chunk_dir = tempfile.mkdtemp(prefix=".generate-", dir=os.path.dirname(archive) or ".")
+
+    tasks = (
+        (start, min(start + CHUNK_SIZE, num_files), workload, seed, chunk_dir)
+        for start in range(0, num_files, CHUNK_SIZE)
+    )
+
+    summary = {
+        "seed": seed,
+        "files": 0,
+        "valid": 0,
+        "invalid": {kind: 0 for kind in FAILURE_KINDS},
+        "duplicates": 0,
+        "bytes": 0
+    }
+
+    pool = Pool(workers) if workers > 1 else None
+    manifest_file = open(manifest_path, "w", encoding="utf-8", newline="") if manifest else None
+
+    try:
+        writer = None
+        if manifest_file is not None:
+            writer = csv.DictWriter(manifest_file, fieldnames=MANIFEST_FIELDS)
+            writer.writeheader()
+
+        # Chunks arrive in order, so archives and manifests are deterministic
+        if pool is not None:
+            results = _imap_bounded(pool, _generate_chunk, tasks, workers * CHUNKS_IN_FLIGHT)
+        else:
+            results = map(_generate_chunk, tasks)
+
+        for rows in results:
+            if add is not None:
+                for row in rows:
+                    path = os.path.join(chunk_dir, row["filename"])
+                    with open(path, "rb") as f:
+                        add(row["filename"], f.read())
+                    os.remove(path)
+
+            for row in rows:
+                summary["files"] += 1
+                summary["bytes"] += row["size_bytes"]
+                if row["kind"] == "valid":
+                    summary["valid"] += 1
+                else:
+                    summary["invalid"][row["kind"]] += 1
+                if row["duplicate_of"]:
+                    summary["duplicates"] += 1
+
+            if writer is not None:
+                writer.writerows(rows)
+
+            print(f"  {summary['files']}/{num_files} created...")
+
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if manifest_file is not None:
+            manifest_file.close()
+        if archive is not None:
+            packed.close()
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+
+    return summary
+
+
+def generate_dataset(num_files=1000, output_dir=OUTPUT_DIR, num_sensors=None):
+    """
+    Generate a dataset of distinct valid XML files.
+
+    Args:
+        num_files: Number of XML files to generate.
+        output_dir: Target directory.
+        num_sensors: Sensor readings per file; None picks 2 to 5 at random.
+    """
+
+    print(f"Generating {num_files} XSD-conformant XML files...")
+
+    profile = "default" if num_sensors is None else {"sensors": ("fixed", num_sensors)}
+    generate_workload(num_files, output_dir, profile, manifest=False)
+
+    print(f"\n✓ {num_files} XSD-conformant XML files created in: {output_dir}")
 
 
 if __name__ == "__main__":
-    # Generate 1000 distinct XML files
-    generate_dataset(1000)
+    parser = argparse.ArgumentParser(description="Generate synthetic XML measurement documents.")
+    parser.add_argument("--count", type=int, default=1000, help="number of documents")
+    parser.add_argument("--profile", default="default", choices=sorted(WORKLOAD_PROFILES),
+                        help="workload profile")
+    parser.add_argument("--seed", type=int, help="RNG seed for reproducible output")
+    parser.add_argument("--workers", type=int, default=1, help="generator processes")
+    parser.add_argument("--output", default=OUTPUT_DIR, help="output directory for loose files")
+    parser.add_argument("--archive", help="write a single .tar, .tar.gz, .tgz, .zip, or .xmls archive instead")
+    parser.add_argument("--no-manifest", action="store_true", help="do not write manifest.csv")
+    args = parser.parse_args()
+
+    print(f"Generating {args.count} XML files (profile: {args.profile})...")
+
+    summary = generate_workload(
+        args.count,
+        output_dir=args.output,
+        profile=args.profile,
+        seed=args.seed,
+        workers=args.workers,
+        archive=args.archive,
+        manifest=not args.no_manifest
+    )
+
+    invalid = sum(summary["invalid"].values())
+    print(
+        f"\n✓ {summary['files']} XML files created in: {args.archive or args.output} "
+        f"({summary['valid']} valid, {invalid} invalid, {summary['duplicates']} duplicate IDs, "
+        f"{summary['bytes'] / (1024 * 1024):.1f} MB, seed {summary['seed']})"
+    )